@@ -0,0 +1,10 @@
+#!/bin/bash
+set -euo pipefail
+
+ROOT="$(dirname "$(dirname "$0")")"
+
+cd "$ROOT"
+
+git submodule update --init
+
+python3 -m tests.benchmark_e2e "$@"
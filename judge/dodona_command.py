@@ -2,7 +2,8 @@
 
 import json
 import sys
-from enum import StrEnum
+from collections.abc import Callable
+from enum import IntEnum, StrEnum, auto
 from types import SimpleNamespace, TracebackType
 from typing import Any
 
@@ -85,6 +86,257 @@ class AnnotationSeverity(StrEnum):
         return self
 
 
+class OutputFormat(StrEnum):
+    """JSON encoding of the Dodona commands."""
+
+    PRETTY = "pretty"
+    COMPACT = "compact"
+
+    def __str__(self) -> str:
+        """Convert enum to string.
+
+        Returns:
+            string representation of enum
+        """
+        return self
+
+
+class OutputBudget:
+    """Keeps the total size of the Dodona commands below a byte limit by degrading the feedback gracefully.
+
+    The feedback degrades step by step (see 'Level') and never returns to an earlier level:
+    the commands are written in full until half of the limit is used. After that, the
+    'expected' and 'generated' texts of tests (eg. the csv output of a query) are truncated.
+    Both texts of a test are truncated alike, so they can still be compared: this is decided
+    when the test is started, and space for an equally long generated text is reserved until
+    the test is closed.
+    Once three quarters of the limit are used, messages and annotations that are identical to
+    an earlier one are left out. When a command no longer fits, only the structure of the
+    feedback (start/close commands, statuses and escalations) is written, without any
+    messages or texts. Enough space is reserved to always close all open 'with' blocks, but the
+    structure itself is never left out, so a very small limit can still be exceeded.
+
+    The number of left out messages is reported in a summary message when a Tab or the
+    Judgement is closed.
+    """
+
+    class Level(IntEnum):
+        """How far the feedback is degraded."""
+
+        FULL = auto()
+        TRUNCATE = auto()
+        COLLAPSE = auto()
+        STRUCTURE_ONLY = auto()
+
+    # Space that is reserved for the close command of every open 'with' block.
+    CLOSE_RESERVE = 200
+    # Space that is reserved for the summary message.
+    SUMMARY_RESERVE = 1000
+
+    def __init__(self, limit: int, summarize: Callable[[int], str] | None = None) -> None:
+        """Create OutputBudget.
+
+        Args:
+            limit: max number of bytes of all commands together
+            summarize: creates the summary message description for the number of left out messages
+        """
+        self.limit = limit
+        self.summarize = summarize or (lambda omitted: f"{omitted} message(s) were left out.")
+        self.field_length = max(limit // 100, 100)
+        self.level = OutputBudget.Level.FULL
+        self.omitted = 0
+        # hashes of the messages that were written, used to detect identical messages
+        self.written_messages: set[int] = set()
+        # length the texts of the current test are truncated to (None if they are written in full), and
+        # the space that is reserved for its generated text
+        self.test_length: int | None = None
+        self.test_reserve = 0
+
+    def fit(self, command: dict, output: "DodonaOutput") -> list[str]:
+        """Encode a command, and the summary message that should precede it, within the budget.
+
+        Args:
+            command: the command
+            output: the output sink the commands are written to
+
+        Returns:
+            the encoded commands that should be written (possibly none)
+        """
+        encoded: list[str] = []
+        name = command["command"]
+
+        if name in {"close-tab", "close-judgement"} and self.omitted > 0:
+            summary = {
+                "command": "append-message",
+                "message": {"description": self.summarize(self.omitted), "format": MessageFormat.CALLOUT_WARNING},
+            }
+            self.omitted = 0
+            encoded.append(output.encode(summary))
+
+        used = output.size + sum(len(e) for e in encoded)
+        available = self.limit - used - output.depth * self.CLOSE_RESERVE - self.SUMMARY_RESERVE
+        if name != "close-test":
+            available -= self.test_reserve
+        if used >= self.limit * 3 // 4:
+            self.level = max(self.level, OutputBudget.Level.COLLAPSE)
+        elif used >= self.limit // 2:
+            self.level = max(self.level, OutputBudget.Level.TRUNCATE)
+
+        if name in {"append-message", "annotate-code"}:
+            text = output.encode(command)
+            key = hash(text)
+            if len(text) > available:
+                self.level = OutputBudget.Level.STRUCTURE_ONLY
+            if self.level == OutputBudget.Level.STRUCTURE_ONLY or (
+                self.level == OutputBudget.Level.COLLAPSE and key in self.written_messages
+            ):
+                self.omitted += 1
+                return encoded
+            self.written_messages.add(key)
+            return [*encoded, text]
+
+        return [*encoded, self._fit_structure(command, output, available)]
+
+    def _fit_structure(self, command: dict, output: "DodonaOutput", available: int) -> str:
+        # structural commands are always written, only their texts are shortened
+        name = command["command"]
+
+        def fits(text: str) -> bool:
+            # a start-test command leaves room for a close-test command with an equally long text
+            if name == "start-test":
+                return 2 * len(text) + self.CLOSE_RESERVE <= available
+            return len(text) <= available
+
+        text = output.encode(command)
+        if name == "close-test":
+            length = self.test_length
+        elif self.level >= OutputBudget.Level.TRUNCATE or not fits(text):
+            length = self.field_length
+        else:
+            length = None
+        if length is not None:
+            text = output.encode(self.truncate(command, length))
+        if not fits(text) or (self.level == OutputBudget.Level.STRUCTURE_ONLY and name != "close-test"):
+            self.level = OutputBudget.Level.STRUCTURE_ONLY
+            length = 0
+            text = output.encode(self.truncate(command, 0))
+
+        if name == "start-test":
+            self.test_length, self.test_reserve = length, len(text)
+        elif name == "close-test":
+            self.test_reserve = 0
+        return text
+
+    @staticmethod
+    def truncate(command: dict, length: int) -> dict:
+        """Truncate the 'expected', 'generated' and (textual) 'description' fields of a command.
+
+        Texts are cut off after the last complete line that fits (or after 'length' characters if
+        the first line doesn't fit), followed by a line with '\u2026'. A length of 0 empties the fields.
+
+        Args:
+            command: the command
+            length: max number of characters per field
+
+        Returns:
+            a copy of the command with truncated fields
+        """
+        truncated = dict(command)
+        for field in ("expected", "generated", "description"):
+            text = truncated.get(field)
+            if isinstance(text, str) and len(text) > length:
+                cut = text.rfind("\n", 0, length)
+                truncated[field] = f"{text[: cut if cut > 0 else length]}\n\u2026" if length > 0 else ""
+        return truncated
+
+
+class DodonaOutput:
+    """Output sink that encodes Dodona commands as JSON and writes them to stdout.
+
+    The 'pretty' format writes every command indented over multiple lines, the 'compact' format
+    writes every command on a single line without any whitespace. Both formats write the
+    same sequence of commands.
+
+    By default, every command is written immediately. If 'flush_at' is set, the commands are
+    buffered and only written (at once) when a 'with' block of that type (eg. Context or Tab)
+    is closed. The buffer is always written when the Judgement is closed, so no output is lost
+    if an unexpected exception occurs; but output that is still buffered when the judge is
+    killed (eg. time limit exceeded) is lost.
+
+    If a 'budget' is set, the commands are fitted within its byte limit before they are written.
+    """
+
+    def __init__(self, output_format: OutputFormat = OutputFormat.PRETTY, flush_at: type | None = None) -> None:
+        """Create DodonaOutput.
+
+        Args:
+            output_format: JSON encoding of the commands
+            flush_at: the type of the 'with' block at which the buffered commands are written,
+                      if None, the commands are not buffered
+        """
+        self.output_format = output_format
+        self.flush_at = flush_at
+        self.buffer: list[str] = []
+        self.budget: OutputBudget | None = None
+        # if not None, every command is also kept here (JSON encoded, before it's fitted within the budget)
+        self.recording: list[str] | None = None
+        # total number of bytes of all commands and number of open 'with' blocks
+        self.size = 0
+        self.depth = 0
+
+    def encode(self, command: dict) -> str:
+        """Encode a command as JSON.
+
+        Args:
+            command: the command
+
+        Returns:
+            JSON encoded command, including a trailing newline
+        """
+        if self.output_format == OutputFormat.COMPACT:
+            return json.dumps(command, separators=(",", ":"), sort_keys=True) + "\n"
+        return json.dumps(command, indent=1, sort_keys=True) + "\n"  # Next JSON fragment should be on new line
+
+    def write(self, command: dict) -> None:
+        """Write (or buffer) a command.
+
+        Args:
+            command: the command
+        """
+        if self.recording is not None:
+            self.recording.append(json.dumps(command, sort_keys=True))
+
+        encoded = [self.encode(command)] if self.budget is None else self.budget.fit(command, self)
+        for text in encoded:
+            self.size += len(text)  # JSON is encoded as ASCII, so one character is one byte
+            self.buffer.append(text)
+
+        if command["command"].startswith("start-"):
+            self.depth += 1
+        elif command["command"].startswith("close-"):
+            self.depth -= 1
+
+        if self.flush_at is None:
+            self.flush()
+
+    def closed(self, block: "DodonaCommand") -> None:
+        """Write the buffered commands if the closed 'with' block is a flush point.
+
+        Args:
+            block: the 'with' block that was just closed
+        """
+        if isinstance(block, Judgement) or (self.flush_at is not None and isinstance(block, self.flush_at)):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered commands to stdout."""
+        if len(self.buffer) == 0:
+            return
+        # sys.stdout is looked up on every write, so it can be replaced (eg. while testing)
+        sys.stdout.write("".join(self.buffer))
+        self.buffer.clear()
+
+
 class DodonaException(Exception):
     """Exception that will automatically create a message and set the correct status when thrown.
 
@@ -154,8 +406,13 @@ class DodonaCommand:
         "command": "close-tab",
         "badgeCount": 43
     }
+
+    All commands are written to the shared 'DodonaCommand.output' sink, which determines
+    their JSON format and when they are flushed to stdout.
     """
 
+    output = DodonaOutput()
+
     def __init__(self, **kwargs: Any) -> None:
         """Create DodonaCommand.
 
@@ -191,15 +448,14 @@ class DodonaCommand:
 
     @staticmethod
     def __print_command(result: dict | None) -> None:
-        """Print the provided result to stdout as JSON.
+        """Print the provided result to the output sink as JSON.
 
         Args:
             result: dict that will be JSON encoded and printed to stdout
         """
         if result is None:
             return
-        json.dump(result, sys.stdout, indent=1, sort_keys=True)
-        sys.stdout.write("\n")  # Next JSON fragment should be on new line
+        DodonaCommand.output.write(result)
 
     def __enter__(self) -> SimpleNamespace:
         """Print the start message when entering the 'with' block.
@@ -276,6 +532,7 @@ class DodonaCommand:
         handled = self.handle_dodona_exception(exc_val) if isinstance(exc_val, DodonaException) else False
 
         self.__print_command(self.close_msg())
+        DodonaCommand.output.closed(self)
         return handled
 
 
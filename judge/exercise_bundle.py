@@ -0,0 +1,313 @@
+"""prepared exercises, that the judge loads instead of preparing the exercise for every submission.
+
+A bundle is created by 'sql_judge_prepare' and stored in the evaluation directory of the exercise.
+"""
+
+import json
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from .dodona_config import DodonaConfig
+from .instrumentation import instrumentation
+from .replay_cache import file_digest, judge_digest
+from .sql_query_result import SqliteColumnType, SqliteValue, SQLQueryResult, python_type_to_sqlite_type
+from .translator import Translator
+
+BUNDLE_FILE = "sql_judge_prepared.json"
+
+# Bump when the contents of a bundle change.
+BUNDLE_VERSION = 3
+
+# Settings that differ between runs of the same exercise, or that are configured before the
+# exercise is prepared (see 'configure_output').
+RUN_SETTINGS = frozenset(
+    {
+        "memory_limit",
+        "time_limit",
+        "programming_language",
+        "natural_language",
+        "resources",
+        "source",
+        "judge",
+        "workdir",
+        "output_format",
+        "output_flush_at",
+        "timing_feedback",
+        "trace",
+        "metrics_file",
+        "memory_profile",
+        "replay_cache_dir",
+        "translator",
+    }
+)
+
+# Settings that 'prepare_exercise' derives from the other settings (see 'derive_settings'), they are
+# created again when a bundle is applied.
+DERIVED_SETTINGS = frozenset({"result_comparator", "result_cache", "raw_solution_file", "solution_queries"})
+
+sqlite_type_to_python_type: dict[str, SqliteColumnType] = {name: t for t, name in python_type_to_sqlite_type.items()}
+
+
+def exercise_settings(config: DodonaConfig) -> str:
+    """Encode the settings of an exercise, as the judge receives them (before it's prepared).
+
+    Args:
+        config: the run configuration
+
+    Returns:
+        JSON encoded settings
+    """
+    settings = {name: value for name, value in vars(config).items() if name not in RUN_SETTINGS}
+    return json.dumps(settings, sort_keys=True, default=vars)
+
+
+def relative_path(path: str, resources: Path) -> str:
+    """Make a path inside the resources relative, so the bundle can be moved with the exercise.
+
+    Args:
+        path: the path
+        resources: the resources directory
+
+    Returns:
+        the path relative to the resources, or unchanged if it is not inside them
+    """
+    return str(Path(path).relative_to(resources)) if Path(path).is_relative_to(resources) else path
+
+
+def encode_result(result: SQLQueryResult) -> dict[str, Any]:
+    """Encode a query result as JSON compatible data.
+
+    Args:
+        result: the query result
+
+    Returns:
+        the columns, types, type profile, row count and rows of the result (BLOB values as hex)
+    """
+
+    def encode_value(value: SqliteValue) -> Any:
+        return {"blob": value.hex()} if isinstance(value, bytes) else value
+
+    return {
+        "columns": result.columns,
+        "types": [python_type_to_sqlite_type[t] for t in result.types],
+        "type_profile": [
+            {python_type_to_sqlite_type[t]: count for t, count in counter.items()} for counter in result.type_profile
+        ],
+        "row_count": result.row_count,
+        "rows": [[encode_value(x) for x in row] for row in result.dataframe.astype(object).to_numpy().tolist()],
+    }
+
+
+def decode_result(data: dict[str, Any]) -> SQLQueryResult:
+    """Decode a query result, see 'encode_result'.
+
+    Args:
+        data: the encoded result
+
+    Returns:
+        the query result
+    """
+    rows = [tuple(bytes.fromhex(x["blob"]) if isinstance(x, dict) else x for x in row) for row in data["rows"]]
+    return SQLQueryResult(
+        pd.DataFrame(rows),
+        data["columns"],
+        [sqlite_type_to_python_type[name] for name in data["types"]],
+        [Counter({sqlite_type_to_python_type[name]: n for name, n in p.items()}) for p in data["type_profile"]],
+        data["row_count"],
+    )
+
+
+class ExerciseBundle:
+    """a class for storing everything that 'prepare_exercise' derives from an exercise.
+
+    This covers the normalized settings, the database files and optionally the expected outputs
+    (see 'compute_expected_outputs'). A bundle is stale, and ignored, if the settings of the
+    exercise, its solution or database files, or the judge changed since it was created.
+
+    A bundle is stored as JSON, as it is part of the exercise: loading it can't run any code. The
+    objects that are derived from the settings, and the parsed solution, are not stored (see
+    'DERIVED_SETTINGS'), they are created again after the bundle is applied.
+    """
+
+    def __init__(
+        self,
+        settings: str,
+        prepared: dict[str, Any],
+        expected_outputs: dict[tuple[int, str], SQLQueryResult] | None,
+    ) -> None:
+        """Create ExerciseBundle.
+
+        Args:
+            settings: the settings of the exercise, see 'exercise_settings'
+            prepared: the settings that 'prepare_exercise' set or changed (with paths relative to the resources)
+            expected_outputs: the results of the solution's SELECT queries
+        """
+        self.version = BUNDLE_VERSION
+        self.judge = judge_digest()
+        self.settings = settings
+        self.prepared = prepared
+        self.expected_outputs = expected_outputs
+        # digest of every file the exercise uses, by path relative to the resources
+        self.files: dict[str, str] = {}
+
+    @classmethod
+    def from_prepared(
+        cls: type["ExerciseBundle"],
+        config: DodonaConfig,
+        unprepared: DodonaConfig,
+        expected_outputs: dict[tuple[int, str], SQLQueryResult] | None,
+    ) -> "ExerciseBundle":
+        """Create the bundle of a prepared exercise.
+
+        Args:
+            config: the prepared run configuration (see 'prepare_exercise')
+            unprepared: a copy of the run configuration, before it was prepared
+            expected_outputs: the results of the solution's SELECT queries, if they should be bundled
+
+        Returns:
+            the bundle
+        """
+        resources = Path(config.resources)
+        before = vars(unprepared)
+        prepared = {
+            name: value
+            for name, value in vars(config).items()
+            if name not in RUN_SETTINGS | DERIVED_SETTINGS and (name not in before or before[name] != value)
+        }
+
+        prepared["solution_sql"] = relative_path(config.solution_sql, resources)
+        prepared["database_files"] = [(name, relative_path(file, resources)) for name, file in config.database_files]
+        if "database_dir" in prepared:
+            prepared["database_dir"] = relative_path(config.database_dir, resources)
+
+        bundle = cls(exercise_settings(unprepared), prepared, expected_outputs)
+        bundle.files = {
+            path: bundle.digest(resources / path)
+            for path in [prepared["solution_sql"], *(file for _, file in prepared["database_files"])]
+        }
+        return bundle
+
+    @staticmethod
+    def digest(path: Path) -> str:
+        """Hash a file of the exercise.
+
+        Args:
+            path: the file
+
+        Returns:
+            hex digest
+        """
+        stat = path.stat()
+        return file_digest(str(path), stat.st_size, stat.st_mtime_ns)
+
+    def write(self, path: Path) -> None:
+        """Write the bundle.
+
+        Args:
+            path: the bundle file (see 'BUNDLE_FILE')
+        """
+        data = {
+            "version": self.version,
+            "judge": self.judge,
+            "settings": self.settings,
+            "prepared": self.prepared,
+            "files": self.files,
+            "expected_outputs": None
+            if self.expected_outputs is None
+            else [
+                {"query_nr": query_nr, "database": db_name, "result": encode_result(result)}
+                for (query_nr, db_name), result in self.expected_outputs.items()
+            ],
+        }
+        # written to a temporary file first, so a judge never reads a partial bundle
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False
+        ) as bundle_file:
+            json.dump(data, bundle_file)
+        Path(bundle_file.name).chmod(0o644)
+        Path(bundle_file.name).replace(path)
+
+    @classmethod
+    def load(cls: type["ExerciseBundle"], config: DodonaConfig) -> "ExerciseBundle | None":
+        """Load the bundle of an exercise, if it has one that is up to date.
+
+        Args:
+            config: the run configuration (not prepared)
+
+        Returns:
+            the bundle, None if there is no bundle or it is stale
+        """
+        path = Path(config.resources) / BUNDLE_FILE
+        if not path.is_file():
+            return None
+
+        # the bundle is part of the exercise, like its solution; a broken bundle is ignored
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            outputs = data["expected_outputs"]
+            bundle = cls(
+                data["settings"],
+                data["prepared"],
+                None
+                if outputs is None
+                else {(output["query_nr"], output["database"]): decode_result(output["result"]) for output in outputs},
+            )
+            bundle.version, bundle.judge, bundle.files = data["version"], data["judge"], data["files"]
+            if not bundle.is_current(config):
+                return None
+        except Exception:  # noqa: BLE001
+            return None
+
+        instrumentation.count("exercise_bundle_loads")
+        return bundle
+
+    def is_current(self, config: DodonaConfig) -> bool:
+        """Check if the bundle was created for the current exercise and judge.
+
+        Args:
+            config: the run configuration (not prepared)
+
+        Returns:
+            False if the bundle is stale
+        """
+        if self.version != BUNDLE_VERSION or self.judge != judge_digest():
+            return False
+        if self.settings != exercise_settings(config):
+            return False
+
+        resources = Path(config.resources)
+        if "database_dir" in self.prepared:
+            # a database might be added to (or removed from) the directory
+            database_dir = resources / self.prepared["database_dir"]
+            names = sorted(path.name for path in database_dir.iterdir() if path.suffix == ".sqlite")
+            if names != [name for name, _ in self.prepared["database_files"]]:
+                return False
+
+        return all(self.digest(resources / path) == digest for path, digest in self.files.items())
+
+    def apply(self, config: DodonaConfig) -> dict[tuple[int, str], SQLQueryResult] | None:
+        """Prepare the run configuration with the bundle, instead of 'prepare_exercise'.
+
+        Should be called within the Judgement.
+
+        Args:
+            config: the run configuration, prepared in place
+
+        Returns:
+            the bundled expected outputs, None if they were not bundled
+        """
+        config.sanity_check()
+        config.translator = Translator.from_str(config.natural_language)
+
+        resources = Path(config.resources)
+        vars(config).update(self.prepared)
+        config.solution_sql = str(resources / self.prepared["solution_sql"])
+        config.database_files = [(name, str(resources / file)) for name, file in self.prepared["database_files"]]
+        if "database_dir" in self.prepared:
+            config.database_dir = str(resources / self.prepared["database_dir"])
+
+        return self.expected_outputs
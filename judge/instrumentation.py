@@ -0,0 +1,478 @@
+"""monotonic timing (and optionally memory profiling) of the phases of a judge run."""
+
+import _sqlite3
+import contextlib
+import ctypes
+import functools
+import json
+import sqlite3
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+from .dodona_command import DodonaCommand, Message, MessageFormat, MessagePermission
+
+# Name of the span that encloses all phases of a single Context (one database).
+CONTEXT_SPAN = "context"
+
+# Number of SQLite virtual machine instructions between two calls of the progress handler.
+PROGRESS_STEPS = 1000
+
+# Span arguments that hold a number of fetched rows.
+ROW_ARGS = ("rows", "expected_rows", "generated_rows")
+
+# Number of allocation sites that are kept per span when profiling memory.
+MEMORY_TOP_SITES = 3
+
+# The 'op' argument of sqlite3_status64 for the memory used by SQLite (SQLITE_STATUS_MEMORY_USED).
+SQLITE_STATUS_MEMORY_USED = 0
+
+# Allocations of the profiler itself are not shown as allocation sites.
+MEMORY_FILTERS = (
+    tracemalloc.Filter(inclusive=False, filename_pattern=tracemalloc.__file__),
+    tracemalloc.Filter(inclusive=False, filename_pattern=__file__),
+)
+
+
+@functools.cache
+def _sqlite_status() -> Callable | None:
+    # the sqlite3 module doesn't expose sqlite3_status64, so call it from the library the module is linked with
+    try:
+        return ctypes.CDLL(_sqlite3.__file__).sqlite3_status64
+    except (OSError, AttributeError):
+        return None
+
+
+def sqlite_memory(reset_highwater: bool = False) -> tuple[int, int]:  # noqa: FBT001, FBT002
+    """Memory used by SQLite itself (all connections of this process), which tracemalloc can't see.
+
+    Args:
+        reset_highwater: reset the high-water mark to the current memory use afterwards
+
+    Returns:
+        (current, high-water mark) in bytes, (0, 0) if the sqlite library doesn't provide them
+    """
+    status = _sqlite_status()
+    if status is None:
+        return 0, 0
+    current, highwater = ctypes.c_int64(), ctypes.c_int64()
+    status(SQLITE_STATUS_MEMORY_USED, ctypes.byref(current), ctypes.byref(highwater), int(reset_highwater))
+    return current.value, highwater.value
+
+
+class Span:
+    """a class for a single timed phase, used as a 'with' block.
+
+    The time of a span is measured with a monotonic clock. Its exclusive time is the time that
+    is not spent in nested spans, so the exclusive times of all spans in a context add up
+    to the duration of the context.
+    """
+
+    def __init__(self, instrumentation: "Instrumentation", name: str, args: dict[str, Any]) -> None:
+        """Create Span.
+
+        Should not be used directly (other than testing). Use 'Instrumentation.span' instead.
+
+        Args:
+            instrumentation: the instrumentation that records this span
+            name: name of the phase
+            args: extra information about the phase (eg. the database name)
+        """
+        self.instrumentation = instrumentation
+        self.name = name
+        self.args = args
+        self.parent: Span | None = None
+        # monotonic timestamps in nanoseconds
+        self.start = 0
+        self.end = 0
+        self.children_time = 0
+        # memory in bytes, only measured when profiling memory (see 'Instrumentation.memory')
+        self.memory_start = 0
+        self.memory_peak = 0
+        self.sqlite_memory_start = 0
+        self.sqlite_memory_peak = 0
+        self.snapshot: tracemalloc.Snapshot | None = None
+
+    @property
+    def duration(self) -> int:
+        """Time between entering and leaving the span.
+
+        Returns:
+            duration in nanoseconds
+        """
+        return self.end - self.start
+
+    @property
+    def exclusive_duration(self) -> int:
+        """Time spent in this span, but not in one of its nested spans.
+
+        Returns:
+            exclusive duration in nanoseconds
+        """
+        return self.duration - self.children_time
+
+    def context(self) -> "Span | None":
+        """Find the enclosing context span.
+
+        Returns:
+            the nearest ancestor (or self) named CONTEXT_SPAN, None if there is none
+        """
+        span: Span | None = self
+        while span is not None and span.name != CONTEXT_SPAN:
+            span = span.parent
+        return span
+
+    def __enter__(self) -> Self:
+        """Start timing the span.
+
+        Returns:
+            the span itself
+        """
+        stack = self.instrumentation.stack
+        self.parent = stack[-1] if len(stack) > 0 else None
+        if self.instrumentation.memory:
+            # the snapshot is taken first, so its own allocations don't count towards the peak
+            self.snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+            self.instrumentation.memory_checkpoint()
+            self.memory_start = self.memory_peak = tracemalloc.get_traced_memory()[0]
+            self.sqlite_memory_start = self.sqlite_memory_peak = sqlite_memory()[0]
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        """Stop timing the span, also if an exception was raised.
+
+        Args:
+            exc_type: exception type
+            exc_val: exception value
+            exc_tb: exception traceback
+        """
+        self.end = time.perf_counter_ns()
+        if self.instrumentation.memory:
+            self.instrumentation.memory_checkpoint()
+            self.args["memory_peak_kib"] = round((self.memory_peak - self.memory_start) / 1024)
+            self.args["sqlite_memory_peak_kib"] = round((self.sqlite_memory_peak - self.sqlite_memory_start) / 1024)
+            self.args["memory_top"] = self.top_allocations()
+            self.snapshot = None
+        self.instrumentation.stack.pop()
+        if self.parent is not None:
+            self.parent.children_time += self.duration
+        self.instrumentation.spans.append(self)
+
+    def top_allocations(self) -> list[str]:
+        """Find the allocation sites whose memory grew the most since the span was entered.
+
+        Memory that was allocated and freed again within the span isn't included, that only counts
+        towards the peak.
+
+        Returns:
+            up to MEMORY_TOP_SITES descriptions ('file:line +size KiB'), largest first
+        """
+        if self.snapshot is None:
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        sites = []
+        for stat in snapshot.compare_to(self.snapshot, "lineno"):
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            sites.append(f"{'/'.join(Path(frame.filename).parts[-2:])}:{frame.lineno} {stat.size_diff / 1024:+.1f} KiB")
+            if len(sites) == MEMORY_TOP_SITES:
+                break
+        return sites
+
+
+class Instrumentation:
+    """a class for timing the phases of a judge run (eg. copying a database or running a query).
+
+    Phases are timed by wrapping them in 'with instrumentation.span(name)'. When disabled (the
+    default), 'span' returns a shared no-op context manager, so an instrumented phase costs no
+    more than a function call.
+
+    All spans are kept in memory, a trace of the whole run is only written when it's finished,
+    so tracing doesn't add any file writes while the run is timed.
+
+    When profiling memory, every span also records the peak of the memory allocated by Python
+    (with tracemalloc) and by SQLite during the span, and the allocation sites that grew the most.
+    The tracemalloc snapshots make the spans a lot slower, so their timings aren't representative.
+    """
+
+    _disabled_span = nullcontext()
+
+    def __init__(self, enabled: bool = False, memory: bool = False) -> None:  # noqa: FBT001, FBT002
+        """Create Instrumentation.
+
+        Args:
+            enabled: record the spans
+            memory: profile the memory use of every span (only if enabled)
+        """
+        self.enabled = enabled
+        self.memory = memory
+        # all closed spans, in the order they were closed
+        self.spans: list[Span] = []
+        # the currently open spans, innermost last
+        self.stack: list[Span] = []
+        # run wide totals, eg. cache hits
+        self.counters: dict[str, int] = {}
+
+    def span(self, name: str, **args: Any) -> AbstractContextManager:
+        """Time a phase.
+
+        Args:
+            name: name of the phase
+            **args: extra information about the phase
+
+        Returns:
+            a context manager that times the enclosed 'with' block
+        """
+        if not self.enabled:
+            return self._disabled_span
+        return Span(self, name, args)
+
+    def annotate(self, **args: Any) -> None:
+        """Add extra information (eg. the number of fetched rows) to the innermost open span.
+
+        Args:
+            **args: extra information about the phase
+        """
+        if self.enabled and len(self.stack) > 0:
+            self.stack[-1].args.update(args)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add to a run wide counter (eg. cache hits), see 'metrics'.
+
+        Args:
+            name: name of the counter
+            amount: the amount to add
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def watch(self, connection: sqlite3.Connection) -> None:
+        """Count the SQLite virtual machine instructions of a connection in the innermost open span.
+
+        The count is stored as the 'sqlite_steps' argument, in multiples of PROGRESS_STEPS.
+
+        Args:
+            connection: a new sqlite connection
+        """
+        if self.enabled:
+            connection.set_progress_handler(self._count_steps, PROGRESS_STEPS)
+
+    def memory_checkpoint(self) -> None:
+        """Add the memory peaks since the previous checkpoint to all open spans, and start a new period.
+
+        The peaks are reset at every span boundary, so each open span gets the exact peak of
+        its own period, also if spans are nested.
+        """
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        _, sqlite_peak = sqlite_memory(reset_highwater=True)
+        for span in self.stack:
+            span.memory_peak = max(span.memory_peak, peak)
+            span.sqlite_memory_peak = max(span.sqlite_memory_peak, sqlite_peak)
+
+    def _count_steps(self) -> int:
+        if len(self.stack) > 0:
+            args = self.stack[-1].args
+            args["sqlite_steps"] = args.get("sqlite_steps", 0) + PROGRESS_STEPS
+        return 0  # continue the statement
+
+    @contextmanager
+    def record(
+        self, trace_file: Path | None = None, metrics_file: Path | None = None, labels: dict[str, Any] | None = None
+    ) -> Iterator[None]:
+        """Record the spans of a whole judge run, and write them as a trace and metrics afterwards.
+
+        Both files are written after the Judgement is closed, and a file that can't be written is
+        skipped, so neither can interfere with the feedback on stdout. When profiling memory,
+        tracemalloc is started (and stopped afterwards) if it isn't tracing yet.
+
+        Args:
+            trace_file: where to write the trace (in Chrome trace event format), None to not write a trace
+            metrics_file: JSON lines file to append the metrics to, None to not write metrics
+            labels: extra fields of the metrics (eg. to identify the exercise)
+
+        Yields:
+            nothing
+        """
+        self.spans, self.stack, self.counters = [], [], {}
+        start_tracing = self.enabled and self.memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        try:
+            yield
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+            if self.enabled and trace_file is not None:
+                with contextlib.suppress(OSError):
+                    trace_file.write_text(json.dumps(self.trace()), encoding="utf-8")
+            if self.enabled and metrics_file is not None:
+                with contextlib.suppress(OSError), metrics_file.open("a", encoding="utf-8") as file:
+                    file.write(json.dumps({**(labels or {}), **self.metrics()}, sort_keys=True) + "\n")
+
+    def metrics(self) -> dict[str, Any]:
+        """Summarize the recorded run, for aggregation over many runs.
+
+        The durations are in milliseconds, the time of every phase is its exclusive time summed over
+        the whole run, so the phases add up to 'duration_ms'. When profiling memory, the largest
+        peak of every phase is included too.
+
+        Returns:
+            JSON serializable metrics
+        """
+        phases: dict[str, float] = {}
+        memory: dict[str, int] = {}
+        sqlite_memory: dict[str, int] = {}
+        for span in self.spans:
+            phases[span.name] = phases.get(span.name, 0) + span.exclusive_duration / 1e6
+            if "memory_peak_kib" in span.args:
+                memory[span.name] = max(memory.get(span.name, 0), span.args["memory_peak_kib"])
+                sqlite_memory[span.name] = max(sqlite_memory.get(span.name, 0), span.args["sqlite_memory_peak_kib"])
+        memory_metrics = {"memory_peak_kib": memory, "sqlite_memory_peak_kib": sqlite_memory} if len(memory) > 0 else {}
+
+        return {
+            "duration_ms": sum(phases.values()),
+            "phases_ms": phases,
+            "contexts": sum(1 for span in self.spans if span.name == CONTEXT_SPAN),
+            "rows_fetched": sum(span.args.get(arg, 0) or 0 for span in self.spans for arg in ROW_ARGS),
+            "sqlite_steps": sum(span.args.get("sqlite_steps", 0) for span in self.spans),
+            "output_bytes": DodonaCommand.output.size,
+            **memory_metrics,
+            **self.counters,
+        }
+
+    def trace(self) -> dict:
+        """Convert all closed spans to Chrome trace event format, eg. for Perfetto or chrome://tracing.
+
+        Every span is a 'complete' event, nested spans are shown inside their parent because they
+        share the same thread.
+
+        Returns:
+            JSON serializable trace
+        """
+        origin = min((span.start for span in self.spans), default=0)
+        events = [
+            {
+                "name": span.name,
+                "cat": "judge",
+                "ph": "X",
+                "ts": (span.start - origin) / 1000,
+                "dur": span.duration / 1000,
+                "pid": 1,
+                "tid": 1,
+                "args": span.args,
+            }
+            for span in sorted(self.spans, key=lambda span: (span.start, -span.end))
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    @contextmanager
+    def report(self, timing: bool = True, memory: bool = False) -> Iterator[None]:  # noqa: FBT001, FBT002
+        """Show the timings (and memory use) of all contexts in the enclosed 'with' block as staff messages.
+
+        The messages are shown when the block is left, also if a DodonaException is raised.
+
+        Args:
+            timing: show the time per phase, see 'timing_table'
+            memory: show the memory per phase, see 'memory_table' (only if profiling memory)
+
+        Yields:
+            nothing
+        """
+        first = len(self.spans)
+        try:
+            yield
+        finally:
+            if self.enabled:
+                tables = [
+                    self.timing_table(self.spans[first:]) if timing else None,
+                    self.memory_table(self.spans[first:]) if memory and self.memory else None,
+                ]
+                for table in tables:
+                    if table is not None:
+                        with Message(
+                            description=table, format=MessageFormat.MARKDOWN, permission=MessagePermission.STAFF
+                        ):
+                            pass
+
+    @staticmethod
+    def timing_table(spans: list[Span]) -> str | None:
+        """Create a markdown table with the exclusive time per phase (in ms) for every context.
+
+        Args:
+            spans: the closed spans to summarize
+
+        Returns:
+            markdown table, None if there are no context spans
+        """
+        contexts = [span for span in spans if span.name == CONTEXT_SPAN]
+        if len(contexts) == 0:
+            return None
+
+        phases: dict[str, None] = {}
+        times: dict[tuple[int, str], int] = {}
+        for span in spans:
+            context = span.context()
+            if context is None or span is context:
+                continue
+            phases[span.name] = None
+            key = (id(context), span.name)
+            times[key] = times.get(key, 0) + span.exclusive_duration
+
+        def ms(nanoseconds: int) -> str:
+            return f"{nanoseconds / 1e6:.1f}"
+
+        lines = [
+            "| " + " | ".join(["Context", *phases, "other", "total"]) + " |",
+            "|" + "---|" + "--:|" * (len(phases) + 2),
+        ]
+        for context in contexts:
+            row = [ms(times.get((id(context), phase), 0)) for phase in phases]
+            row += [ms(context.exclusive_duration), ms(context.duration)]
+            lines.append("| " + " | ".join([str(context.args.get("database", "")), *row]) + " |")
+        return "\n".join(lines)
+
+    @staticmethod
+    def memory_table(spans: list[Span]) -> str | None:
+        """Create a markdown table with the memory peaks and top allocation sites of every phase of every context.
+
+        The first row of a context is the context itself, followed by its phases in the order they started.
+
+        Args:
+            spans: the closed spans to summarize, recorded while profiling memory
+
+        Returns:
+            markdown table, None if there are no profiled context spans
+        """
+        rows = [span for span in spans if span.context() is not None and "memory_peak_kib" in span.args]
+        if len(rows) == 0:
+            return None
+
+        lines = [
+            "| Context | Phase | Python peak (KiB) | SQLite peak (KiB) | Top allocation sites |",
+            "|---|---|--:|--:|---|",
+        ]
+        for span in sorted(rows, key=lambda span: (span.start, -span.end)):
+            context = span.context()
+            database = str(context.args.get("database", "")) if context is not None else ""
+            sites = "<br>".join(f"`{site}`" for site in span.args["memory_top"])
+            memory, sqlite_memory = span.args["memory_peak_kib"], span.args["sqlite_memory_peak_kib"]
+            lines.append(f"| {database} | {span.name} | {memory} | {sqlite_memory} | {sites} |")
+        return "\n".join(lines)
+
+
+# The instrumentation of the current judge run, enabled by the 'timing_feedback', 'trace', 'metrics_file' and
+# 'memory_profile' options.
+instrumentation = Instrumentation()
@@ -0,0 +1,222 @@
+"""replay of the judgements of identical submissions from a local disk cache."""
+
+import contextlib
+import functools
+import hashlib
+import json
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+from .dodona_command import DodonaCommand
+from .dodona_config import DodonaConfig
+from .instrumentation import instrumentation
+
+# Bump when the judge's output changes in a way that its source files don't reflect.
+CACHE_VERSION = 1
+
+# Settings that differ between runs of the same exercise but don't change the feedback, and
+# settings that are derived from other settings (eg. the parsed solution).
+IGNORED_SETTINGS = frozenset(
+    {
+        "solution_queries",
+        "submission_queries",
+        "source",
+        "workdir",
+        "judge",
+        "memory_limit",
+        "time_limit",
+        "raw_submission_file",
+        "trace",
+        "metrics_file",
+        "replay_cache_dir",
+        "replay_cache_size",
+        "result_cache_size",
+        "skip_equivalent_selects",
+    }
+)
+
+
+@functools.cache
+def judge_digest() -> str:
+    """Hash the source of the judge.
+
+    Returns:
+        hex digest
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+@functools.cache
+def file_digest(path: str, size: int, mtime_ns: int) -> str:  # noqa: ARG001
+    """Hash the contents of a file, once per version of the file.
+
+    Args:
+        path: the file
+        size: size of the file (in bytes)
+        mtime_ns: modification time of the file, like the size only part of the cache key, so a changed file
+                  is hashed again
+
+    Returns:
+        hex digest
+    """
+    with Path(path).open("rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def exercise_fingerprint(config: DodonaConfig) -> str:
+    """Fingerprint everything that determines the feedback on a submission, except the submission itself.
+
+    This covers the exercise settings (after 'prepare_exercise'), the solution, the contents of
+    the databases and the source of the judge.
+
+    Args:
+        config: the prepared run configuration
+
+    Returns:
+        hex digest
+    """
+    settings = {
+        name: value
+        for name, value in vars(config).items()
+        if name not in IGNORED_SETTINGS and isinstance(value, str | int | float | list | SimpleNamespace | None)
+    }
+    databases = []
+    for _, file in config.database_files:
+        stat = Path(file).stat()
+        databases.append(file_digest(file, stat.st_size, stat.st_mtime_ns))
+
+    fingerprint = [CACHE_VERSION, judge_digest(), settings, databases]
+    encoded = json.dumps(fingerprint, sort_keys=True, default=vars).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ReplayCache:
+    """a class for replaying the Dodona output of submissions that were judged before.
+
+    A submission is identified by the exercise fingerprint and the text (without comments) of
+    each of its queries. As the feedback shows the queries without comments, and the judge is
+    deterministic (nothing in the feedback depends on how long a query takes: all rows of a result
+    are counted, and the same rows are profiled, see 'SQLQueryResult.from_cursor'), an identical
+    submission gets the identical stream of Dodona commands. Timing feedback is never cached. The
+    only command that depends on the rest of the submission file is the annotation of a missing
+    semicolon, of which the row is corrected when it is replayed. Submissions of which a query
+    isn't deterministic (eg. uses 'random()', see 'is_deterministic') are not cached.
+
+    Every judgement is a file in the cache directory. When the files take more than the maximum
+    size, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        """Create ReplayCache.
+
+        Args:
+            directory: the cache directory (created if it doesn't exist)
+            max_bytes: max total size of the cached judgements
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # key of the judgement that is being recorded
+        self.key: str | None = None
+
+    @classmethod
+    def from_config(cls: type["ReplayCache"], config: DodonaConfig) -> "ReplayCache | None":
+        """Create the cache of a prepared run configuration.
+
+        Args:
+            config: the prepared run configuration
+
+        Returns:
+            the cache, None if it is disabled or the feedback isn't deterministic (timing or memory feedback)
+        """
+        if config.replay_cache_dir == "" or config.timing_feedback or config.memory_profile:
+            return None
+        return cls(Path(config.replay_cache_dir), config.replay_cache_size)
+
+    @staticmethod
+    def submission_key(config: DodonaConfig) -> str:
+        """Identify a submission.
+
+        Args:
+            config: the prepared run configuration, with the parsed submission
+
+        Returns:
+            hex digest
+        """
+        queries = [query.without_comments for query in config.submission_queries]
+        encoded = json.dumps([exercise_fingerprint(config), queries]).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def replay(self, config: DodonaConfig, judgement: SimpleNamespace) -> bool:
+        """Write the cached commands of an identical submission, if there is one.
+
+        The close command of the Judgement isn't written, its arguments are set on the open Judgement instead.
+
+        Args:
+            config: the prepared run configuration, with the parsed submission
+            judgement: the close arguments of the open Judgement
+
+        Returns:
+            True if the submission was replayed, if False it should be judged (see 'record')
+        """
+        self.key = self.submission_key(config)
+        path = self.directory / f"{self.key}.json"
+        try:
+            commands = json.loads(path.read_text(encoding="utf-8"))
+            path.touch()  # most recently used
+        except (OSError, ValueError):
+            instrumentation.count("replay_cache_misses")
+            return False
+        instrumentation.count("replay_cache_hits")
+
+        *commands, close = commands
+        row = config.raw_submission_file.rstrip().count("\n")
+        for command in commands:
+            if command["command"] == "annotate-code":
+                command["row"] = row
+            DodonaCommand.output.write(command)
+        judgement.__dict__.update({name: value for name, value in close.items() if name != "command"})
+        self.key = None
+        return True
+
+    def record(self) -> None:
+        """Start recording the commands of the submission that 'replay' couldn't find."""
+        DodonaCommand.output.recording = []
+
+    def store(self) -> None:
+        """Store the recorded commands, after the Judgement was closed.
+
+        The cache is skipped if it can't be written, so it can't interfere with the feedback.
+        """
+        recording, DodonaCommand.output.recording = DodonaCommand.output.recording, None
+        if self.key is None or recording is None or len(recording) == 0:
+            return
+        if json.loads(recording[-1])["command"] != "close-judgement":
+            return
+
+        with contextlib.suppress(OSError):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # written to a temporary file first, so concurrent runs never read a partial judgement
+            with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as file:
+                file.write("[" + ",".join(recording) + "]")
+            Path(file.name).replace(self.directory / f"{self.key}.json")
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used judgements until the cache fits within its maximum size."""
+        entries = []
+        for path in self.directory.glob("*.json"):
+            with contextlib.suppress(OSError):
+                stat = path.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                path.unlink()
+            total -= size
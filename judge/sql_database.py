@@ -1,14 +1,19 @@
 """Manage sqlite solution and submission database."""
 
 import sqlite3
+from collections.abc import Iterable
 from pathlib import Path
 from shutil import copyfile
 from types import TracebackType
 from typing import Self
 
 from .dodona_config import DodonaConfig
+from .instrumentation import instrumentation
 from .sql_query import SQLQuery
 from .sql_query_result import SQLQueryResult
+from .sql_result_diff import SQLResultDiff
+from .sql_schema import SQLSchema, compare_schemas
+from .sql_table_delta import SQLTableDelta
 
 
 def sql_run_pragma_startup_queries(cursor: sqlite3.Cursor, script: str) -> None:
@@ -30,6 +35,22 @@ def sql_run_pragma_startup_queries(cursor: sqlite3.Cursor, script: str) -> None:
     cursor.executescript(script)
 
 
+class SQLTables:
+    """a class for the layouts and contents of several tables, see 'SQLDatabase.get_tables'.
+
+    Every dict maps a table (or schema object) name to its (solution, submission) results.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty SQLTables."""
+        self.layouts: dict[str, tuple[SQLQueryResult, SQLQueryResult]] = {}
+        # sqlite_master rows of the requested layouts that are an index, view or trigger
+        self.definitions: dict[str, tuple[SQLQueryResult, SQLQueryResult]] = {}
+        self.contents: dict[str, tuple[SQLQueryResult, SQLQueryResult]] = {}
+        # contents of the tables that were retrieved as a delta
+        self.deltas: dict[str, SQLTableDelta] = {}
+
+
 class SQLDatabase:
     """Wrapper class for the sqlite3 connections & file management.
 
@@ -53,10 +74,19 @@ class SQLDatabase:
         self.solutionfile = Path(workdir) / f"{db_name}.solution"
         self.submissionfile = Path(workdir) / f"{db_name}.submission"
 
+        # Only used when select query results are compared inside SQLite (see 'materialize_select').
+        self.resultfiles = {
+            "expected": Path(workdir) / f"{db_name}.expected",
+            "generated": Path(workdir) / f"{db_name}.generated",
+        }
+
         self.solutionfile.parent.mkdir(parents=True, exist_ok=True)
 
         self.connection: sqlite3.Connection | None = None
 
+        # (primary_key, counts) of the tables with the same layout in both databases, see 'diff'
+        self.differences: dict[str, tuple[list[str], tuple[int, int, int]]] = {}
+
     def __enter__(self) -> Self:
         """Create solutionfile and submissionfile.
 
@@ -67,10 +97,11 @@ class SQLDatabase:
         Returns:
             current SQLDatabase instance
         """
-        if not self.solutionfile.is_file():
-            copyfile(self.sourcefile, self.solutionfile)
-        if not self.submissionfile.is_file():
-            copyfile(self.sourcefile, self.submissionfile)
+        with instrumentation.span("copy"):
+            if not self.solutionfile.is_file():
+                copyfile(self.sourcefile, self.solutionfile)
+            if not self.submissionfile.is_file():
+                copyfile(self.sourcefile, self.submissionfile)
         return self
 
     def __exit__(
@@ -103,6 +134,7 @@ class SQLDatabase:
         """
         self.close()
         self.connection = sqlite3.connect(self.solutionfile)
+        instrumentation.watch(self.connection)
         return self.connection.cursor()
 
     def submission_cursor(self) -> sqlite3.Cursor:
@@ -113,6 +145,7 @@ class SQLDatabase:
         """
         self.close()
         self.connection = sqlite3.connect(self.submissionfile)
+        instrumentation.watch(self.connection)
         return self.connection.cursor()
 
     def joined_cursor(self) -> sqlite3.Cursor:
@@ -123,11 +156,72 @@ class SQLDatabase:
         """
         self.close()
         self.connection = sqlite3.connect(":memory:")
+        instrumentation.watch(self.connection)
         cursor = self.connection.cursor()
         cursor.execute(f'ATTACH "{self.solutionfile}" as solution')
         cursor.execute(f'ATTACH "{self.submissionfile}" as submission')
         return cursor
 
+    def materialize_select(self, cursor: sqlite3.Cursor, schema: str, query: SQLQuery) -> None:
+        """Run a select query and store its full result in a separate database file.
+
+        The result is stored as the 'result' table of the 'expected' or 'generated' database, the
+        rows never leave SQLite. Both results are stored in their own file, so a submission query
+        can't read the materialized solution result.
+
+        Args:
+            cursor: cursor for the solution or submission database
+            schema: 'expected' (solution query) or 'generated' (submission query)
+            query: the select query to run
+        """
+        resultfile = self.resultfiles[schema]
+        resultfile.unlink(missing_ok=True)
+
+        cursor.execute(f'ATTACH "{resultfile}" AS {schema}')
+        try:
+            cursor.execute(f"PRAGMA {schema}.journal_mode = OFF")
+            cursor.execute(f"PRAGMA {schema}.synchronous = OFF")
+            cursor.execute(f"CREATE TABLE {schema}.result AS {query.without_comments.rstrip().removesuffix(';')}")
+        finally:
+            cursor.execute(f"DETACH {schema}")
+
+    def result_cursor(self) -> sqlite3.Cursor:
+        """Create a cursor for the materialized solution and submission select results.
+
+        Returns:
+            a cursor for a database in which both the 'expected' and 'generated' results are attached
+        """
+        self.close()
+        self.connection = sqlite3.connect(":memory:")
+        instrumentation.watch(self.connection)
+        cursor = self.connection.cursor()
+        cursor.execute(f'ATTACH "{self.resultfiles["expected"]}" as expected')
+        cursor.execute(f'ATTACH "{self.resultfiles["generated"]}" as generated')
+        return cursor
+
+    def compare_results(self, config: DodonaConfig) -> SQLResultDiff:
+        """Compare the materialized solution and submission select results inside SQLite.
+
+        Args:
+            config: the Dodona judge config
+
+        Returns:
+            the comparison of both results
+        """
+        cursor = self.result_cursor()
+        try:
+            return SQLResultDiff.from_cursor(
+                cursor,
+                config.max_rows,
+                config.allow_different_column_order,
+                config.result_comparator,
+                config.max_value_length,
+            )
+        finally:
+            self.close()
+            for resultfile in self.resultfiles.values():
+                resultfile.unlink(missing_ok=True)
+
     def get_table_layout(self, config: DodonaConfig, table: str) -> tuple[SQLQueryResult, SQLQueryResult]:
         """Retrieve the table layout for both the solution and submission.
 
@@ -138,12 +232,7 @@ class SQLDatabase:
         Returns:
             (solution_layout, submission_layout) containing the pragma table info
         """
-        cursor = self.joined_cursor()
-        cursor.execute(f"PRAGMA solution.table_info('{table}')")
-        solution_layout = SQLQueryResult.from_cursor(config.max_rows, cursor)
-        cursor.execute(f"PRAGMA submission.table_info('{table}')")
-        submission_layout = SQLQueryResult.from_cursor(config.max_rows, cursor)
-        return solution_layout, submission_layout
+        return self.get_tables(config, layouts=[table]).layouts[table]
 
     def get_table_content(self, config: DodonaConfig, table: str) -> tuple[SQLQueryResult, SQLQueryResult]:
         """Retrieve the table content for both the solution and submission.
@@ -155,77 +244,138 @@ class SQLDatabase:
         Returns:
             (solution_content, submission_content) containing the table contents
         """
+        return self.get_tables(config, contents=[table]).contents[table]
+
+    def get_tables(
+        self,
+        config: DodonaConfig,
+        layouts: Iterable[str] = (),
+        contents: Iterable[str] = (),
+        delta_min_rows: int | None = None,
+    ) -> SQLTables:
+        """Retrieve the layouts and contents of several tables at once, over a single connection.
+
+        Opening a joined connection attaches (and parses the schema of) both databases, which
+        dominates the cost of retrieving a single small table. Feedback for a schema with many
+        differing tables therefore retrieves everything it shows in one batch.
+
+        Layouts of objects that are not a table (index, view or trigger) are retrieved as their
+        sqlite_master definition instead, see 'SQLTables.definitions'.
+
+        Args:
+            config: the Dodona judge config
+            layouts: names of the tables (or other schema objects) to retrieve the layout of
+            contents: names of the tables to retrieve the content of
+            delta_min_rows: tables with a usable primary key (see 'keyed_columns') and more rows (in either
+                            database) are retrieved as a delta, see SQLTableDelta, None to always retrieve
+                            the full content. The primary keys and counts of the last 'diff' are reused.
+
+        Returns:
+            the retrieved layouts and contents
+        """
+        layouts, contents = list(dict.fromkeys(layouts)), list(dict.fromkeys(contents))
+        tables = SQLTables()
+        if len(layouts) + len(contents) == 0:
+            return tables
+
         cursor = self.joined_cursor()
+
+        object_types: dict[str, set[str]] = {}
+        if len(layouts) > 0:
+            cursor.execute(
+                "SELECT upper(name), type FROM solution.sqlite_master "
+                "UNION SELECT upper(name), type FROM submission.sqlite_master"
+            )
+            for name, object_type in cursor.fetchall():
+                object_types.setdefault(name, set()).add(object_type)
+
+        for name in layouts:
+            if "table" not in object_types.get(name.upper(), {"table"}):
+                tables.definitions[name] = self._object_definition(cursor, config, name)
+            else:
+                tables.layouts[name] = self._table_layout(cursor, config, name)
+
+        deltas = self._delta_keys(cursor, contents, delta_min_rows)
+        for table in contents:
+            if table in deltas:
+                primary_key, counts = deltas[table]
+                tables.deltas[table] = SQLTableDelta.from_cursor(
+                    cursor, table, primary_key, counts, config.max_rows, max_value_length=config.max_value_length
+                )
+            else:
+                tables.contents[table] = self._table_content(cursor, config, table)
+
+        return tables
+
+    def _delta_keys(
+        self, cursor: sqlite3.Cursor, contents: list[str], delta_min_rows: int | None
+    ) -> dict[str, tuple[list[str], tuple[int, int, int]]]:
+        if delta_min_rows is None or len(contents) == 0:
+            return {}
+
+        # S608 is a false positive here: see '_table_content'.
+        counts = ", ".join(
+            f"(SELECT count(*) FROM {schema}.'{table}')"  # noqa: S608
+            for table in contents
+            for schema in ("solution", "submission")
+        )
+        cursor.execute(f"SELECT {counts}")
+        row_counts = cursor.fetchone()
+        large = [table for i, table in enumerate(contents) if max(row_counts[2 * i : 2 * i + 2]) > delta_min_rows]
+
+        # 'diff' already keyed and counted the tables it compared, the others are keyed and counted here
+        keyed = [(table, *self.keyed_columns(cursor, table)) for table in large if table not in self.differences]
+        keyed_counts = self.count_differences(cursor, [(table, columns, key) for table, columns, key in keyed if key])
+        differences = self.differences | {table: (key, keyed_counts[table]) for table, _, key in keyed if key}
+
+        # a delta matches rows on their primary key, tables without a usable one are shown in full
+        return {table: differences[table] for table in large if table in differences and differences[table][0]}
+
+    @staticmethod
+    def _table_layout(
+        cursor: sqlite3.Cursor, config: DodonaConfig, table: str
+    ) -> tuple[SQLQueryResult, SQLQueryResult]:
+        cursor.execute(f"PRAGMA solution.table_info('{table}')")
+        solution_layout = SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)
+        cursor.execute(f"PRAGMA submission.table_info('{table}')")
+        submission_layout = SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)
+        return solution_layout, submission_layout
+
+    @staticmethod
+    def _object_definition(
+        cursor: sqlite3.Cursor, config: DodonaConfig, name: str
+    ) -> tuple[SQLQueryResult, SQLQueryResult]:
+        definitions = []
+        for schema in ("solution", "submission"):
+            cursor.execute(
+                f"SELECT type, name, tbl_name, sql FROM {schema}.sqlite_master WHERE upper(name) = upper(?)",  # noqa: S608
+                (name,),
+            )
+            definitions += [SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)]
+        return definitions[0], definitions[1]
+
+    @staticmethod
+    def _table_content(
+        cursor: sqlite3.Cursor, config: DodonaConfig, table: str
+    ) -> tuple[SQLQueryResult, SQLQueryResult]:
         # S608 is a false positive here: 'table' is a sqlite_master name, and 'diff' already rejects
         # the ones containing a quote, so it can't break out of the quoted identifier.
         cursor.execute(f"SELECT * FROM solution.'{table}'")  # noqa: S608
-        solution_content = SQLQueryResult.from_cursor(config.max_rows, cursor)
+        solution_content = SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)
         cursor.execute(f"SELECT * FROM submission.'{table}'")  # noqa: S608
-        submission_content = SQLQueryResult.from_cursor(config.max_rows, cursor)
+        submission_content = SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)
         return solution_content, submission_content
 
-    count_identical_columns_sql = """
-    --- ONLY IN SOLUTION ---
-    SELECT
-        sol.name,
-        0, 1, 0 -- any number values that trigger a mismatch will do
-    FROM solution.sqlite_master AS sol
-    WHERE NOT EXISTS (
-        SELECT 1
-        FROM submission.sqlite_master AS sub
-        WHERE upper(sub.name) = upper(sol.name)
-    )
-    UNION ALL
-    --- ONLY IN SUBMISSION ---
-    SELECT
-        sub.name,
-        0, 0, 1 -- any number values that trigger a mismatch will do
-    FROM submission.sqlite_master AS sub
-    WHERE NOT EXISTS (
-        SELECT 1
-        FROM solution.sqlite_master AS sol
-        WHERE upper(sol.name) = upper(sub.name)
-    )
-    UNION ALL
-    --- DIFFERENT SCHEME ---
-    SELECT
-        s.name,
-        (
-            SELECT
-                count(1)
-            FROM
-                pragma_table_info(s.name, 'solution') solTable,
-                pragma_table_info(s.name, 'submission') subTable
-            WHERE
-                solTable.name=subTable.name AND
-                solTable.type=subTable.type AND
-                solTable.'notnull'=subTable.'notnull' AND
-                (
-                    solTable.dflt_value=subTable.dflt_value OR
-                    (
-                        solTable.dflt_value IS NULL AND
-                        subTable.dflt_value IS NULL
-                    )
-                ) AND
-                solTable.pk=subTable.pk
-        ) as identical,
-        (SELECT count(1) FROM pragma_table_info(s.name, 'solution')) as solution,
-        (SELECT count(1) FROM pragma_table_info(s.name, 'submission')) as submission
-    FROM
-        solution.sqlite_master as s
-    WHERE
-        s.type = 'table' AND
-        s.name NOT LIKE 'sqlite_%'
-    """
-
+    # (changed, deleted, inserted) counts: without a key, a changed row can't be told apart from a deleted and an
+    # inserted row, so only the distinct rows that occur more often in either database are counted
     count_different_rows_sql = """
-    SELECT (
+    SELECT 0, (
         SELECT count(1) FROM (
             SELECT *, count(*) FROM solution.'{table}' A GROUP BY {column_indices}
             EXCEPT
             SELECT *, count(*) FROM submission.'{table}' B GROUP BY {column_indices}
         )
-    ) + (
+    ), (
         SELECT count(1) FROM (
             SELECT *, count(*) FROM submission.'{table}' B GROUP BY {column_indices}
             EXCEPT
@@ -234,14 +384,99 @@ class SQLDatabase:
     )
     """
 
+    # (changed, deleted, inserted) counts: rows are matched on their primary key
+    count_different_keyed_rows_sql = """
+    SELECT (
+        SELECT count(1) FROM solution.'{table}' A JOIN submission.'{table}' B ON {key_match}
+        WHERE NOT ({row_match})
+    ), (
+        SELECT count(1) FROM solution.'{table}' A
+        WHERE NOT EXISTS (SELECT 1 FROM submission.'{table}' B WHERE {key_match})
+    ), (
+        SELECT count(1) FROM submission.'{table}' B
+        WHERE NOT EXISTS (SELECT 1 FROM solution.'{table}' A WHERE {key_match})
+    )
+    """
+
+    @staticmethod
+    def keyed_columns(cursor: sqlite3.Cursor, table: str) -> tuple[list[str], list[str]]:
+        """Determine the columns and the primary key that can be used to compare a table's content row by row.
+
+        A primary key is only used if it can't contain NULL values (it is the rowid or all
+        its columns are NOT NULL), so it identifies every row. The rowid of a table without
+        a primary key is not used, because it is not part of the table's content.
+
+        Args:
+            cursor: a cursor for a database in which 'solution' is attached
+            table: name of the table
+
+        Returns:
+            (columns, primary_key) quoted column names, primary_key is empty if it can't be used
+        """
+        cursor.execute(
+            "SELECT name, type, \"notnull\", pk FROM pragma_table_info(?, 'solution') ORDER BY cid", (table,)
+        )
+        table_info = [('"' + name.replace('"', '""') + '"', *info) for name, *info in cursor.fetchall()]
+        columns = [column for column, *_ in table_info]
+        key_info = sorted(
+            (pk, column, column_type, notnull) for column, column_type, notnull, pk in table_info if pk > 0
+        )
+
+        is_rowid = len(key_info) == 1 and key_info[0][2].upper() == "INTEGER"
+        if len(key_info) == 0 or not (is_rowid or all(notnull for *_, notnull in key_info)):
+            return columns, []
+        return columns, [column for _, column, *_ in key_info]
+
+    @classmethod
+    def count_differences(
+        cls: type["SQLDatabase"], cursor: sqlite3.Cursor, tables: list[tuple[str, list[str], list[str]]]
+    ) -> dict[str, tuple[int, int, int]]:
+        """Count the differing rows of tables that have the same layout in both databases, in a single query.
+
+        Tables with a usable primary key (see 'keyed_columns') are compared with a join on that
+        key, other tables are compared as multisets of rows.
+
+        Args:
+            cursor: a cursor for a database in which 'solution' and 'submission' are attached
+            tables: (name, columns, primary_key) of the tables to compare, see 'keyed_columns'
+
+        Returns:
+            (changed, deleted, inserted) number of rows per table, see 'count_different_rows_sql' for keyless tables
+        """
+        if len(tables) == 0:
+            return {}
+
+        count_queries = []
+        for table, columns, primary_key in tables:
+            if len(primary_key) > 0:
+                count_queries += [
+                    cls.count_different_keyed_rows_sql.format(
+                        table=table,
+                        key_match=" AND ".join(f"A.{column} = B.{column}" for column in primary_key),
+                        row_match=" AND ".join(f"A.{column} IS B.{column}" for column in columns),
+                    )
+                ]
+            else:
+                count_queries += [
+                    cls.count_different_rows_sql.format(
+                        table=table, column_indices=",".join(str(x) for x in range(1, len(columns) + 1))
+                    )
+                ]
+
+        cursor.execute("UNION ALL\n".join(count_queries))
+        return {table: tuple(row) for (table, *_), row in zip(tables, cursor.fetchall(), strict=True)}
+
     def diff(self) -> tuple[list[str], list[str], list[str], list[str]]:
         """Determine the difference between the solution and submission sqlite databases.
 
         First all table names are checked, tables with a name that includes the character '
         are returned in 'incorrect_name'. Then, from the correctly named tables, all tables
         that have a different table layout are filtered, these are returned as 'diff_layout'.
+        Indexes, views and triggers are also returned as 'diff_layout' if they are missing or have
+        a different definition. Layouts and definitions are compared by their fingerprint (see SQLSchema).
         Finally, the remaining table's content is compared and a list of tables with differing
-        contents is returned as 'diff_content'.
+        contents is returned as 'diff_content', see 'count_differences'. The primary keys and counts
+        of the compared tables are kept in 'differences', so 'get_tables' doesn't compute them again.
 
         Returns:
             (incorrect_name, diff_layout, diff_content, correct) names of tables that have invalid names,
@@ -249,34 +484,23 @@ class SQLDatabase:
         """
         cursor = self.joined_cursor()
 
-        cursor.execute(self.count_identical_columns_sql)
+        solution = SQLSchema.from_cursor(cursor, "solution")
+        submission = SQLSchema.from_cursor(cursor, "submission")
 
         incorrect_name, diff_layout, check_content, correct = [], [], [], []
-        for row in cursor.fetchall():
-            table, identical, solution, submission = row
-
-            if "'" in table:
-                incorrect_name += [table]
-            elif solution != submission or solution != identical:
-                diff_layout += [table]
+        for obj, different in compare_schemas(solution, submission):
+            if "'" in obj.name:
+                incorrect_name += [obj.name]
+            elif different:
+                diff_layout += [obj.name]
             else:
-                check_content += [(table, identical)]
-
-        cursor.execute(
-            "UNION ALL\n".join(
-                [
-                    self.count_different_rows_sql.format(
-                        table=table, column_indices=",".join(str(x) for x in range(1, column_count + 1))
-                    )
-                    for table, column_count in check_content
-                ]
-            )
-        )
+                check_content += [(obj.name, *self.keyed_columns(cursor, obj.name))]
 
-        counts = [count for (count,) in cursor.fetchall()]
+        counts = self.count_differences(cursor, check_content)
+        self.differences = {table: (primary_key, counts[table]) for table, _, primary_key in check_content}
         diff_content = []
-        for i, (table, _) in enumerate(check_content):
-            if counts[i] != 0:
+        for table, *_ in check_content:
+            if any(count != 0 for count in counts[table]):
                 diff_content += [table]
             else:
                 correct += [table]
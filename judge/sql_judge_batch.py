@@ -0,0 +1,248 @@
+"""batch regrading of all submissions of an exercise.
+
+The exercise is prepared once (config defaults, database files, the parsed solution) and the
+results of the solution's SELECT queries are computed once, instead of once per submission.
+The submissions are judged by a pool of worker processes (that inherit the prepared exercise),
+the Dodona output of every submission is written to its own file in the output directory, and
+a summary (accepted/failed counts and timings) is written to 'summary.json'.
+
+Run it with `python -m judge.sql_judge_batch EXERCISE SUBMISSIONS`, in which SUBMISSIONS is a
+directory (all '.sql' files in it are judged) or a manifest file (one submission path per line,
+relative to the manifest).
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pathlib import Path
+from typing import Any
+
+from .dodona_command import ErrorType, Judgement
+from .dodona_config import DodonaConfig
+from .sql_judge_core import ExpectedOutputs, compute_expected_outputs, configure_output, prepare_exercise, run_judgement
+
+SUMMARY_FILE = "summary.json"
+
+# The prepared exercise, set before the worker processes are forked so they inherit it.
+_exercise: tuple[DodonaConfig, ExpectedOutputs] | None = None
+
+
+def find_submissions(submissions: Path) -> list[tuple[Path, Path]]:
+    """List the submissions in a directory or manifest.
+
+    Args:
+        submissions: a directory (searched recursively for '.sql' files) or a manifest file with one
+                     path per line (relative to the manifest, empty lines and '#' comments are skipped)
+
+    Returns:
+        (submission file, output name) per submission, the output name is the path relative to the
+        directory or manifest
+    """
+    if submissions.is_dir():
+        paths = sorted(submissions.rglob("*.sql"))
+        base = submissions
+    else:
+        lines = [line.strip() for line in submissions.read_text(encoding="utf-8").splitlines()]
+        base = submissions.parent
+        paths = [base / line for line in lines if line != "" and not line.startswith("#")]
+
+    return [(path, path.relative_to(base) if path.is_relative_to(base) else Path(path.name)) for path in paths]
+
+
+def judgement_status(output: str) -> str:
+    """Determine the status of a judgement from its Dodona output.
+
+    Args:
+        output: the Dodona commands written by the judge (pretty or compact)
+
+    Returns:
+        the first status that is not correct (eg. 'wrong' or 'internal error'), 'wrong' if a test
+        was not accepted, 'correct' otherwise
+    """
+    decoder = json.JSONDecoder()
+    statuses, accepted = [], True
+    position = 0
+    while position < len(output):
+        if output[position].isspace():
+            position += 1
+            continue
+        command, position = decoder.raw_decode(output, position)
+        if "status" in command:
+            statuses.append(command["status"]["enum"])
+        accepted = accepted and command.get("accepted", True)
+
+    wrong = [status for status in statuses if status not in {ErrorType.CORRECT, ErrorType.CORRECT_ANSWER}]
+    if len(wrong) > 0:
+        return wrong[0]
+    return ErrorType.CORRECT if accepted else ErrorType.WRONG
+
+
+def judge_submission_file(
+    submission: Path, output: Path, exercise: tuple[DodonaConfig, ExpectedOutputs] | None = None
+) -> dict[str, Any]:
+    """Judge one submission with the prepared exercise, in a new workdir.
+
+    Args:
+        submission: the submission file
+        output: file to write the Dodona output to
+        exercise: the prepared exercise (see 'prepare'), if None the exercise that was prepared by 'main'
+
+    Returns:
+        the status and duration of the judgement
+    """
+    exercise = exercise or _exercise
+    if exercise is None:
+        raise RuntimeError("The exercise is not prepared.")
+    exercise_config, expected_outputs = exercise
+
+    config = DodonaConfig(**vars(exercise_config))
+    config.source = str(submission)
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        config.workdir = workdir
+        try:
+            with output.open("w", encoding="utf-8") as output_file, contextlib.redirect_stdout(output_file):
+                run_judgement(config, expected_outputs, prepared=True)
+            status = judgement_status(output.read_text(encoding="utf-8"))
+        except Exception as err:  # noqa: BLE001
+            status = f"{ErrorType.INTERNAL_ERROR} ({type(err).__name__}: {err})"
+
+    return {"status": status, "duration_ms": (time.perf_counter() - start) * 1000}
+
+
+def exercise_config(exercise: Path, natural_language: str) -> DodonaConfig:
+    """Create the config that Dodona would pass to the judge, without a submission.
+
+    Args:
+        exercise: the exercise directory (with 'config.json' and the 'evaluation' directory)
+        natural_language: language of the feedback
+
+    Returns:
+        the run configuration, with the exercise's 'time_limit' (0 if it has none)
+    """
+    with (exercise / "config.json").open(encoding="utf-8") as config_file:
+        config = json.load(config_file).get("evaluation", {})
+
+    config.update(
+        {
+            "memory_limit": "0",
+            "time_limit": str(config.get("time_limit", 0)),
+            "programming_language": "sql",
+            "natural_language": natural_language,
+            "resources": str((exercise / "evaluation").resolve()),
+            "source": "",
+            "judge": str(Path(__file__).resolve().parent.parent),
+            "workdir": "",
+        }
+    )
+    return DodonaConfig.from_json(json.dumps(config))
+
+
+def prepare(config: DodonaConfig) -> tuple[ExpectedOutputs, str]:
+    """Prepare the exercise and compute the expected outputs, like the start of a judgement.
+
+    Args:
+        config: the run configuration, prepared in place
+
+    Returns:
+        (expected outputs, the Dodona output of the preparation)
+    """
+    expected_outputs: ExpectedOutputs = {}
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir), StringIO() as output:
+        config.workdir = workdir
+        with contextlib.redirect_stdout(output):
+            configure_output(config)
+            with Judgement():
+                prepare_exercise(config)
+                expected_outputs = compute_expected_outputs(config, workdir)
+        return expected_outputs, output.getvalue()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Regrade all submissions of an exercise.
+
+    Args:
+        argv: command line arguments, see `--help`
+
+    Returns:
+        exit code, 1 if the exercise is not working
+    """
+    global _exercise  # noqa: PLW0603
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("exercise", type=Path, help="exercise directory (with config.json and evaluation/)")
+    parser.add_argument("submissions", type=Path, help="directory with submissions or a manifest file")
+    parser.add_argument(
+        "-o", "--output", type=Path, default=Path("regrade"), help="output directory (default: regrade)"
+    )
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--language", default="en", help="natural language of the feedback (default: en)")
+    parser.add_argument(
+        "--result-cache-size",
+        type=int,
+        help="max size in bytes of the SELECT result cache of a worker (default: the exercise's 'result_cache_size')",
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    config = exercise_config(args.exercise, args.language)
+    if args.result_cache_size is not None:
+        config.result_cache_size = args.result_cache_size
+    expected_outputs, setup_output = prepare(config)
+    if judgement_status(setup_output) != ErrorType.CORRECT:
+        print(f"The exercise is not working:\n{setup_output}", file=sys.stderr)
+        return 1
+    _exercise = (config, expected_outputs)
+    setup_time = time.perf_counter() - start
+
+    submissions = find_submissions(args.submissions)
+    outputs = [args.output / name.with_suffix(".json") for _, name in submissions]
+    paths = [path.resolve() for path, _ in submissions]
+    outputs = [output.resolve() for output in outputs]
+
+    if args.workers > 1 and len(submissions) > 1:
+        # forked workers inherit the prepared exercise, it isn't pickled for every submission
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(args.workers, mp_context=context) as executor:
+            results = list(executor.map(judge_submission_file, paths, outputs))
+    else:
+        results = [judge_submission_file(path, output) for path, output in zip(paths, outputs, strict=True)]
+
+    for (_, name), output, result in zip(submissions, outputs, results, strict=True):
+        result.update(submission=str(name), output=str(output.relative_to(args.output.resolve())))
+
+    accepted = sum(1 for result in results if result["status"] == ErrorType.CORRECT)
+    errors = sum(1 for result in results if result["status"].startswith(ErrorType.INTERNAL_ERROR))
+    summary = {
+        "exercise": str(args.exercise),
+        "submissions": len(results),
+        "accepted": accepted,
+        "failed": len(results) - accepted,
+        "errors": errors,
+        "workers": args.workers,
+        "setup_s": setup_time,
+        "duration_s": time.perf_counter() - start,
+        "judge_ms_total": sum(result["duration_ms"] for result in results),
+        "results": results,
+    }
+    args.output.mkdir(parents=True, exist_ok=True)
+    (args.output / SUMMARY_FILE).write_text(json.dumps(summary, indent=1) + "\n", encoding="utf-8")
+
+    print(
+        f"{summary['submissions']} submissions: {accepted} accepted, {summary['failed']} failed "
+        f"({errors} errors) in {summary['duration_s']:.1f} s (setup {setup_time:.1f} s)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
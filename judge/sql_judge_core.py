@@ -0,0 +1,792 @@
+"""the steps of judging a submission, shared by the judge script and batch regrading.
+
+A single run (see 'sql_judge.py') configures its output, prepares the exercise and judges the
+submission. Batch regrading prepares the exercise (and computes the expected outputs) only once,
+and judges every submission with a copy of the prepared config.
+"""
+
+import os
+import sqlite3
+from contextlib import nullcontext
+from pathlib import Path
+
+from .dodona_command import (
+    Annotation,
+    AnnotationSeverity,
+    Context,
+    DodonaCommand,
+    DodonaException,
+    DodonaOutput,
+    ErrorType,
+    Judgement,
+    Message,
+    MessageFormat,
+    MessagePermission,
+    OutputBudget,
+    OutputFormat,
+    Tab,
+    TestCase,
+)
+from .dodona_config import DodonaConfig
+from .exercise_bundle import ExerciseBundle
+from .instrumentation import CONTEXT_SPAN, instrumentation
+from .replay_cache import ReplayCache
+from .sql_database import SQLDatabase, sql_run_pragma_startup_queries
+from .sql_judge_non_select_feedback import non_select_feedback
+from .sql_judge_select_feedback import select_feedback
+from .sql_query import SQLQuery
+from .sql_query_result import SQLQueryResult
+from .sql_result_cache import SQLResultCache, is_deterministic
+from .sql_result_comparator import SQLResultComparator
+from .translator import Translator
+
+# The blocks after which the buffered output is written, by 'output_flush_at' (None: after every command).
+FLUSH_AT_BLOCKS: dict[str, type | None] = {"command": None, "context": Context, "tab": Tab, "judgement": Judgement}
+
+# The results of the solution's SELECT queries, by (query index, database name), see 'compute_expected_outputs'.
+# Not by query text: the same query can return another result after the database was changed.
+ExpectedOutputs = dict[tuple[int, str], SQLQueryResult]
+
+
+def run_judgement(
+    config: DodonaConfig, expected_outputs: ExpectedOutputs | None = None, *, prepared: bool = False
+) -> None:
+    """Judge a submission and write the Dodona output to stdout.
+
+    Args:
+        config: the run configuration
+        expected_outputs: results of the solution queries that don't have to be executed again
+        prepared: the config was already prepared by 'prepare_exercise' (eg. a copy of a prepared config),
+                  if False, it's prepared with the exercise's bundle (if it is up to date) or 'prepare_exercise'
+    """
+    trace_file, metrics_file = configure_output(config)
+    replay_cache: ReplayCache | None = None
+
+    with (
+        instrumentation.record(trace_file, metrics_file, {"exercise": str(Path(config.resources).parent)}),
+        instrumentation.span("judgement"),
+        Judgement() as judgement,
+    ):
+        if not prepared:
+            bundle = ExerciseBundle.load(config)
+            if bundle is None:
+                prepare_exercise(config)
+            else:
+                bundled_outputs = bundle.apply(config)
+                derive_settings(config)
+                expected_outputs = bundled_outputs if expected_outputs is None else expected_outputs
+        start_submission(config)
+
+        replay_cache = ReplayCache.from_config(config)
+        # the feedback on a query that isn't deterministic can differ for an identical submission
+        queries = [*config.solution_queries, *config.submission_queries]
+        if replay_cache is not None and not all(is_deterministic(query) for query in queries):
+            replay_cache = None
+        if replay_cache is None or not replay_cache.replay(config, judgement):
+            if replay_cache is not None:
+                replay_cache.record()
+            judge_submission(config, expected_outputs)
+
+    # the judgement is only stored once it's closed, and not if the judge crashed
+    if replay_cache is not None:
+        replay_cache.store()
+
+
+def configure_output(config: DodonaConfig) -> tuple[Path | None, Path | None]:
+    """Configure the output and instrumentation of a run, before its Judgement starts.
+
+    Args:
+        config: the run configuration
+
+    Returns:
+        (trace file, metrics file), None if not enabled
+    """
+    # Set 'output_format' to "pretty" and 'output_flush_at' to "command" if not set
+    # (configured before the Judgement starts, so all commands are written the same way; invalid values
+    # fall back to these defaults, and are reported by 'start_submission')
+    config.output_format = str(getattr(config, "output_format", OutputFormat.PRETTY))
+    config.output_flush_at = str(getattr(config, "output_flush_at", "command"))
+    output_format = OutputFormat(config.output_format) if config.output_format in list(OutputFormat) else None
+    DodonaCommand.output = DodonaOutput(
+        output_format or OutputFormat.PRETTY, FLUSH_AT_BLOCKS.get(config.output_flush_at)
+    )
+
+    # Set 'timing_feedback' to False and 'trace' to the SQL_JUDGE_TRACE environment variable (or False) if not set
+    # (configured before the Judgement starts, so the whole run is timed)
+    config.timing_feedback = bool(getattr(config, "timing_feedback", False))
+    config.trace = bool(getattr(config, "trace", os.environ.get("SQL_JUDGE_TRACE", "") not in {"", "0"}))
+    trace_file = Path(config.workdir) / "trace.json" if config.trace else None
+    # Set 'metrics_file' to the SQL_JUDGE_METRICS environment variable (or "", no metrics) if not set
+    config.metrics_file = str(getattr(config, "metrics_file", os.environ.get("SQL_JUDGE_METRICS", "")))
+    metrics_file = Path(config.workdir) / config.metrics_file if config.metrics_file != "" else None
+    # Set 'memory_profile' to False if not set
+    config.memory_profile = bool(getattr(config, "memory_profile", False))
+    # Set 'replay_cache_dir' to the SQL_JUDGE_REPLAY_CACHE environment variable (or "", no cache) if not set
+    # (a setting of the judge host, so it's not part of a prepared exercise's bundle)
+    config.replay_cache_dir = str(getattr(config, "replay_cache_dir", os.environ.get("SQL_JUDGE_REPLAY_CACHE", "")))
+    instrumentation.memory = config.memory_profile
+    instrumentation.enabled = (
+        config.timing_feedback or config.trace or metrics_file is not None or config.memory_profile
+    )
+
+    return trace_file, metrics_file
+
+
+def prepare_exercise(config: DodonaConfig) -> None:
+    """Check the exercise configuration, set the defaults of all options and parse the solution.
+
+    Nothing in here depends on the submission. Should be called within the Judgement, and only
+    once per config (eg. 'database_files' is resolved in place).
+
+    Args:
+        config: the run configuration
+
+    Raises:
+        DodonaException: if the exercise is not configured correctly
+    """
+    config.sanity_check()
+
+    # Initiate translator
+    config.translator = Translator.from_str(config.natural_language)
+
+    # Set 'output_limit' to 0 (no limit) if not set
+    config.output_limit = int(getattr(config, "output_limit", 0))
+
+    # Set 'max_rows' to 100 if not set
+    config.max_rows = int(getattr(config, "max_rows", 100))
+
+    # Set 'max_value_length' to 1000 if not set
+    config.max_value_length = int(getattr(config, "max_value_length", 1000))
+
+    # Set 'table_delta_min_rows' to 'max_rows' if not set
+    config.table_delta_min_rows = int(getattr(config, "table_delta_min_rows", config.max_rows))
+
+    # Set 'semicolon_warning' to True if not set
+    config.semicolon_warning = bool(getattr(config, "semicolon_warning", True))
+
+    # Set 'order_unordered_rows' to False if not set
+    config.order_unordered_rows = bool(getattr(config, "order_unordered_rows", False))
+
+    # Set 'strict_identical_order_by' to True if not set
+    config.strict_identical_order_by = bool(getattr(config, "strict_identical_order_by", True))
+
+    # Set 'allow_different_column_order' to True if not set
+    config.allow_different_column_order = bool(getattr(config, "allow_different_column_order", True))
+
+    # Set 'float_absolute_tolerance' and 'float_relative_tolerance' to 0 if not set
+    config.float_absolute_tolerance = float(getattr(config, "float_absolute_tolerance", 0))
+    config.float_relative_tolerance = float(getattr(config, "float_relative_tolerance", 0))
+
+    # Set 'text_case_insensitive' and 'text_normalize_whitespace' to False if not set
+    config.text_case_insensitive = bool(getattr(config, "text_case_insensitive", False))
+    config.text_normalize_whitespace = bool(getattr(config, "text_normalize_whitespace", False))
+
+    # Set 'blob_compare_digest' to False if not set
+    config.blob_compare_digest = bool(getattr(config, "blob_compare_digest", False))
+
+    # Set 'fail_fast' to False if not set
+    config.fail_fast = bool(getattr(config, "fail_fast", False))
+
+    # Set 'compare_in_database' to False if not set
+    config.compare_in_database = bool(getattr(config, "compare_in_database", False))
+
+    # Set 'replay_cache_size' to 100 MB if not set
+    config.replay_cache_size = int(getattr(config, "replay_cache_size", 100_000_000))
+
+    # Set 'result_cache_size' to 0 (no cache) if not set
+    config.result_cache_size = int(getattr(config, "result_cache_size", 0))
+
+    # Set 'skip_equivalent_selects' to False if not set
+    config.skip_equivalent_selects = bool(getattr(config, "skip_equivalent_selects", False))
+
+    # Set 'pragma_startup_queries' to "" if not set
+    config.pragma_startup_queries = str(getattr(config, "pragma_startup_queries", ""))
+
+    # Set 'pre_execution_forbidden_symbolregex' to [".*sqlite_(temp_)?(master|schema).*", "pragma"] if not set
+    defaults = [".*sqlite_(temp_)?(master|schema).*", "pragma"]
+    config.pre_execution_forbidden_symbolregex = list(getattr(config, "pre_execution_forbidden_symbolregex", defaults))
+    # Set 'pre_execution_mandatory_symbolregex' to [] if not set
+    config.pre_execution_mandatory_symbolregex = list(getattr(config, "pre_execution_mandatory_symbolregex", []))
+    # Set 'pre_execution_forbidden_fullregex' to [] if not set
+    config.pre_execution_forbidden_fullregex = list(getattr(config, "pre_execution_forbidden_fullregex", []))
+    # Set 'pre_execution_mandatory_fullregex' to [] if not set
+    config.pre_execution_mandatory_fullregex = list(getattr(config, "pre_execution_mandatory_fullregex", []))
+
+    # Set 'post_execution_forbidden_symbolregex' to [] if not set
+    config.post_execution_forbidden_symbolregex = list(getattr(config, "post_execution_forbidden_symbolregex", []))
+    # Set 'post_execution_mandatory_symbolregex' to [] if not set
+    config.post_execution_mandatory_symbolregex = list(getattr(config, "post_execution_mandatory_symbolregex", []))
+    # Set 'post_execution_forbidden_fullregex' to [] if not set
+    config.post_execution_forbidden_fullregex = list(getattr(config, "post_execution_forbidden_fullregex", []))
+    # Set 'post_execution_mandatory_fullregex' to [] if not set
+    config.post_execution_mandatory_fullregex = list(getattr(config, "post_execution_mandatory_fullregex", []))
+
+    if hasattr(config, "database_files"):
+        config.database_files = [
+            (str(filename), str(Path(config.resources) / filename)) for filename in config.database_files
+        ]
+
+        for _, file in config.database_files:
+            if not Path(file).exists():
+                raise DodonaException(
+                    config.translator.error_status(ErrorType.INTERNAL_ERROR),
+                    permission=MessagePermission.STAFF,
+                    description=f"Could not find database file: '{file}'.",
+                    format=MessageFormat.TEXT,
+                )
+    else:
+        # Set 'database_dir' to "." if not set
+        config.database_dir = str(getattr(config, "database_dir", "."))
+        config.database_dir = str(Path(config.resources) / config.database_dir)
+
+        if not Path(config.database_dir).exists():
+            raise DodonaException(
+                config.translator.error_status(ErrorType.INTERNAL_ERROR),
+                permission=MessagePermission.STAFF,
+                description=f"Could not find database directory: '{config.database_dir}'.",
+                format=MessageFormat.TEXT,
+            )
+
+        config.database_files = [
+            (path.name, str(path)) for path in sorted(Path(config.database_dir).iterdir()) if path.suffix == ".sqlite"
+        ]
+
+    if len(config.database_files) == 0:
+        raise DodonaException(
+            config.translator.error_status(ErrorType.INTERNAL_ERROR),
+            permission=MessagePermission.STAFF,
+            description="Could not find database files. "
+            "Make sure that the database directory contains '*.sqlite' "
+            "files or a valid 'database_files' option is provided.",
+            format=MessageFormat.TEXT,
+        )
+
+    # Set 'solution_sql' to "./solution.sql" if not set
+    config.solution_sql = str(getattr(config, "solution_sql", "./solution.sql"))
+    config.solution_sql = str(Path(config.resources) / config.solution_sql)
+
+    if not Path(config.solution_sql).exists():
+        raise DodonaException(
+            config.translator.error_status(ErrorType.INTERNAL_ERROR),
+            permission=MessagePermission.STAFF,
+            description=f"Could not find solution file: '{config.solution_sql}'.",
+            format=MessageFormat.TEXT,
+        )
+
+    derive_settings(config)
+
+
+def derive_settings(config: DodonaConfig) -> None:
+    """Create the objects that are derived from the settings of an exercise, and parse the solution.
+
+    These are not stored in a bundle (see 'ExerciseBundle'), so this is also called after a bundle is applied.
+
+    Args:
+        config: the run configuration, with the defaults of all options set (see 'prepare_exercise')
+
+    Raises:
+        DodonaException: if the solution file is empty
+    """
+    config.result_comparator = SQLResultComparator(
+        config.float_absolute_tolerance,
+        config.float_relative_tolerance,
+        case_insensitive=config.text_case_insensitive,
+        normalize_whitespace=config.text_normalize_whitespace,
+        compare_blob_digest=config.blob_compare_digest,
+    )
+    config.result_cache = SQLResultCache(config.result_cache_size)
+
+    # Parse solution query
+    with Path(config.solution_sql).open(encoding="utf-8") as sql_file, instrumentation.span("parse"):
+        config.raw_solution_file = sql_file.read()
+        config.solution_queries = SQLQuery.from_raw_input(config.raw_solution_file)
+
+        if len(config.solution_queries) == 0:
+            raise DodonaException(
+                config.translator.error_status(ErrorType.INTERNAL_ERROR),
+                permission=MessagePermission.STAFF,
+                description="Solution file is empty.",
+                format=MessageFormat.TEXT,
+            )
+
+
+def compute_expected_outputs(config: DodonaConfig, workdir: str) -> ExpectedOutputs:
+    """Run all solution queries once, and keep the results of the SELECT queries.
+
+    The solution queries are run in the same order as when judging a submission (every query on
+    every database), so every result is computed on the same database state. The results of
+    SELECT queries that are compared inside SQLite are not kept.
+
+    Args:
+        config: a prepared run configuration, see 'prepare_exercise'
+        workdir: scratch directory for the database copies
+
+    Returns:
+        the expected outputs, to be passed to 'judge_submission'
+
+    Raises:
+        DodonaException: if the startup script or a solution query is not working
+    """
+    expected_outputs: ExpectedOutputs = {}
+    for query_nr, solution_query in enumerate(config.solution_queries):
+        for db_name, db_file in config.database_files:
+            with SQLDatabase(db_file, workdir, db_name) as db:
+                cursor = run_solution_query(config, db, solution_query, compare_in_database=False)
+                if solution_query.is_select and not config.compare_in_database:
+                    expected_output = SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)
+                    expected_outputs[(query_nr, db_name)] = expected_output
+    return expected_outputs
+
+
+def start_submission(config: DodonaConfig) -> None:
+    """Limit the output and parse the submission.
+
+    Should be called within the Judgement, with a prepared config (see 'prepare_exercise').
+
+    Args:
+        config: the prepared run configuration
+
+    Raises:
+        DodonaException: if the output settings or the replay cache directory are not valid
+    """
+    if config.output_format not in list(OutputFormat) or config.output_flush_at not in FLUSH_AT_BLOCKS:
+        raise DodonaException(
+            config.translator.error_status(ErrorType.INTERNAL_ERROR),
+            permission=MessagePermission.STAFF,
+            description=f"Invalid output settings: 'output_format' should be one of {[str(f) for f in OutputFormat]} "
+            f"and 'output_flush_at' one of {list(FLUSH_AT_BLOCKS)}.",
+        )
+    # the workdir is different for every submission, so a cache in it would never be reused
+    if config.replay_cache_dir != "" and not Path(config.replay_cache_dir).is_absolute():
+        raise DodonaException(
+            config.translator.error_status(ErrorType.INTERNAL_ERROR),
+            permission=MessagePermission.STAFF,
+            description=f"Invalid 'replay_cache_dir' {config.replay_cache_dir!r}: it should be an absolute path.",
+        )
+
+    if config.output_limit > 0:
+        DodonaCommand.output.budget = OutputBudget(
+            config.output_limit,
+            lambda omitted: config.translator.translate(Translator.Text.OUTPUT_LIMIT_OMITTED_MESSAGES, omitted=omitted),
+        )
+
+    if instrumentation.enabled:
+        for _, file in config.database_files:
+            instrumentation.count("database_bytes", Path(file).stat().st_size)
+
+    # Parse submission query
+    with Path(config.source).open(encoding="utf-8") as sql_file, instrumentation.span("parse"):
+        config.raw_submission_file = sql_file.read()
+        config.submission_queries = SQLQuery.from_raw_input(config.raw_submission_file)
+
+
+def judge_submission(config: DodonaConfig, expected_outputs: ExpectedOutputs | None = None) -> None:
+    """Judge every query of the parsed submission on every database.
+
+    Should be called within the Judgement, after 'start_submission'.
+
+    Args:
+        config: the prepared run configuration, with the parsed submission
+        expected_outputs: results of the solution queries that don't have to be executed again
+
+    Raises:
+        DodonaException: if the submission is wrong
+    """
+    if len(config.submission_queries) > len(config.solution_queries):
+        raise DodonaException(
+            config.translator.error_status(ErrorType.RUNTIME_ERROR),
+            permission=MessagePermission.STUDENT,
+            description=config.translator.translate(
+                Translator.Text.SUBMISSION_CONTAINS_MORE_QUERIES,
+                submitted=len(config.submission_queries),
+                expected=len(config.solution_queries),
+            ),
+            format=MessageFormat.CALLOUT_DANGER,
+        )
+
+    if config.semicolon_warning and (
+        len(config.submission_queries) == 0 or not config.submission_queries[-1].has_ending_semicolon
+    ):
+        with Annotation(
+            row=config.raw_submission_file.rstrip().count("\n"),
+            type=AnnotationSeverity.WARNING,
+            text=config.translator.translate(Translator.Text.ADD_A_SEMICOLON),
+        ):
+            pass
+
+    # databases that are skipped by 'fail_fast', their state no longer matches the submission's queries
+    skipped_databases: set[str] = set()
+    for query_nr, solution_query in enumerate(config.solution_queries):
+        with (
+            Tab(f"Query {1 + query_nr}"),
+            instrumentation.report(config.timing_feedback, config.memory_profile)
+            if config.timing_feedback or config.memory_profile
+            else nullcontext(),
+            instrumentation.span("tab", title=f"Query {1 + query_nr}"),
+        ):
+            judge_query(config, query_nr, solution_query, expected_outputs, skipped_databases=skipped_databases)
+
+
+def judge_query(
+    config: DodonaConfig,
+    query_nr: int,
+    solution_query: SQLQuery,
+    expected_outputs: ExpectedOutputs | None = None,
+    *,
+    skipped_databases: set[str] | None = None,
+) -> None:
+    """Judge a single submission query on every database.
+
+    With 'fail_fast', the query is not judged on the remaining databases once it's wrong on one
+    of them, and those databases are skipped for the following queries as well (as those queries
+    depend on the changes of this one). One message, in the tab of the query that was wrong, lists
+    the skipped databases.
+
+    Args:
+        config: the prepared run configuration, with the parsed submission
+        query_nr: index of the query
+        solution_query: the corresponding solution query
+        expected_outputs: results of the solution queries that don't have to be executed again
+        skipped_databases: names of the databases that were skipped for an earlier query, updated in place
+
+    Raises:
+        DodonaException: if the submission query is missing, wrong or not allowed
+    """
+    if query_nr >= len(config.submission_queries):
+        raise DodonaException(
+            config.translator.error_status(ErrorType.RUNTIME_ERROR),
+            permission=MessagePermission.STUDENT,
+            description=config.translator.translate(
+                Translator.Text.SUBMISSION_CONTAINS_LESS_QUERIES,
+                expected=len(config.solution_queries),
+                submitted=len(config.submission_queries),
+            ),
+            format=MessageFormat.CALLOUT_DANGER,
+        )
+
+    submission_query = config.submission_queries[query_nr]
+
+    if solution_query.query_type != submission_query.query_type:
+        raise DodonaException(
+            config.translator.error_status(ErrorType.RUNTIME_ERROR),
+            permission=MessagePermission.STUDENT,
+            description=config.translator.translate(
+                Translator.Text.SUBMISSION_WRONG_QUERY_TYPE,
+                submitted=submission_query.query_type,
+            ),
+            format=MessageFormat.CALLOUT_DANGER,
+        )
+
+    match = submission_query.match_multi_regex(
+        config.pre_execution_forbidden_symbolregex,
+        config.pre_execution_mandatory_symbolregex,
+        config.pre_execution_forbidden_fullregex,
+        config.pre_execution_mandatory_fullregex,
+    )
+    if match is not None:
+        raise DodonaException(
+            config.translator.error_status(ErrorType.RUNTIME_ERROR),
+            permission=MessagePermission.STUDENT,
+            description=config.translator.translate(
+                match[0],
+                value=match[1],
+            ),
+            format=MessageFormat.CALLOUT_DANGER,
+        )
+
+    skipped_databases = set() if skipped_databases is None else skipped_databases
+    skipped_before = set(skipped_databases)
+    for db_name, db_file in config.database_files:
+        if db_name in skipped_databases:
+            continue
+        accepted = judge_context(
+            config,
+            solution_query,
+            submission_query,
+            db_name,
+            db_file,
+            query_nr=query_nr,
+            expected_outputs=expected_outputs,
+        )
+        if config.fail_fast and not accepted:
+            skipped_databases.update(name for name, _ in config.database_files if name != db_name)
+            break
+
+    skipped = [name for name, _ in config.database_files if name in skipped_databases - skipped_before]
+    if len(skipped) > 0:
+        with Message(
+            format=MessageFormat.CALLOUT_INFO,
+            description=config.translator.translate(
+                Translator.Text.SKIPPED_CONTEXTS, count=len(skipped), databases=", ".join(skipped)
+            ),
+        ):
+            pass
+
+
+def judge_context(  # noqa: C901, PLR0912, PLR0913, PLR0915
+    config: DodonaConfig,
+    solution_query: SQLQuery,
+    submission_query: SQLQuery,
+    db_name: str,
+    db_file: str,
+    *,
+    query_nr: int,
+    expected_outputs: ExpectedOutputs | None = None,
+) -> bool:
+    """Judge a single submission query on a single database, as one Dodona Context.
+
+    The results of SELECT queries are taken from the result cache if they ran before on the same
+    database state (see 'SQLResultCache'). With 'skip_equivalent_selects', a submission query that
+    is equivalent to the solution query is not run, its result is the solution's (see
+    'is_equivalent_select').
+
+    Args:
+        config: the prepared run configuration, with the parsed submission
+        solution_query: the solution query
+        submission_query: the submission query
+        db_name: name of the database
+        db_file: exercise's sqlite start database file
+        query_nr: index of the query
+        expected_outputs: results of the solution queries that don't have to be executed again
+
+    Returns:
+        if the submission query was accepted on this database
+
+    Raises:
+        DodonaException: if the solution, startup script or submission query is not working
+    """
+    # Only select results can be compared inside SQLite, the other queries are compared by 'diff'
+    compare_in_database = config.compare_in_database and solution_query.is_select
+
+    solution_key = submission_key = None
+    if not compare_in_database:
+        solution_history, submission_history = config.solution_queries[:query_nr], config.submission_queries[:query_nr]
+        solution_key = config.result_cache.key(config, db_file, solution_history, solution_query)
+        submission_key = config.result_cache.key(config, db_file, submission_history, submission_query)
+    equivalent = not compare_in_database and is_equivalent_select(config, query_nr, solution_query, submission_query)
+
+    with (
+        Context(),
+        instrumentation.span(CONTEXT_SPAN, database=db_name),
+        TestCase(
+            format=MessageFormat.SQL,
+            description=f"-- sqlite3 {db_name}\n{submission_query.without_comments}",
+        ) as testcase,
+    ):
+        expected_output: SQLQueryResult
+        generated_output: SQLQueryResult
+        result_diff = None
+        key = (query_nr, db_name)
+
+        with SQLDatabase(db_file, config.workdir, db_name) as db:
+            if expected_outputs is not None and key in expected_outputs and not compare_in_database:
+                # copied, as the feedback might reorder its rows and columns
+                expected_output = expected_outputs[key].copy()
+                config.result_cache.put(solution_key, expected_output)
+            elif (cached_output := config.result_cache.get(solution_key)) is not None:
+                expected_output = cached_output
+            else:
+                cursor = run_solution_query(config, db, solution_query, compare_in_database)
+
+                # RENDER SOLUTION QUERY OUTPUT
+                if not compare_in_database:
+                    with instrumentation.span("solution result"):
+                        expected_output = SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)
+                        instrumentation.annotate(rows=expected_output.row_count)
+                    config.result_cache.put(solution_key, expected_output)
+
+            if equivalent:
+                generated_output = expected_output.copy()
+                instrumentation.count("equivalent_selects_skipped")
+            elif (cached_output := config.result_cache.get(submission_key)) is not None:
+                generated_output = cached_output
+            else:
+                cursor = run_submission_query(config, db, submission_query, compare_in_database)
+
+                # RENDER SUBMISSION QUERY OUTPUT
+                if compare_in_database:
+                    with instrumentation.span("compare"):
+                        result_diff = db.compare_results(config)
+                        instrumentation.annotate(
+                            expected_rows=result_diff.expected_row_count,
+                            generated_rows=result_diff.generated_row_count,
+                        )
+                    expected_output, generated_output = result_diff.expected, result_diff.generated
+                else:
+                    with instrumentation.span("submission result"):
+                        generated_output = SQLQueryResult.from_cursor(config.max_rows, cursor, config.max_value_length)
+                        instrumentation.annotate(rows=generated_output.row_count)
+                    config.result_cache.put(submission_key, generated_output)
+
+        with instrumentation.span("feedback"):
+            if not solution_query.is_select:
+                non_select_feedback(config, testcase, db_name, db_file, solution_query)
+            else:
+                select_feedback(
+                    config,
+                    testcase,
+                    expected_output,
+                    generated_output,
+                    solution_query,
+                    submission_query,
+                    result_diff,
+                )
+
+        if getattr(testcase, "accepted", True):  # Only run if all other tests are OK
+            match = submission_query.match_multi_regex(
+                config.post_execution_forbidden_symbolregex,
+                config.post_execution_mandatory_symbolregex,
+                config.post_execution_forbidden_fullregex,
+                config.post_execution_mandatory_fullregex,
+            )
+            if match is not None:
+                raise DodonaException(
+                    config.translator.error_status(ErrorType.WRONG),
+                    recover_at=Context,  # Continue testing all other contexts
+                    permission=MessagePermission.STUDENT,
+                    description=config.translator.translate(
+                        match[0],
+                        value=match[1],
+                    ),
+                    format=MessageFormat.CALLOUT_DANGER,
+                )
+
+    # set by the feedback, or by an exception that recovered at the Context
+    return getattr(testcase, "accepted", True)
+
+
+def is_equivalent_select(
+    config: DodonaConfig, query_nr: int, solution_query: SQLQuery, submission_query: SQLQuery
+) -> bool:
+    """Check if the submission query returns the same result as the solution query, without running it.
+
+    This is the case for a deterministic SELECT query that is equivalent to the solution query
+    (see 'SQLQuery.equivalence_key'), on a database in the same state: the earlier queries of the
+    submission made the same changes as those of the solution (ie. they are the same, or both
+    SELECT queries).
+
+    Args:
+        config: the prepared run configuration, with the parsed submission
+        query_nr: index of the query
+        solution_query: the solution query
+        submission_query: the submission query
+
+    Returns:
+        False if the submission query has to be run, or 'skip_equivalent_selects' is not set
+    """
+    if not config.skip_equivalent_selects or not solution_query.is_select or not is_deterministic(submission_query):
+        return False
+    if submission_query.equivalence_key != solution_query.equivalence_key:
+        return False
+
+    history = zip(config.solution_queries[:query_nr], config.submission_queries[:query_nr], strict=True)
+    return all(
+        (solution.is_select and submission.is_select)
+        or (solution.without_comments.strip() == submission.without_comments.strip() and is_deterministic(solution))
+        for solution, submission in history
+    )
+
+
+def run_solution_query(
+    config: DodonaConfig,
+    db: SQLDatabase,
+    solution_query: SQLQuery,
+    compare_in_database: bool,  # noqa: FBT001
+) -> sqlite3.Cursor:
+    """Run the startup script and the solution query on the solution database.
+
+    Args:
+        config: the prepared run configuration
+        db: the opened databases
+        solution_query: the solution query
+        compare_in_database: materialize the results in SQLite, instead of executing the query on the cursor
+
+    Returns:
+        the cursor on which the solution query was executed
+
+    Raises:
+        DodonaException: if the startup script or the solution query is not working
+    """
+    cursor = db.solution_cursor()
+    run_startup_queries(config, cursor)
+
+    # RUN SOLUTION QUERY
+    try:
+        with instrumentation.span("solution query", statement=solution_query.without_comments):
+            if compare_in_database:
+                db.materialize_select(cursor, "expected", solution_query)
+            else:
+                cursor.execute(solution_query.without_comments)
+    except Exception as err:
+        raise DodonaException(
+            config.translator.error_status(ErrorType.INTERNAL_ERROR),
+            permission=MessagePermission.STAFF,
+            description=f"Solution is not working ({type(err).__name__}):\n    {err}",
+            format=MessageFormat.CODE,
+        ) from err
+
+    return cursor
+
+
+def run_submission_query(
+    config: DodonaConfig,
+    db: SQLDatabase,
+    submission_query: SQLQuery,
+    compare_in_database: bool,  # noqa: FBT001
+) -> sqlite3.Cursor:
+    """Run the startup script and the submission query on the submission database.
+
+    Args:
+        config: the prepared run configuration
+        db: the opened databases
+        submission_query: the submission query
+        compare_in_database: materialize the results in SQLite, instead of executing the query on the cursor
+
+    Returns:
+        the cursor on which the submission query was executed
+
+    Raises:
+        DodonaException: if the startup script or the submission query is not working
+    """
+    cursor = db.submission_cursor()
+    run_startup_queries(config, cursor)
+
+    # RUN SUBMISSION QUERY
+    try:
+        with instrumentation.span("submission query", statement=submission_query.without_comments):
+            if compare_in_database:
+                db.materialize_select(cursor, "generated", submission_query)
+            else:
+                cursor.execute(submission_query.without_comments)
+    except Exception as err:
+        raise DodonaException(
+            config.translator.error_status(ErrorType.COMPILATION_ERROR),
+            permission=MessagePermission.STUDENT,
+            description=f"{type(err).__name__}:\n    {err}",
+            format=MessageFormat.CODE,
+        ) from err
+
+    return cursor
+
+
+def run_startup_queries(config: DodonaConfig, cursor: sqlite3.Cursor) -> None:
+    """Run the exercise's 'pragma_startup_queries' (if any) on a new connection.
+
+    Args:
+        config: the prepared run configuration
+        cursor: cursor of the solution or submission database
+
+    Raises:
+        DodonaException: if the startup script is not working
+    """
+    try:
+        if config.pragma_startup_queries != "":
+            with instrumentation.span("startup"):
+                sql_run_pragma_startup_queries(cursor, config.pragma_startup_queries)
+    except Exception as err:
+        raise DodonaException(
+            config.translator.error_status(ErrorType.INTERNAL_ERROR),
+            permission=MessagePermission.STAFF,
+            description=f"Startup script is not working ({type(err).__name__}):\n    {err}",
+            format=MessageFormat.CODE,
+        ) from err
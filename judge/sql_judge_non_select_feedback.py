@@ -5,16 +5,61 @@ from types import SimpleNamespace
 from .dodona_command import (
     DodonaException,
     ErrorType,
+    Message,
     MessageFormat,
     MessagePermission,
     Test,
 )
 from .dodona_config import DodonaConfig
-from .sql_database import SQLDatabase
+from .instrumentation import instrumentation
+from .sql_database import SQLDatabase, SQLTables
 from .sql_query import SQLQuery
 from .translator import Translator
 
 
+def table_content_feedback(config: DodonaConfig, testcase: SimpleNamespace, tables: SQLTables, table: str) -> None:
+    """Show the content of a table that differs between the solution and submission.
+
+    Tables with a primary key and more than 'table_delta_min_rows' rows are shown as a delta:
+    only the differing rows and their neighbouring rows, see SQLTableDelta.
+
+    Args:
+        config: parsed config received from Dodona
+        testcase: testcase object used to return values to Dodona
+        tables: the retrieved contents, see 'SQLDatabase.get_tables'
+        table: name of the table with differing content
+    """
+    table_delta = tables.deltas.get(table)
+    if table_delta is not None:
+        solution_content, submission_content = table_delta.expected, table_delta.generated
+    else:
+        solution_content, submission_content = tables.contents[table]
+
+    with Test(
+        {
+            "description": config.translator.translate(Translator.Text.COMPARING_TABLE_CONTENT, table=table),
+            "format": MessageFormat.MARKDOWN,
+        },
+        solution_content.csv_out,
+        format="csv",
+    ) as test:
+        test.generated = submission_content.csv_out
+        test.status = config.translator.error_status(ErrorType.WRONG)
+        testcase.accepted = False  # Signal that following on-success tests should not run
+
+        if table_delta is not None:
+            with Message(
+                format=MessageFormat.MARKDOWN,
+                description=config.translator.translate(
+                    Translator.Text.TABLE_DELTA_SUMMARY,
+                    missing=table_delta.missing_count,
+                    unexpected=table_delta.unexpected_count,
+                    changed=table_delta.changed_count,
+                ),
+            ):
+                pass
+
+
 def non_select_feedback(
     config: DodonaConfig, testcase: SimpleNamespace, db_name: str, db_file: str, solution_query: SQLQuery
 ) -> None:
@@ -31,7 +76,8 @@ def non_select_feedback(
         DodonaException: custom exception that is automatically handled by the 'with' blocks
     """
     with SQLDatabase(db_file, config.workdir, db_name) as database:
-        incorrect_name, diff_layout, diff_content, correct = database.diff()
+        with instrumentation.span("diff"):
+            incorrect_name, diff_layout, diff_content, correct = database.diff()
 
         if len(incorrect_name) > 0:
             raise DodonaException(
@@ -44,22 +90,27 @@ def non_select_feedback(
                 format=MessageFormat.CALLOUT_DANGER,
             )
 
+        try:
+            with instrumentation.span("retrieve"):
+                tables = database.get_tables(config, diff_layout, diff_content, config.table_delta_min_rows)
+        except Exception as err:
+            raise DodonaException(
+                config.translator.error_status(ErrorType.INTERNAL_ERROR),
+                permission=MessagePermission.STAFF,
+                description=f"Could not retrieve solution layout & content ({type(err).__name__}):\n    {err}",
+                format=MessageFormat.CODE,
+            ) from err
+
         for table in diff_layout:
-            try:
-                solution_layout, submission_layout = database.get_table_layout(config, table)
-            except Exception as err:
-                raise DodonaException(
-                    config.translator.error_status(ErrorType.INTERNAL_ERROR),
-                    permission=MessagePermission.STAFF,
-                    description=f"Could not retrieve solution layout ({type(err).__name__}):\n    {err}",
-                    format=MessageFormat.CODE,
-                ) from err
+            if table in tables.definitions:
+                solution_layout, submission_layout = tables.definitions[table]
+                description = config.translator.translate(Translator.Text.COMPARING_OBJECT_DEFINITION, name=table)
+            else:
+                solution_layout, submission_layout = tables.layouts[table]
+                description = config.translator.translate(Translator.Text.COMPARING_TABLE_LAYOUT, table=table)
 
             with Test(
-                {
-                    "description": config.translator.translate(Translator.Text.COMPARING_TABLE_LAYOUT, table=table),
-                    "format": MessageFormat.MARKDOWN,
-                },
+                {"description": description, "format": MessageFormat.MARKDOWN},
                 solution_layout.csv_out,
                 format="csv",
             ) as test:
@@ -68,27 +119,7 @@ def non_select_feedback(
                 testcase.accepted = False  # Signal that following on-success tests should not run
 
         for table in diff_content:
-            try:
-                solution_content, submission_content = database.get_table_content(config, table)
-            except Exception as err:
-                raise DodonaException(
-                    config.translator.error_status(ErrorType.INTERNAL_ERROR),
-                    permission=MessagePermission.STAFF,
-                    description=f"Could not retrieve solution content ({type(err).__name__}):\n    {err}",
-                    format=MessageFormat.CODE,
-                ) from err
-
-            with Test(
-                {
-                    "description": config.translator.translate(Translator.Text.COMPARING_TABLE_CONTENT, table=table),
-                    "format": MessageFormat.MARKDOWN,
-                },
-                solution_content.csv_out,
-                format="csv",
-            ) as test:
-                test.generated = submission_content.csv_out
-                test.status = config.translator.error_status(ErrorType.WRONG)
-                testcase.accepted = False  # Signal that following on-success tests should not run
+            table_content_feedback(config, testcase, tables, table)
 
         if len(incorrect_name) + len(diff_layout) + len(diff_content) > 0:
             return
@@ -99,8 +130,10 @@ def non_select_feedback(
             return
 
         try:
-            solution_layout, submission_layout = database.get_table_layout(config, affected_table)
-            solution_content, submission_content = database.get_table_content(config, affected_table)
+            with instrumentation.span("retrieve"):
+                tables = database.get_tables(config, [affected_table], [affected_table])
+            solution_layout, submission_layout = tables.layouts[affected_table]
+            solution_content, submission_content = tables.contents[affected_table]
         except Exception as err:
             raise DodonaException(
                 config.translator.error_status(ErrorType.INTERNAL_ERROR),
@@ -0,0 +1,105 @@
+"""prepare an exercise once, instead of for every submission.
+
+Checks the exercise (its settings, database files, solution and startup script, on every
+database) and the regexes of its query checks, and writes everything the judge derives from it
+(see 'ExerciseBundle') to 'sql_judge_prepared.json' in its evaluation directory. The results
+of the solution's SELECT queries are bundled as well, unless `--no-expected-outputs` is passed.
+
+The judge uses the bundle as long as it is up to date, and prepares the exercise itself if it
+is stale (eg. after the solution changed), so run it again after every change to the exercise:
+`python -m judge.sql_judge_prepare EXERCISE`.
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+from .dodona_command import ErrorType
+from .dodona_config import DodonaConfig
+from .exercise_bundle import BUNDLE_FILE, ExerciseBundle
+from .sql_judge_batch import exercise_config, judgement_status, prepare
+
+# The settings with regexes that are matched against the submission's queries.
+REGEX_SETTINGS = [
+    f"{stage}_execution_{kind}_{scope}regex"
+    for stage in ("pre", "post")
+    for kind in ("forbidden", "mandatory")
+    for scope in ("symbol", "full")
+]
+
+
+def regex_errors(config: DodonaConfig) -> list[str]:
+    """Check if the regexes of the query checks are valid.
+
+    Args:
+        config: the prepared run configuration
+
+    Returns:
+        a description of every invalid regex
+    """
+    errors = []
+    for setting in REGEX_SETTINGS:
+        for regex in getattr(config, setting):
+            try:
+                re.compile(regex, re.IGNORECASE)
+            except re.error as err:
+                errors.append(f"{setting}: '{regex}' is not a valid regex ({err})")
+    return errors
+
+
+def prepare_bundle(exercise: Path, *, expected_outputs: bool = True) -> tuple[ExerciseBundle | None, str]:
+    """Prepare an exercise, and bundle the result.
+
+    Args:
+        exercise: the exercise directory (with 'config.json' and the 'evaluation' directory)
+        expected_outputs: bundle the results of the solution's SELECT queries
+
+    Returns:
+        (the bundle, the Dodona output of the preparation), the bundle is None if the exercise is not working
+    """
+    config = exercise_config(exercise, "en")
+    unprepared = DodonaConfig(**vars(config))
+    outputs, setup_output = prepare(config)
+    if judgement_status(setup_output) != ErrorType.CORRECT:
+        return None, setup_output
+
+    errors = regex_errors(config)
+    if len(errors) > 0:
+        return None, "\n".join(errors)
+
+    return ExerciseBundle.from_prepared(config, unprepared, outputs if expected_outputs else None), setup_output
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Prepare an exercise, and write its bundle.
+
+    Args:
+        argv: command line arguments, see `--help`
+
+    Returns:
+        exit code, 1 if the exercise is not working
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("exercise", type=Path, help="exercise directory (with config.json and evaluation/)")
+    parser.add_argument(
+        "--no-expected-outputs",
+        dest="expected_outputs",
+        action="store_false",
+        help="don't bundle the results of the solution's SELECT queries",
+    )
+    args = parser.parse_args(argv)
+
+    bundle, setup_output = prepare_bundle(args.exercise, expected_outputs=args.expected_outputs)
+    if bundle is None:
+        print(f"The exercise is not working:\n{setup_output}", file=sys.stderr)
+        return 1
+
+    path = args.exercise / "evaluation" / BUNDLE_FILE
+    bundle.write(path)
+    print(f"Wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,454 @@
+"""asyncio scheduling of many submissions, of one or more exercises, over a pool of judge processes.
+
+A submission is the unit of work: its queries share the database copies in its workdir and
+its feedback is one nested stream of Dodona commands, so its contexts can't be judged apart.
+Every worker is a separate Python process (see 'serve') that prepares an exercise once (like
+batch regrading) and then judges its submissions one at a time, so the event loop only waits
+for their results. The scheduler
+
+- runs at most as many submissions at once as it has workers,
+- hands out the queued submissions of the exercises in turn, so one large exercise doesn't
+  hold back the others,
+- stops a submission that exceeds the time limit of its exercise (the 'time_limit' in the
+  'evaluation' of its 'config.json', or the limit of the scheduler), or that is cancelled,
+  by killing its worker, and
+- returns the results of the submissions of an exercise in the order they were submitted.
+
+Run it with `python -m judge.sql_judge_scheduler EXERCISE SUBMISSIONS [EXERCISE SUBMISSIONS ...]`,
+in which SUBMISSIONS is a directory or a manifest file (see 'sql_judge_batch').
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any, Self
+
+from .dodona_command import DodonaCommand, DodonaException, DodonaOutput, ErrorType, Judgement
+from .sql_judge_batch import exercise_config, find_submissions, judge_submission_file, judgement_status, prepare
+from .translator import Translator
+
+# Command line flag that starts a worker process instead of the scheduler.
+WORKER_FLAG = "--worker"
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+
+
+class Job:
+    """a submission that is scheduled to be judged."""
+
+    def __init__(self, exercise: Path, submission: Path, output: Path, language: str, time_limit: float) -> None:
+        """Create Job.
+
+        Args:
+            exercise: the exercise directory
+            submission: the submission file
+            output: file to write the Dodona output to
+            language: natural language of the feedback
+            time_limit: max number of seconds the judgement may take, 0 for no limit
+        """
+        self.exercise = exercise
+        self.submission = submission
+        self.output = output
+        self.language = language
+        self.time_limit = time_limit
+        # the status and duration of the judgement (see 'judge_submission_file'), once it's judged
+        self.result: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
+
+    def cancel(self) -> bool:
+        """Cancel the judgement, the worker that is judging it (if any) is stopped.
+
+        Returns:
+            False if the job was already judged
+        """
+        return self.result.cancel()
+
+    def request(self) -> dict[str, str]:
+        """Describe the job for a worker process.
+
+        Returns:
+            the JSON request (see 'serve')
+        """
+        return {
+            "exercise": str(self.exercise),
+            "submission": str(self.submission),
+            "output": str(self.output),
+            "language": self.language,
+        }
+
+
+class Worker:
+    """a judge process, that judges one submission at a time (see 'serve')."""
+
+    def __init__(self) -> None:
+        """Create Worker, the process is started by 'start'."""
+        self.process: asyncio.subprocess.Process | None = None
+
+    async def start(self) -> None:
+        """Start the worker process if it isn't running, and wait until it's ready."""
+        if self.process is None:
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                "-m",
+                "judge.sql_judge_scheduler",
+                WORKER_FLAG,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                cwd=ROOT_PATH,
+            )
+            assert self.process.stdout is not None
+            await self.process.stdout.readline()
+
+    async def judge(self, job: Job) -> dict[str, Any]:
+        """Judge a submission, and wait for the result.
+
+        Args:
+            job: the submission
+
+        Returns:
+            the result of the judgement
+
+        Raises:
+            RuntimeError: if the worker process stopped before the submission was judged
+        """
+        await self.start()
+        assert self.process is not None
+        assert self.process.stdin is not None
+        assert self.process.stdout is not None
+
+        try:
+            self.process.stdin.write(json.dumps(job.request()).encode() + b"\n")
+            await self.process.stdin.drain()
+            response = await self.process.stdout.readline()
+        except ConnectionError:
+            response = b""
+        if response == b"":
+            await self.stop()
+            raise RuntimeError("The judge process stopped.")
+        return json.loads(response)
+
+    async def stop(self) -> None:
+        """Stop the worker process (killing it if it's judging), a new one is started by the next 'start'."""
+        if self.process is None:
+            return
+        with contextlib.suppress(ProcessLookupError):
+            self.process.kill()
+        await self.process.wait()
+        self.process = None
+
+
+class JudgeScheduler:
+    """a class for judging many submissions concurrently, see the module documentation.
+
+    Example:
+        >>> async with JudgeScheduler(workers=4) as scheduler:
+        ...     async for job, result in scheduler.judge(exercise, submissions, output):
+        ...         print(job.submission, result["status"])
+    """
+
+    def __init__(self, workers: int, language: str = "en", time_limit: float | None = None) -> None:
+        """Create JudgeScheduler.
+
+        Args:
+            workers: max number of submissions that are judged at once
+            language: natural language of the feedback
+            time_limit: max number of seconds a judgement may take, if None the time limit of the exercise
+        """
+        self.workers = [Worker() for _ in range(workers)]
+        self.language = language
+        self.time_limit = time_limit
+        # the queued jobs of every exercise, the exercise that is served next comes first
+        self.queues: OrderedDict[Path, deque[Job]] = OrderedDict()
+        self.queued = asyncio.Event()
+        self.time_limits: dict[Path, float] = {}
+        self.tasks: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> Self:
+        """Start scheduling.
+
+        Returns:
+            current JudgeScheduler instance
+        """
+        self.tasks = [asyncio.create_task(self.run(worker)) for worker in self.workers]
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Stop scheduling, the jobs that are not judged yet are cancelled.
+
+        Args:
+            exc_info: exception (if any)
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for worker in self.workers:
+            await worker.stop()
+        for queue in self.queues.values():
+            for job in queue:
+                job.cancel()
+
+    def submit(self, exercise: Path, submission: Path, output: Path) -> Job:
+        """Queue a submission.
+
+        Args:
+            exercise: the exercise directory
+            submission: the submission file
+            output: file to write the Dodona output to
+
+        Returns:
+            the job, its result is set once the submission is judged
+        """
+        exercise = exercise.resolve()
+        if exercise not in self.time_limits:
+            default = exercise_config(exercise, self.language).time_limit
+            self.time_limits[exercise] = default if self.time_limit is None else self.time_limit
+
+        job = Job(exercise, submission.resolve(), output.resolve(), self.language, self.time_limits[exercise])
+        self.queues.setdefault(exercise, deque()).append(job)
+        self.queued.set()
+        return job
+
+    async def judge(
+        self, exercise: Path, submissions: list[tuple[Path, Path]], output: Path
+    ) -> AsyncIterator[tuple[Job, dict]]:
+        """Judge the submissions of an exercise, and return their results in order.
+
+        Args:
+            exercise: the exercise directory
+            submissions: (submission file, output name) per submission, see 'find_submissions'
+            output: directory to write the Dodona output to ('<output name>.json')
+
+        Yields:
+            (job, result) per submission, as soon as it and the submissions before it are judged
+        """
+        jobs = [
+            self.submit(exercise, submission, output / name.with_suffix(".json")) for submission, name in submissions
+        ]
+        try:
+            for job in jobs:
+                yield job, await job.result
+        finally:
+            for job in jobs:
+                job.cancel()
+
+    async def next_job(self) -> Job:
+        """Wait for a queued job, of the exercise that was served the longest ago.
+
+        Returns:
+            the job (which is not cancelled)
+        """
+        while True:
+            for exercise, queue in self.queues.items():
+                while len(queue) > 0 and queue[0].result.done():  # cancelled
+                    queue.popleft()
+                if len(queue) > 0:
+                    self.queues.move_to_end(exercise)
+                    return queue.popleft()
+
+            self.queued.clear()
+            await self.queued.wait()
+
+    async def run(self, worker: Worker) -> None:
+        """Judge the queued jobs with a worker, until the scheduler stops.
+
+        Args:
+            worker: the worker
+        """
+        while True:
+            job = await self.next_job()
+            await worker.start()  # not part of the time limit
+            judgement = asyncio.create_task(worker.judge(job))
+            try:
+                done, _ = await asyncio.wait(
+                    [judgement, job.result],
+                    timeout=job.time_limit if job.time_limit > 0 else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            except asyncio.CancelledError:
+                judgement.cancel()
+                raise
+
+            if judgement in done:
+                try:
+                    result = judgement.result()
+                except RuntimeError as err:
+                    result = {"status": f"{ErrorType.INTERNAL_ERROR} ({err})", "duration_ms": 0}
+            else:
+                # cancelled or too slow, the judgement can only be stopped with its process
+                judgement.cancel()
+                await worker.stop()
+                if job.result.done():
+                    continue
+                write_status(job.output, job.language, ErrorType.TIME_LIMIT_EXCEEDED)
+                result = {"status": ErrorType.TIME_LIMIT_EXCEEDED, "duration_ms": job.time_limit * 1000}
+
+            if not job.result.done():
+                job.result.set_result(result)
+
+
+def write_status(output: Path, language: str, status: ErrorType) -> None:
+    """Write the Dodona output of a judgement that was stopped.
+
+    Args:
+        output: file to write the Dodona output to
+        language: natural language of the feedback
+        status: the status of the judgement
+    """
+    translator = Translator.from_str(language)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as output_file, contextlib.redirect_stdout(output_file):
+        DodonaCommand.output = DodonaOutput()
+        with Judgement():
+            raise DodonaException(translator.error_status(status))
+
+
+def exercise_version(exercise: Path) -> tuple[tuple[str, int], ...]:
+    """Identify the version of an exercise, by the modification times of its files.
+
+    Args:
+        exercise: the exercise directory
+
+    Returns:
+        (path, modification time) of the config and the evaluation files
+    """
+    paths = [exercise / "config.json", *sorted((exercise / "evaluation").rglob("*"))]
+    return tuple((str(path), path.stat().st_mtime_ns) for path in paths)
+
+
+def serve() -> None:
+    """Judge submissions, as a worker process of the scheduler.
+
+    An empty line is written to stdout once the judge is loaded. Then every line on stdin is a JSON
+    request (see 'Job.request'), for which the submission is judged and its result (see
+    'judge_submission_file') is written as a JSON line to stdout. Exercises are prepared once,
+    until one of their files changes.
+    """
+    protocol = sys.stdout
+    protocol.write("\n")
+    protocol.flush()
+    # (version, prepared exercise or the output of its preparation if it's not working) per exercise and language
+    exercises: dict[tuple[str, str], tuple[tuple, tuple | str]] = {}
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        exercise, output = Path(request["exercise"]), Path(request["output"])
+        key, version = (request["exercise"], request["language"]), exercise_version(exercise)
+
+        if key not in exercises or exercises[key][0] != version:
+            config = exercise_config(exercise, request["language"])
+            expected_outputs, setup_output = prepare(config)
+            working = judgement_status(setup_output) == ErrorType.CORRECT
+            exercises[key] = (version, (config, expected_outputs) if working else setup_output)
+
+        prepared = exercises[key][1]
+        if isinstance(prepared, str):
+            # the exercise is not working, every submission gets the output of its preparation
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(prepared, encoding="utf-8")
+            result = {"status": judgement_status(prepared), "duration_ms": 0}
+        else:
+            result = judge_submission_file(Path(request["submission"]), output, prepared)
+
+        protocol.write(json.dumps(result) + "\n")
+        protocol.flush()
+
+
+async def judge_exercises(
+    exercises: list[tuple[Path, Path]], output: Path, workers: int, language: str, time_limit: float | None
+) -> int:
+    """Judge the submissions of several exercises, and print every result.
+
+    Args:
+        exercises: (exercise directory, submissions directory or manifest) per exercise
+        output: output directory, with a subdirectory per exercise (see 'exercise_output_names')
+        workers: number of worker processes
+        language: natural language of the feedback
+        time_limit: max number of seconds a judgement may take, if None the time limit of the exercise
+
+    Returns:
+        number of submissions that were accepted
+    """
+
+    async def judge_exercise(scheduler: JudgeScheduler, exercise: Path, submissions: Path, name: Path) -> int:
+        found = find_submissions(submissions)
+        accepted = 0
+        # the results are returned in the order of the submissions
+        submission_names = (submission for _, submission in found)
+        async for _, result in scheduler.judge(exercise, found, output / name):
+            submission = next(submission_names)
+            print(f"{name / submission}: {result['status']} ({result['duration_ms']:.0f} ms)")
+            accepted += result["status"] == ErrorType.CORRECT
+        return accepted
+
+    names = exercise_output_names([exercise for exercise, _ in exercises])
+    async with JudgeScheduler(workers, language, time_limit) as scheduler:
+        counts = await asyncio.gather(
+            *(
+                judge_exercise(scheduler, exercise, submissions, name)
+                for (exercise, submissions), name in zip(exercises, names, strict=True)
+            )
+        )
+    return sum(counts)
+
+
+def exercise_output_names(exercises: list[Path]) -> list[Path]:
+    """Name the output directories of several exercises.
+
+    Exercises in different directories can have the same name, so they are named by their path
+    relative to the directory that contains all of them (just their name if they're in the same directory).
+
+    Args:
+        exercises: the exercise directories
+
+    Returns:
+        the output directory (relative to the output) per exercise
+    """
+    resolved = [exercise.resolve() for exercise in exercises]
+    common = Path(os.path.commonpath([exercise.parent for exercise in resolved]))
+    return [exercise.relative_to(common) for exercise in resolved]
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Judge the submissions of several exercises, or serve as a worker process.
+
+    Args:
+        argv: command line arguments, see `--help`
+
+    Returns:
+        exit code
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv == [WORKER_FLAG]:
+        serve()
+        return 0
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("exercises", type=Path, nargs="+", help="pairs of an exercise and its submissions")
+    parser.add_argument(
+        "-o", "--output", type=Path, default=Path("regrade"), help="output directory (default: regrade)"
+    )
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--language", default="en", help="natural language of the feedback (default: en)")
+    parser.add_argument("--time-limit", type=float, help="time limit in seconds (default: the exercise's time limit)")
+    args = parser.parse_args(argv)
+
+    if len(args.exercises) % 2 != 0:
+        parser.error("every exercise needs a directory or manifest with submissions")
+    exercises = list(zip(args.exercises[::2], args.exercises[1::2], strict=True))
+    if len({exercise.resolve() for exercise, _ in exercises}) < len(exercises):
+        parser.error("every exercise can only be given once")
+
+    start = time.perf_counter()
+    accepted = asyncio.run(judge_exercises(exercises, args.output, args.workers, args.language, args.time_limit))
+    print(f"{accepted} accepted in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
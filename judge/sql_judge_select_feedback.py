@@ -14,9 +14,82 @@ from .dodona_command import (
 from .dodona_config import DodonaConfig
 from .sql_query import SQLQuery
 from .sql_query_result import SQLQueryResult
+from .sql_result_diff import SQLResultDiff
 from .translator import Translator
 
 
+def count_feedback(config: DodonaConfig, expected_output: SQLQueryResult, generated_output: SQLQueryResult) -> None:
+    """Show a message if the column count or row count of the results differ.
+
+    The row counts include the rows that are not shown (see 'max_rows').
+
+    Args:
+        config: parsed config received from Dodona
+        expected_output: select query expected output
+        generated_output: select query generated output
+    """
+    if len(expected_output.dataframe.columns) != len(generated_output.dataframe.columns):
+        with Message(
+            format=MessageFormat.CALLOUT_DANGER,
+            description=config.translator.translate(
+                Translator.Text.DIFFERENT_COLUMN_COUNT,
+                expected=len(expected_output.dataframe.columns),
+                submitted=len(generated_output.dataframe.columns),
+            ),
+        ):
+            pass
+
+    if expected_output.row_count != generated_output.row_count:
+        with Message(
+            format=MessageFormat.CALLOUT_DANGER,
+            description=config.translator.translate(
+                Translator.Text.DIFFERENT_ROW_COUNT,
+                expected=expected_output.row_count,
+                submitted=generated_output.row_count,
+            ),
+        ):
+            pass
+
+
+def result_diff_feedback(config: DodonaConfig, result_diff: SQLResultDiff, solution_query: SQLQuery) -> None:
+    """Explain why the full results (compared inside SQLite) are different.
+
+    Either the rows are correct but in the wrong order, or some rows are missing or
+    unexpected, in which case a sample of those rows is shown.
+
+    Args:
+        config: parsed config received from Dodona
+        result_diff: comparison of the full results inside SQLite
+        solution_query: the parsed solution query
+    """
+    if solution_query.is_ordered and result_diff.multiset_equal:
+        with Message(
+            format=MessageFormat.CALLOUT_INFO,
+            description=config.translator.translate(Translator.Text.CORRECT_ROWS_WRONG_ORDER),
+        ):
+            pass
+        return
+
+    if result_diff.multiset_equal or result_diff.missing_count is None or result_diff.unexpected_count is None:
+        return
+
+    description = config.translator.translate(
+        Translator.Text.MISSING_AND_UNEXPECTED_ROWS,
+        missing=result_diff.missing_count,
+        unexpected=result_diff.unexpected_count,
+    )
+
+    for text, sample in (
+        (Translator.Text.MISSING_ROWS_SAMPLE, result_diff.missing_sample),
+        (Translator.Text.UNEXPECTED_ROWS_SAMPLE, result_diff.unexpected_sample),
+    ):
+        if sample is not None and not sample.dataframe.empty:
+            description += f"\n\n{config.translator.translate(text)}\n\n```\n{sample.csv_out}\n```"
+
+    with Message(format=MessageFormat.CALLOUT_INFO, description=description):
+        pass
+
+
 def select_feedback(  # noqa: PLR0913, PLR0917
     config: DodonaConfig,
     testcase: SimpleNamespace,
@@ -24,6 +97,7 @@ def select_feedback(  # noqa: PLR0913, PLR0917
     generated_output: SQLQueryResult,
     solution_query: SQLQuery,
     submission_query: SQLQuery,
+    result_diff: SQLResultDiff | None = None,
 ) -> None:
     """Run tests based on execution results of a select query.
 
@@ -34,6 +108,7 @@ def select_feedback(  # noqa: PLR0913, PLR0917
         generated_output: select query generated output
         solution_query: the parsed solution query
         submission_query: the parsed submission query
+        result_diff: comparison of the full results inside SQLite, if None the displayed results are compared
 
     Raises:
         DodonaException: custom exception that is automatically handled by the 'with' blocks
@@ -54,41 +129,32 @@ def select_feedback(  # noqa: PLR0913, PLR0917
     ) as test:
         test.generated = generated_output.csv_out
 
-        if len(expected_output.dataframe.columns) != len(generated_output.dataframe.columns):
-            with Message(
-                format=MessageFormat.CALLOUT_DANGER,
-                description=config.translator.translate(
-                    Translator.Text.DIFFERENT_COLUMN_COUNT,
-                    expected=len(expected_output.dataframe.columns),
-                    submitted=len(generated_output.dataframe.columns),
-                ),
-            ):
-                pass
-
-        if len(expected_output.dataframe.index) != len(generated_output.dataframe.index):
-            with Message(
-                format=MessageFormat.CALLOUT_DANGER,
-                description=config.translator.translate(
-                    Translator.Text.DIFFERENT_ROW_COUNT,
-                    expected=len(expected_output.dataframe.index),
-                    submitted=len(generated_output.dataframe.index),
-                ),
-            ):
-                pass
-
-        if expected_output.csv_out == generated_output.csv_out:
+        count_feedback(config, expected_output, generated_output)
+
+        if result_diff is None:
+            # the displayed rows can be equal while the (not displayed) remainder of the results is not
+            equal = expected_output.row_count == generated_output.row_count and expected_output.equals(
+                generated_output, config.result_comparator
+            )
+        else:
+            equal = result_diff.equals(ignore_order=config.order_unordered_rows and not solution_query.is_ordered)
+
+        if equal:
             test.status = config.translator.error_status(ErrorType.CORRECT)
         else:
             test.status = config.translator.error_status(ErrorType.WRONG)
             testcase.accepted = False  # Signal that following on-success tests should not run
 
+            if result_diff is not None:
+                result_diff_feedback(config, result_diff, solution_query)
+
             # if SELECT is ordered -> check if rows are correct but order is wrong
-            if solution_query.is_ordered:
+            elif solution_query.is_ordered and expected_output.row_count == generated_output.row_count:
                 sort_on = sorted(set(expected_output.columns) & set(generated_output.columns))
                 expected_output.sort_rows(sort_on)
                 generated_output.sort_rows(sort_on)
 
-                if expected_output.csv_out == generated_output.csv_out:
+                if expected_output.equals(generated_output, config.result_comparator):
                     with Message(
                         format=MessageFormat.CALLOUT_INFO,
                         description=config.translator.translate(Translator.Text.CORRECT_ROWS_WRONG_ORDER),
@@ -94,7 +94,7 @@ class SQLQuery:
         Returns:
             True if query type is "SELECT".
         """
-        return str(self.parsed.get_type()) == "SELECT"
+        return self.query_type == "SELECT"
 
     @property
     def is_pragma(self) -> bool:
@@ -127,6 +127,51 @@ class SQLQuery:
         """
         return len(self.symbols) > 0 and self.symbols[-1] == ";"
 
+    @property
+    def equivalence_key(self) -> tuple[str, ...]:
+        """Return a key that is equal for SELECT queries with the same result (and result column names).
+
+        Whitespace and the case of keywords are ignored, except in the result columns: SQLite names
+        a result column after the text of its expression (eg. 'count(*)' and 'COUNT(*)' are not the
+        same column), so these are compared as text. This is only safe for a single SELECT, any
+        other query (eg. with subqueries or a compound SELECT) is compared by its full text.
+
+        Returns:
+            the key
+        """
+        tokens = [token for token in self.parsed.flatten() if token.ttype not in sqlparse.tokens.Comment]
+        selects = [
+            i for i, token in enumerate(tokens) if token.ttype in sqlparse.tokens.DML and token.normalized == "SELECT"
+        ]
+        if len(selects) != 1:
+            return (self.without_comments.strip().rstrip(";").strip(),)
+
+        start = selects[0] + 1
+        end = start
+        while (
+            end < len(tokens)
+            and not (
+                tokens[end].ttype in sqlparse.tokens.Keyword
+                and tokens[end].normalized == "FROM"
+                # 'a IS [NOT] DISTINCT FROM b' is an expression
+                and not any(
+                    token.normalized == "DISTINCT" for token in tokens[end - 2 : end] if not token.is_whitespace
+                )
+            )
+        ):
+            end += 1
+
+        def fold(part: list) -> list[str]:
+            return [
+                # keywords can be several words (eg. 'ORDER BY')
+                " ".join(token.normalized.split()) if token.ttype in sqlparse.tokens.Keyword else token.value
+                for token in part
+                if not token.is_whitespace and token.value != ";"
+            ]
+
+        columns = "".join(token.value for token in tokens[start:end]).strip().rstrip(";").strip()
+        return (*fold(tokens[:start]), columns, *fold(tokens[end:]))
+
     def match_multi_regex(
         self,
         forbidden_symbolregex: list[str],
@@ -1,16 +1,21 @@
 """sql query tabular result utils."""
 
+import hashlib
 import io
+from collections import Counter
 from sqlite3 import Cursor
 
 import pandas as pd
 
+from .sql_result_comparator import SQLResultComparator
+
 NoneType = type(None)
 
 # The only column types 'from_cursor' can ever produce, since sqlite3 only maps rows to these five
 # Python types. Spelled out explicitly (instead of the broader 'type') so the type checker can verify
 # that every access into 'python_type_to_sqlite_type' below is exhaustive.
 SqliteColumnType = type[None] | type[int] | type[float] | type[str] | type[bytes]
+SqliteValue = None | int | float | str | bytes
 
 python_type_to_sqlite_type: dict[SqliteColumnType, str] = {
     NoneType: "NULL",
@@ -20,11 +25,143 @@ python_type_to_sqlite_type: dict[SqliteColumnType, str] = {
     bytes: "BLOB",
 }
 
+# Number of rows fetched at once while stepping through the rows that are not displayed.
+FETCH_BATCH_SIZE = 1000
+
+# Max number of rows of which the type is profiled, the types of larger results are only profiled in part.
+MAX_PROFILE_ROWS = 10_000
+
+# TEXT values with more characters and BLOB values with more bytes are rendered compactly.
+MAX_VALUE_LENGTH = 1000
+
+
+def format_size(size: int) -> str:
+    """Format a number of bytes as a human readable size.
+
+    Args:
+        size: number of bytes
+
+    Returns:
+        the size in B, kB, MB or GB (eg. 2.3 MB)
+    """
+    if size < 1000:  # noqa: PLR2004
+        return f"{size} B"
+    scaled = size / 1000
+    for unit in ("kB", "MB"):
+        if scaled < 1000:  # noqa: PLR2004
+            return f"{scaled:.1f} {unit}"
+        scaled /= 1000
+    return f"{scaled:.1f} GB"
+
+
+def compact_value(value: SqliteValue, max_length: int) -> SqliteValue:
+    """Replace a long TEXT or BLOB value by a short description that includes its digest.
+
+    BLOB values are rendered as 'BLOB(<size>, sha1=<digest>)', TEXT values keep their first
+    'max_length' characters followed by a marker with their length and digest. Two compacted
+    values are therefore only equal if the original values are equal: the digest is computed on
+    the original value, so the loose TEXT comparison of SQLResultComparator (case, whitespace)
+    doesn't apply to values longer than 'max_length'.
+
+    Args:
+        value: a single sql value
+        max_length: max number of characters (TEXT) or bytes (BLOB) that is kept as is
+
+    Returns:
+        the value itself, or its compact description if it is too long
+    """
+    if isinstance(value, bytes) and len(value) > max_length:
+        return f"BLOB({format_size(len(value))}, sha1={hashlib.sha1(value, usedforsecurity=False).hexdigest()})"
+    if isinstance(value, str) and len(value) > max_length:
+        digest = hashlib.sha1(value.encode("utf-8", "surrogatepass"), usedforsecurity=False).hexdigest()
+        return f"{value[:max_length]}\u2026 [TEXT({len(value)} characters), sha1={digest}]"
+    return value
+
+
+def compact_rows(rows: list[tuple[SqliteValue, ...]], max_length: int) -> list[tuple[SqliteValue, ...]]:
+    """Compact all long TEXT and BLOB values of a batch of rows, see 'compact_value'.
+
+    Rows without long values are kept as they are.
+
+    Args:
+        rows: a batch of result rows
+        max_length: max number of characters (TEXT) or bytes (BLOB) that is kept as is, 0 disables compaction
+
+    Returns:
+        the compacted rows
+    """
+    if max_length <= 0:
+        return rows
+
+    def is_long(value: SqliteValue) -> bool:
+        return isinstance(value, (str, bytes)) and len(value) > max_length
+
+    return [tuple(compact_value(x, max_length) for x in row) if any(map(is_long, row)) else row for row in rows]
+
+
+def update_type_profile(type_profile: list[Counter[SqliteColumnType]], rows: list[tuple[SqliteValue, ...]]) -> None:
+    """Count the type of every value in a batch of rows, per column.
+
+    Args:
+        type_profile: one Counter per column, updated in place
+        rows: a batch of result rows
+    """
+    for counter, values in zip(type_profile, zip(*rows, strict=True), strict=True):
+        counter.update(type(x) for x in values)
+
+
+def type_profile_name(counter: Counter[SqliteColumnType]) -> str:
+    """Describe a column's type profile as an sql type name.
+
+    NULL values are ignored unless the column only contains NULL values. A column that
+    holds values of multiple storage classes is described by all of them (eg. INTEGER/TEXT).
+
+    Args:
+        counter: the number of values per type in the column
+
+    Returns:
+        the sql type name(s)
+    """
+    names = [name for t, name in python_type_to_sqlite_type.items() if t is not NoneType and counter[t] > 0]
+    return "/".join(names) if len(names) > 0 else python_type_to_sqlite_type[NoneType]
+
+
+def column_argsort(columns: list[str], column_index: list[str]) -> list[int]:
+    """Determine the column order that places the columns in 'column_index' first.
+
+    Args:
+        columns: list of column names in their current order
+        column_index: list of column names that should be placed first
+
+    Returns:
+        the indices of 'columns' in their new order
+    """
+    original_indices: dict[str, list[int]] = {}
+    for i, column in enumerate(columns):
+        original_indices.setdefault(column, []).append(i)
+
+    argsort = []
+    for column in column_index:
+        if column not in original_indices or len(original_indices[column]) == 0:
+            continue  # pragma: no cover (due to bug in coverage reporting)
+
+        argsort += [original_indices[column].pop(0)]
+
+    argsort += sorted(i for original_index_list in original_indices.values() for i in original_index_list)
+    return argsort
+
 
 class SQLQueryResult:
     """a class for managing a query's results."""
 
-    def __init__(self, dataframe: pd.DataFrame, columns: list[str], types: list[SqliteColumnType]) -> None:
+    def __init__(
+        self,
+        dataframe: pd.DataFrame,
+        columns: list[str],
+        types: list[SqliteColumnType],
+        type_profile: list[Counter[SqliteColumnType]] | None = None,
+        row_count: int | None = None,
+    ) -> None:
         """Create new SQLQueryResult.
 
         Should not be used directly (other than testing). Use 'from_cursor' instead.
@@ -32,7 +169,11 @@ class SQLQueryResult:
         Args:
             dataframe: pandas dataframe containing query's result content
             columns: list of column names (used for csv header)
-            types: list of column types (used for checking sql types)
+            types: list of column types (the most common non-NULL type per column)
+            type_profile: number of values per type for each column (used for checking sql types),
+                          if None, every column is assumed to only contain values of its type
+            row_count: total number of rows in the result (including the rows that were not retrieved),
+                       if None, only the rows in the dataframe are counted
         """
         assert len(dataframe.columns) == len(columns)
         assert len(dataframe.columns) == len(types)
@@ -40,30 +181,77 @@ class SQLQueryResult:
         self.dataframe = dataframe
         self.columns = columns
         self.types = types
+        self.type_profile = type_profile if type_profile is not None else [Counter([t]) for t in types]
+        self.row_count = row_count if row_count is not None else len(dataframe.index)
+
+        assert len(self.type_profile) == len(types)
 
     @classmethod
-    def from_cursor(cls: type["SQLQueryResult"], max_rows: int, cursor: Cursor) -> "SQLQueryResult":
+    def from_cursor(
+        cls: type["SQLQueryResult"],
+        max_rows: int,
+        cursor: Cursor,
+        max_value_length: int = MAX_VALUE_LENGTH,
+        max_profile_rows: int = MAX_PROFILE_ROWS,
+    ) -> "SQLQueryResult":
         """Process sql query results and wrap in SQLQueryResult.
 
         The column names are stored separate from the dataframe, because an
         sql query might return multiple columns with the same name.
 
+        Only the first 'max_rows' rows are kept, but the cursor is stepped through the remaining
+        rows as well (without keeping them), so the row count is exact. The column type profile
+        is updated batch by batch while fetching, the rows are never scanned twice. Only the first
+        'max_profile_rows' rows are profiled, so the profile of a huge result (eg. a cross join)
+        doesn't cost more than counting it; it doesn't depend on how long the query takes.
+
+        Long TEXT and BLOB values are replaced by a compact description (see 'compact_value')
+        as soon as they are fetched, so they are never stored or rendered in full.
+
         Args:
             max_rows: max number of rows to retrieve
             cursor: cursor that was used to perform query and can now be used to retrieve results
+            max_value_length: max number of characters (TEXT) or bytes (BLOB) of a value that is kept as is,
+                              0 disables compaction
+            max_profile_rows: max number of rows that is profiled
 
         Returns:
             the results wrapped in a SQLQueryResult object
         """
         rows = cursor.fetchmany(max_rows)
+        row_count = len(rows)
 
-        dataframe = pd.DataFrame(rows)
-        columns, types = [], []
+        columns: list[str] = []
+        type_profile: list[Counter[SqliteColumnType]] = []
         if len(rows) > 0:
             columns = [column[0].upper() for column in cursor.description or []]
-            types = [type(x) for x in rows[0]]
+            type_profile = [Counter() for _ in columns]
+            update_type_profile(type_profile, rows)
+            rows = compact_rows(rows, max_value_length)
+
+            while batch := cursor.fetchmany(FETCH_BATCH_SIZE):
+                if row_count < max_profile_rows:
+                    update_type_profile(type_profile, batch[: max_profile_rows - row_count])
+                row_count += len(batch)
+
+        dataframe = pd.DataFrame(rows)
+
+        types = [
+            max((t for t in counter if t is not NoneType), key=lambda t: counter[t], default=NoneType)
+            for counter in type_profile
+        ]
+
+        return cls(dataframe, columns, types, type_profile, row_count)
+
+    def copy(self) -> "SQLQueryResult":
+        """Copy the result, so it can be sorted or reindexed without changing the original.
 
-        return cls(dataframe, columns, types)
+        The dataframe isn't copied, 'sort_rows' and 'index_columns' replace it instead of changing it.
+
+        Returns:
+            a new SQLQueryResult with the same content
+        """
+        return SQLQueryResult(self.dataframe, self.columns, self.types, self.type_profile, self.row_count)
 
     def sort_rows(self, sort_on: list[str]) -> None:
         """Sort the rows based on a list of column names.
@@ -86,23 +274,32 @@ class SQLQueryResult:
         Args:
             column_index: list of column names that should be placed first
         """
-        original_indices: dict[str, list[int]] = {}
-        for i, column in enumerate(self.columns):
-            original_indices.setdefault(column, []).append(i)
-
-        argsort = []
-        for column in column_index:
-            if column not in original_indices or len(original_indices[column]) == 0:
-                continue  # pragma: no cover (due to bug in coverage reporting)
-
-            argsort += [original_indices[column].pop(0)]
-
-        argsort += sorted(i for original_index_list in original_indices.values() for i in original_index_list)
+        argsort = column_argsort(self.columns, column_index)
 
         self.columns = [self.columns[i] for i in argsort]
         self.types = [self.types[i] for i in argsort]
+        self.type_profile = [self.type_profile[i] for i in argsort]
         self.dataframe = self.dataframe.reindex(columns=self.dataframe.columns[argsort])
 
+    def equals(self, other: "SQLQueryResult", comparator: SQLResultComparator | None = None) -> bool:
+        """Check if the content of this result equals the content of another result.
+
+        Args:
+            other: the result to compare against (self is the expected result)
+            comparator: the comparator used to loosen the comparison, if None (or exact) the
+                        csv representations are compared
+
+        Returns:
+            True if both results are considered equal
+        """
+        if comparator is None or comparator.is_exact:
+            return self.csv_out == other.csv_out
+
+        if self.columns != other.columns:
+            return False
+
+        return comparator.equals(self.dataframe, other.dataframe)
+
     @property
     def csv_out(self) -> str:
         """CSV representation of the query result (including column names in header) as a string.
@@ -122,5 +319,5 @@ class SQLQueryResult:
             string representation of all returned column names and their types
         """
         return "\n".join(
-            f"{c} [{python_type_to_sqlite_type[t]}]" for (c, t) in zip(self.columns, self.types, strict=True)
+            f"{c} [{type_profile_name(p)}]" for (c, p) in zip(self.columns, self.type_profile, strict=True)
         )
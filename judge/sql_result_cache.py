@@ -0,0 +1,182 @@
+"""in-memory cache of SELECT query results, shared by the solution and submission queries."""
+
+import hashlib
+import json
+from collections import OrderedDict
+from pathlib import Path
+
+from .dodona_config import DodonaConfig
+from .instrumentation import instrumentation
+from .replay_cache import file_digest
+from .sql_query import SQLQuery
+from .sql_query_result import SQLQueryResult
+
+# Functions of which the result differs between runs (or connections).
+NON_DETERMINISTIC_FUNCTIONS = frozenset(
+    {
+        "random",
+        "randomblob",
+        "changes",
+        "total_changes",
+        "last_insert_rowid",
+        "current_date",
+        "current_time",
+        "current_timestamp",
+    }
+)
+
+# Date and time functions, that use the current time if they are called without a time value: the number of
+# arguments that don't include one (strftime's first argument is the format).
+DATE_TIME_FUNCTIONS = {
+    "date": 0,
+    "time": 0,
+    "datetime": 0,
+    "julianday": 0,
+    "unixepoch": 0,
+    "strftime": 1,
+    "timediff": 0,
+}
+
+
+def _argument_count(symbols: list[str], start: int) -> int | None:
+    # number of arguments of the function call of which the opening bracket is at 'start', None if it's not a call
+    if symbols[start : start + 1] != ["("]:
+        return None
+    depth, count = 0, 0
+    for symbol in symbols[start + 1 :]:
+        if symbol == ")" and depth == 0:
+            return count
+        if count == 0:
+            count = 1
+        if symbol == "(":
+            depth += 1
+        elif symbol == ")":
+            depth -= 1
+        elif symbol == "," and depth == 0:
+            count += 1
+    return None
+
+
+def is_deterministic(query: SQLQuery) -> bool:
+    """Check if a query returns the same result every time it runs on the same database.
+
+    Args:
+        query: the parsed query
+
+    Returns:
+        False if the query uses random values or the current time (eg. 'random()' or "datetime('now')")
+    """
+    symbols = [symbol.lower() for symbol in query.symbols]
+    for i, symbol in enumerate(symbols):
+        if symbol in NON_DETERMINISTIC_FUNCTIONS or symbol in {"'now'", '"now"'}:
+            return False
+        if symbol in DATE_TIME_FUNCTIONS and _argument_count(symbols, i + 1) == DATE_TIME_FUNCTIONS[symbol]:
+            return False
+    return True
+
+
+def result_bytes(result: SQLQueryResult) -> int:
+    """Estimate the memory used by a query result.
+
+    Args:
+        result: the query result
+
+    Returns:
+        number of bytes
+    """
+    return int(result.dataframe.memory_usage(index=True, deep=True).sum()) + sum(len(c) for c in result.columns)
+
+
+class SQLResultCache:
+    """a class for reusing the results of SELECT queries that ran before on the same database state.
+
+    A result is identified by the query text (without comments, as SQLite names the result columns
+    after the text of their expressions), the state of the database it ran on and the settings
+    that determine how the result is retrieved. The database state is the start database, the
+    startup script and every non-SELECT query that ran on it before. So the result of a submission
+    query that is identical to the solution query (after identical changes to the database) is
+    taken from the solution, and identical queries of other submissions reuse it as well (eg. when
+    regrading).
+
+    A cached result is the result of running the query again: its row count and type profile
+    don't depend on how long the query took (see 'SQLQueryResult.from_cursor'). Queries that
+    aren't deterministic are never cached, nor is anything that runs after such a
+    non-SELECT query. The cache is bounded by the (estimated) size of the results, the least
+    recently used results are removed first.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """Create SQLResultCache.
+
+        Args:
+            max_bytes: max total size of the cached results, 0 disables the cache
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.results: OrderedDict[str, tuple[SQLQueryResult, int]] = OrderedDict()
+
+    def key(self, config: DodonaConfig, db_file: str, history: list[SQLQuery], query: SQLQuery) -> str | None:
+        """Identify the result of a query on a database state.
+
+        Args:
+            config: the prepared run configuration
+            db_file: the start database file
+            history: the queries that ran on the database before (in the same order)
+            query: the SELECT query
+
+        Returns:
+            hex digest, None if the result can't be cached (or the cache is disabled)
+        """
+        if self.max_bytes <= 0 or not query.is_select:
+            return None
+
+        changes = [previous for previous in history if not previous.is_select]
+        if not all(is_deterministic(previous) for previous in [*changes, query]):
+            return None
+
+        stat = Path(db_file).stat()
+        state = [
+            file_digest(db_file, stat.st_size, stat.st_mtime_ns),
+            config.pragma_startup_queries,
+            [previous.without_comments for previous in changes],
+        ]
+        encoded = json.dumps([state, config.max_rows, config.max_value_length, query.without_comments]).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str | None) -> SQLQueryResult | None:
+        """Look up a result.
+
+        Args:
+            key: the key of the result (see 'key')
+
+        Returns:
+            a copy of the result (that can be changed by the feedback), None if it isn't cached
+        """
+        if key is None:
+            return None
+        if key not in self.results:
+            instrumentation.count("result_cache_misses")
+            return None
+
+        instrumentation.count("result_cache_hits")
+        self.results.move_to_end(key)  # most recently used
+        return self.results[key][0].copy()
+
+    def put(self, key: str | None, result: SQLQueryResult) -> None:
+        """Add a result, and remove the least recently used ones if the cache is full.
+
+        Args:
+            key: the key of the result (see 'key')
+            result: the result, a copy is cached
+        """
+        if key is None or key in self.results:
+            return
+        size = result_bytes(result)
+        if size > self.max_bytes:
+            return
+
+        self.results[key] = (result.copy(), size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted) = self.results.popitem(last=False)
+            self.total_bytes -= evicted
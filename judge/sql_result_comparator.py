@@ -0,0 +1,194 @@
+"""tolerant comparison of sql query results."""
+
+import hashlib
+import io
+
+import pandas as pd
+
+
+class SQLResultComparator:
+    """a class for comparing the contents of two query results column by column.
+
+    By default, two results are only equal if their csv representations are identical. Each
+    option below loosens that comparison for one kind of column, without changing what is
+    displayed: the normalized values only exist for the duration of the comparison.
+
+    All normalizations are applied to whole pandas columns at once, so the comparison cost
+    stays linear in the number of rows. TEXT values that were compacted (see 'compact_value')
+    are compared as they are, the TEXT options don't apply to them.
+    """
+
+    def __init__(
+        self,
+        absolute_tolerance: float = 0.0,
+        relative_tolerance: float = 0.0,
+        *,
+        case_insensitive: bool = False,
+        normalize_whitespace: bool = False,
+        compare_blob_digest: bool = False,
+    ) -> None:
+        """Create SQLResultComparator.
+
+        Args:
+            absolute_tolerance: max absolute difference between two REAL values that are considered equal
+            relative_tolerance: max difference between two REAL values relative to the expected value
+            case_insensitive: compare TEXT values without regard to case
+            normalize_whitespace: strip TEXT values and collapse all inner whitespace to a single space
+            compare_blob_digest: compare BLOB values by their SHA-1 digest instead of their repr
+        """
+        self.absolute_tolerance = absolute_tolerance
+        self.relative_tolerance = relative_tolerance
+        self.case_insensitive = case_insensitive
+        self.normalize_whitespace = normalize_whitespace
+        self.compare_blob_digest = compare_blob_digest
+
+    @property
+    def is_exact(self) -> bool:
+        """Check if this comparator falls back to plain csv comparison.
+
+        Returns:
+            True if no option is enabled
+        """
+        return not (
+            self.has_float_tolerance or self.case_insensitive or self.normalize_whitespace or self.compare_blob_digest
+        )
+
+    @property
+    def has_float_tolerance(self) -> bool:
+        """Check if REAL values are compared with a tolerance.
+
+        Returns:
+            True if an absolute or relative tolerance is set
+        """
+        return self.absolute_tolerance > 0 or self.relative_tolerance > 0
+
+    def normalize_column(self, column: pd.Series) -> pd.Series:
+        """Normalize the TEXT and BLOB values of a column, other values are kept as they are.
+
+        Args:
+            column: a single result column
+
+        Returns:
+            the normalized column
+        """
+        if column.dtype != object:
+            return column
+
+        has_text = pd.api.types.infer_dtype(column, skipna=True) in {"string", "mixed", "mixed-integer"}
+
+        if has_text and (self.case_insensitive or self.normalize_whitespace):
+            # The .str accessor maps every non-str value to NaN, these are restored below.
+            normalized = column.str.casefold() if self.case_insensitive else column.str.slice()
+            if self.normalize_whitespace:
+                normalized = normalized.str.strip().str.replace(r"\s+", " ", regex=True)
+            column = normalized.where(normalized.notna(), column)
+
+        if self.compare_blob_digest:
+            column = column.map(
+                lambda x: hashlib.sha1(x, usedforsecurity=False).hexdigest() if isinstance(x, bytes) else x
+            )
+
+        return column
+
+    def normalize_value(self, value: str | bytes | float | None) -> str | bytes | float | None:
+        """Normalize a single TEXT or BLOB value, the scalar version of 'normalize_column'.
+
+        Args:
+            value: a single sql value
+
+        Returns:
+            the normalized value
+        """
+        if isinstance(value, str):
+            if self.case_insensitive:
+                value = value.casefold()
+            if self.normalize_whitespace:
+                value = " ".join(value.split())
+        elif isinstance(value, bytes) and self.compare_blob_digest:
+            value = hashlib.sha1(value, usedforsecurity=False).hexdigest()
+
+        return value
+
+    def is_tolerant_pair(self, expected: pd.Series, generated: pd.Series) -> bool:
+        """Check if two columns should be compared with the float tolerance.
+
+        Args:
+            expected: solution column
+            generated: submission column
+
+        Returns:
+            True if both columns are numeric and at least one of them holds REAL values
+        """
+        return (
+            self.has_float_tolerance
+            and pd.api.types.is_numeric_dtype(expected)
+            and pd.api.types.is_numeric_dtype(generated)
+            and (pd.api.types.is_float_dtype(expected) or pd.api.types.is_float_dtype(generated))
+        )
+
+    def floats_close(self, expected: pd.Series, generated: pd.Series) -> bool:
+        """Compare two numeric columns using the configured tolerances.
+
+        A value is close if 'abs(generated - expected) <= absolute + relative * abs(expected)',
+        two NULL values are considered equal.
+
+        Args:
+            expected: solution column
+            generated: submission column
+
+        Returns:
+            True if all values are close
+        """
+        expected = expected.reset_index(drop=True)
+        generated = generated.reset_index(drop=True)
+        close = (generated - expected).abs() <= self.absolute_tolerance + self.relative_tolerance * expected.abs()
+        both_null = expected.isna() & generated.isna()
+        return bool((close | both_null).all())
+
+    def equals(self, expected: pd.DataFrame, generated: pd.DataFrame) -> bool:
+        """Compare the content of two result dataframes.
+
+        Columns that are compared with a float tolerance are checked first; all other columns
+        are normalized and then compared by their csv representation, exactly like the
+        displayed output would be.
+
+        Args:
+            expected: solution result content
+            generated: submission result content
+
+        Returns:
+            True if both dataframes are considered equal
+        """
+        if expected.shape != generated.shape:
+            return False
+
+        expected_rest, generated_rest = [], []
+        for i in range(len(expected.columns)):
+            expected_column, generated_column = expected.iloc[:, i], generated.iloc[:, i]
+
+            if self.is_tolerant_pair(expected_column, generated_column):
+                if not self.floats_close(expected_column, generated_column):
+                    return False
+                continue
+
+            expected_rest.append(self.normalize_column(expected_column))
+            generated_rest.append(self.normalize_column(generated_column))
+
+        if len(expected_rest) == 0:
+            return True
+
+        return _csv_rows(expected_rest) == _csv_rows(generated_rest)
+
+
+def _csv_rows(columns: list[pd.Series]) -> str:
+    """Render a list of columns as headerless csv.
+
+    Args:
+        columns: the columns to render side by side
+
+    Returns:
+        csv encoded rows
+    """
+    csv_output = io.StringIO()
+    pd.concat(columns, axis=1, ignore_index=True).to_csv(csv_output, header=False, index=False)
+    return csv_output.getvalue()
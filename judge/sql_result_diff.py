@@ -0,0 +1,316 @@
+"""in-engine comparison of materialized select query results."""
+
+import sqlite3
+from collections import Counter
+
+from .sql_query_result import (
+    MAX_VALUE_LENGTH,
+    NoneType,
+    SqliteColumnType,
+    SQLQueryResult,
+    column_argsort,
+    python_type_to_sqlite_type,
+)
+from .sql_result_comparator import SQLResultComparator
+
+# Number of differing rows that are retrieved per direction to show to the student.
+SAMPLE_ROWS = 5
+
+# Name of the sql function that applies the comparator's TEXT/BLOB normalization.
+NORMALIZE_FUNCTION = "judge_normalize"
+
+
+def unmangle_column_names(description: tuple) -> list[str]:
+    """Restore the column names of a query result that was stored with 'CREATE TABLE ... AS'.
+
+    SQLite renames duplicate column names to 'name:1', 'name:2' ... when it creates a table
+    from a query result, this function undoes that renaming so the names are shown as the query returned them.
+
+    Args:
+        description: cursor description of a 'SELECT *' on the materialized table
+
+    Returns:
+        the original (uppercase) column names
+    """
+    names: list[str] = []
+    for column in description:
+        name = column[0]
+        base, separator, suffix = name.rpartition(":")
+        if separator and suffix.isdigit() and base in names:
+            name = base
+        names.append(name)
+    return [name.upper() for name in names]
+
+
+def _typeof(python_type: SqliteColumnType) -> str:
+    return python_type_to_sqlite_type[python_type].lower()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLResultDiff:
+    """a class for comparing two materialized query results inside SQLite.
+
+    The full results of the solution and submission queries are stored as the 'result' table
+    in the 'expected' and 'generated' databases. Row counts, type profiles, row equality and
+    the multiset difference are all computed with sql, only the rows that are shown in the
+    feedback (at most 'max_rows' per result plus a small sample of differing rows) are
+    fetched into Python.
+    """
+
+    def __init__(self, expected: SQLQueryResult, generated: SQLQueryResult) -> None:
+        """Create SQLResultDiff.
+
+        Should not be used directly (other than testing). Use 'from_cursor' instead.
+
+        Args:
+            expected: displayed part of the solution result
+            generated: displayed part of the submission result
+        """
+        self.expected = expected
+        self.generated = generated
+
+        self.expected_row_count = expected.row_count
+        self.generated_row_count = generated.row_count
+
+        # True if both results have the same column names (after matching their order)
+        self.columns_equal = False
+        # True if both results contain the same rows in the same order
+        self.rows_equal = False
+        # True if both results contain the same rows, regardless of order
+        self.multiset_equal = False
+
+        # number of expected rows missing from the submission and unexpected rows in the submission,
+        # None if the results can't be compared row by row (eg. different column count)
+        self.missing_count: int | None = None
+        self.unexpected_count: int | None = None
+        self.missing_sample: SQLQueryResult | None = None
+        self.unexpected_sample: SQLQueryResult | None = None
+
+    def equals(self, *, ignore_order: bool) -> bool:
+        """Check if both results are considered equal.
+
+        Args:
+            ignore_order: only require both results to contain the same rows
+
+        Returns:
+            True if both results are equal, including their column names
+        """
+        return self.columns_equal and (self.multiset_equal if ignore_order else self.rows_equal)
+
+    @classmethod
+    def from_cursor(
+        cls: type["SQLResultDiff"],
+        cursor: sqlite3.Cursor,
+        max_rows: int,
+        allow_different_column_order: bool,  # noqa: FBT001
+        comparator: SQLResultComparator | None = None,
+        max_value_length: int = MAX_VALUE_LENGTH,
+    ) -> "SQLResultDiff":
+        """Compare the materialized 'expected.result' and 'generated.result' tables.
+
+        The float tolerance of the comparator is only used when comparing rows in order; the
+        order-independent comparison only applies the TEXT/BLOB normalization.
+
+        Args:
+            cursor: a cursor for a database in which 'expected' and 'generated' are attached
+            max_rows: max number of rows to retrieve for display
+            allow_different_column_order: match the expected columns to the submitted columns by name
+            comparator: the comparator used to loosen the comparison
+            max_value_length: max length of a displayed TEXT or BLOB value, see 'SQLQueryResult.from_cursor'
+
+        Returns:
+            the comparison of both results
+        """
+        expected_columns, expected = _display_result(cursor, "expected", max_rows, max_value_length)
+        generated_columns, generated = _display_result(cursor, "generated", max_rows, max_value_length)
+
+        diff = cls(expected, generated)
+
+        if len(expected_columns) != len(generated_columns):
+            return diff
+
+        argsort = (
+            column_argsort(expected_columns, generated_columns)
+            if allow_different_column_order
+            else list(range(len(expected_columns)))
+        )
+        diff.columns_equal = [expected_columns[i] for i in argsort] == generated_columns
+        expected_names = [_quote(name) for name in _raw_column_names(cursor, "expected")]
+        expected_names = [expected_names[i] for i in argsort]
+        generated_names = [_quote(name) for name in _raw_column_names(cursor, "generated")]
+
+        if comparator is not None and not comparator.is_exact:
+            cursor.connection.create_function(NORMALIZE_FUNCTION, 1, comparator.normalize_value, deterministic=True)
+
+        if diff.expected_row_count == diff.generated_row_count:
+            predicate = " AND ".join(
+                _equal_sql(f"e.{e}", f"g.{g}", comparator) for e, g in zip(expected_names, generated_names, strict=True)
+            )
+            cursor.execute(
+                "SELECT count(*) FROM expected.result e JOIN generated.result g ON e.rowid = g.rowid "  # noqa: S608
+                f"WHERE NOT ({predicate or 1})"
+            )
+            (differing,) = cursor.fetchone()
+            diff.rows_equal = differing == 0
+
+        if diff.rows_equal:
+            diff.multiset_equal = True
+            diff.missing_count, diff.unexpected_count = 0, 0
+            return diff
+
+        header = [expected_columns[i] for i in argsort]
+        diff.missing_count, diff.missing_sample = _except_all(
+            cursor, ("expected", expected_names), ("generated", generated_names), header, comparator, max_value_length
+        )
+        diff.unexpected_count, diff.unexpected_sample = _except_all(
+            cursor,
+            ("generated", generated_names),
+            ("expected", expected_names),
+            generated_columns,
+            comparator,
+            max_value_length,
+        )
+        diff.multiset_equal = diff.missing_count == 0 and diff.unexpected_count == 0
+        return diff
+
+
+def _raw_column_names(cursor: sqlite3.Cursor, schema: str) -> list[str]:
+    cursor.execute(f"SELECT * FROM {schema}.result LIMIT 0")  # noqa: S608
+    return [column[0] for column in cursor.description or []]
+
+
+def _display_result(
+    cursor: sqlite3.Cursor, schema: str, max_rows: int, max_value_length: int
+) -> tuple[list[str], SQLQueryResult]:
+    """Retrieve the displayed rows of a materialized result, with a type profile and row count of the whole result.
+
+    Args:
+        cursor: a cursor for a database in which 'schema' is attached
+        schema: 'expected' or 'generated'
+        max_rows: max number of rows to retrieve
+        max_value_length: max length of a displayed TEXT or BLOB value
+
+    Returns:
+        (column names, displayed result)
+    """
+    raw_names = _raw_column_names(cursor, schema)
+    columns = unmangle_column_names(cursor.description or ())
+
+    # A single scan counts the storage classes of all columns at once, which also gives the row count.
+    storage_types = [t for t in python_type_to_sqlite_type if t is not NoneType] + [NoneType]
+    if len(raw_names) > 0:
+        cursor.execute(
+            "SELECT "  # noqa: S608
+            + ", ".join(f"total(typeof({_quote(name)}) = '{_typeof(t)}')" for name in raw_names for t in storage_types)
+            + f" FROM {schema}.result"
+        )
+        counts = cursor.fetchone()
+    else:
+        counts = ()
+
+    cursor.execute(f"SELECT * FROM {schema}.result ORDER BY rowid LIMIT ?", (max_rows,))  # noqa: S608
+    result = SQLQueryResult.from_cursor(max_rows, cursor, max_value_length)
+
+    if len(result.columns) > 0:
+        result.columns = columns
+        result.type_profile = [
+            Counter(
+                {
+                    t: int(counts[i * len(storage_types) + j])
+                    for j, t in enumerate(storage_types)
+                    if counts[i * len(storage_types) + j] > 0
+                }
+            )
+            for i in range(len(columns))
+        ]
+        result.row_count = int(sum(counts[: len(storage_types)]))
+
+    return columns, result
+
+
+def _normalized_sql(expression: str, comparator: SQLResultComparator | None) -> str:
+    if comparator is None or comparator.is_exact:
+        return expression
+    return f"{NORMALIZE_FUNCTION}({expression})"
+
+
+def _equal_sql(expected: str, generated: str, comparator: SQLResultComparator | None) -> str:
+    """Create an sql expression that checks if two values are equal.
+
+    Without comparator, two values are only equal if they have the same value and storage class,
+    just like their csv representation would be identical.
+
+    Args:
+        expected: sql expression for the expected value
+        generated: sql expression for the generated value
+        comparator: the comparator used to loosen the comparison
+
+    Returns:
+        sql boolean expression
+    """
+    equal = (
+        f"({_normalized_sql(expected, comparator)} IS {_normalized_sql(generated, comparator)}"
+        f" AND typeof({expected}) = typeof({generated}))"
+    )
+
+    if comparator is None or not comparator.has_float_tolerance:
+        return equal
+
+    numeric = "('integer', 'real')"
+    return (
+        f"({equal} OR (typeof({expected}) IN {numeric} AND typeof({generated}) IN {numeric}"
+        f" AND 'real' IN (typeof({expected}), typeof({generated}))"
+        f" AND abs({generated} - {expected})"
+        f" <= {comparator.absolute_tolerance!r} + {comparator.relative_tolerance!r} * abs({expected})))"
+    )
+
+
+def _except_all(  # noqa: PLR0913, PLR0917
+    cursor: sqlite3.Cursor,
+    left: tuple[str, list[str]],
+    right: tuple[str, list[str]],
+    header: list[str],
+    comparator: SQLResultComparator | None,
+    max_value_length: int,
+) -> tuple[int, SQLQueryResult]:
+    """Count (and sample) the rows of 'left' that are not in 'right', taking duplicate rows into account.
+
+    SQLite has no EXCEPT ALL, it is emulated by numbering identical rows with row_number(): the n-th
+    copy of a row in 'left' only matches the n-th copy of that row in 'right'.
+
+    Args:
+        cursor: a cursor for a database in which both schemas are attached
+        left: (schema, quoted column names) of the result to take rows from
+        right: (schema, quoted column names) of the result to remove rows from
+        header: column names for the sampled rows
+        comparator: the comparator used to loosen the comparison
+        max_value_length: max length of a displayed TEXT or BLOB value
+
+    Returns:
+        (number of rows in left that are not in right, sample of those rows)
+    """
+
+    def keyed(schema: str, names: list[str]) -> str:
+        values = [f"{_normalized_sql(name, comparator)} AS value{i}" for i, name in enumerate(names)]
+        types = [f"typeof({name}) AS type{i}" for i, name in enumerate(names)]
+        partition = ", ".join([_normalized_sql(name, comparator) for name in names] + [f"typeof({n})" for n in names])
+        return (
+            f"SELECT {', '.join([*values, *types])}, "  # noqa: S608
+            f"row_number() OVER (PARTITION BY {partition}) AS occurrence FROM {schema}.result"
+        )
+
+    cursor.execute("DROP TABLE IF EXISTS temp.difference")
+    cursor.execute(f"CREATE TEMP TABLE difference AS {keyed(*left)} EXCEPT {keyed(*right)}")
+    cursor.execute("SELECT count(*) FROM temp.difference")
+    (count,) = cursor.fetchone()
+
+    values = ", ".join(f"value{i}" for i in range(len(left[1])))
+    cursor.execute(f"SELECT {values} FROM temp.difference LIMIT ?", (SAMPLE_ROWS,))  # noqa: S608
+    sample = SQLQueryResult.from_cursor(SAMPLE_ROWS, cursor, max_value_length)
+    if len(sample.columns) > 0:
+        sample.columns = header
+
+    return count, sample
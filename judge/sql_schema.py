@@ -0,0 +1,164 @@
+"""fingerprints of the schema objects (tables, indexes, views and triggers) of a database."""
+
+import hashlib
+import sqlite3
+from typing import ClassVar
+
+from .instrumentation import instrumentation
+from .sql_query import SQLQuery
+
+# Max number of database schemas that are kept in the fingerprint cache.
+CACHE_SIZE = 64
+
+
+def normalize_sql(sql: str | None) -> str:
+    """Normalize the sql definition of a schema object, so equivalent definitions are equal.
+
+    Whitespace and comments are ignored, identifier quotes are removed and everything except
+    string literals is case folded.
+
+    Args:
+        sql: the definition as stored in sqlite_master (None for automatic indexes)
+
+    Returns:
+        the normalized definition
+    """
+    if sql is None or sql.strip() == "":
+        return ""
+
+    symbols = [symbol for query in SQLQuery.from_raw_input(sql) for symbol in query.symbols]
+    return " ".join(symbol if symbol.startswith("'") else symbol.strip('"`[]').casefold() for symbol in symbols)
+
+
+class SQLSchemaObject:
+    """a class for a single schema object and its fingerprint."""
+
+    def __init__(self, object_type: str, name: str, fingerprint: str) -> None:
+        """Create SQLSchemaObject.
+
+        Args:
+            object_type: 'table', 'index', 'view' or 'trigger'
+            name: name of the object
+            fingerprint: digest of the object's normalized definition
+        """
+        self.object_type = object_type
+        self.name = name
+        self.fingerprint = fingerprint
+
+
+class SQLSchema:
+    """a class for the fingerprints of all schema objects of a database.
+
+    The fingerprint of a table only covers its columns (name, type, not null, default value
+    and primary key, regardless of the column order), just like the column by column
+    comparison it replaces. Indexes, views and triggers are fingerprinted by their normalized
+    sql definition, indexes also by their columns.
+
+    The whole schema of a database is determined by the contents of sqlite_master, which are
+    cheap to read. These are used as cache key, so the (more expensive) fingerprints of a
+    schema are only computed once, no matter how many database files share it.
+    """
+
+    _cache: ClassVar[dict[str, "SQLSchema"]] = {}
+
+    def __init__(self, objects: list[SQLSchemaObject]) -> None:
+        """Create SQLSchema.
+
+        Should not be used directly (other than testing). Use 'from_cursor' instead.
+
+        Args:
+            objects: the schema objects in sqlite_master order
+        """
+        self.objects = objects
+        # sqlite names are case insensitive
+        self.by_name = {obj.name.upper(): obj for obj in objects}
+
+    @classmethod
+    def from_cursor(cls: type["SQLSchema"], cursor: sqlite3.Cursor, schema: str) -> "SQLSchema":
+        """Fingerprint all schema objects of an attached database.
+
+        Args:
+            cursor: a cursor for a database in which 'schema' is attached
+            schema: name of the attached database (eg. 'solution' or 'submission')
+
+        Returns:
+            the fingerprinted schema
+        """
+        cursor.execute(f"SELECT type, name, sql FROM {schema}.sqlite_master ORDER BY rowid")  # noqa: S608
+        master = cursor.fetchall()
+
+        key = hashlib.sha1(repr(master).encode(), usedforsecurity=False).hexdigest()
+        instrumentation.count("schema_cache_hits" if key in cls._cache else "schema_cache_misses")
+        if key not in cls._cache:
+            if len(cls._cache) >= CACHE_SIZE:
+                cls._cache.pop(next(iter(cls._cache)))
+            cls._cache[key] = cls(
+                [cls.fingerprint(cursor, schema, object_type, name, sql) for object_type, name, sql in master]
+            )
+        return cls._cache[key]
+
+    @staticmethod
+    def fingerprint(
+        cursor: sqlite3.Cursor, schema: str, object_type: str, name: str, sql: str | None
+    ) -> SQLSchemaObject:
+        """Fingerprint a single schema object.
+
+        Args:
+            cursor: a cursor for a database in which 'schema' is attached
+            schema: name of the attached database
+            object_type: 'table', 'index', 'view' or 'trigger'
+            name: name of the object
+            sql: definition of the object
+
+        Returns:
+            the fingerprinted object
+        """
+        parts: list[object] = [object_type]
+
+        if object_type in {"table", "view"}:
+            cursor.execute('SELECT name, type, "notnull", dflt_value, pk FROM pragma_table_info(?, ?)', (name, schema))
+            columns = sorted(cursor.fetchall(), key=repr)
+            parts.append(columns)
+
+        if object_type == "index":
+            cursor.execute(
+                'SELECT name, "desc", coll, key FROM pragma_index_xinfo(?, ?) ORDER BY seqno', (name, schema)
+            )
+            parts.append(cursor.fetchall())
+
+        if object_type != "table":
+            parts.append(normalize_sql(sql))
+
+        fingerprint = hashlib.sha1(repr(parts).encode(), usedforsecurity=False).hexdigest()
+        return SQLSchemaObject(object_type, name, fingerprint)
+
+
+def compare_schemas(solution: SQLSchema, submission: SQLSchema) -> list[tuple[SQLSchemaObject, bool]]:
+    """Compare the schema objects of the solution and submission database.
+
+    Objects are matched by name (case insensitive). The result lists all objects that are only
+    in one of both databases, followed by all solution tables (except the internal sqlite tables),
+    followed by the other solution objects that are also in the submission but have a different definition.
+    A table that is missing from the submission is therefore listed twice.
+
+    Args:
+        solution: the fingerprinted solution schema
+        submission: the fingerprinted submission schema
+
+    Returns:
+        list of (object, has_different_layout)
+    """
+    layouts = [(obj, True) for obj in solution.objects if obj.name.upper() not in submission.by_name]
+    layouts += [(obj, True) for obj in submission.objects if obj.name.upper() not in solution.by_name]
+
+    for obj in solution.objects:
+        other = submission.by_name.get(obj.name.upper())
+        if obj.object_type == "table":
+            # same as "name NOT LIKE 'sqlite_%'", in which '_' matches any character
+            if len(obj.name) > len("sqlite") and obj.name[: len("sqlite")].upper() == "SQLITE":
+                continue
+            layouts += [(obj, other is None or other.fingerprint != obj.fingerprint)]
+        elif other is not None and other.fingerprint != obj.fingerprint:
+            layouts += [(obj, True)]
+
+    return layouts
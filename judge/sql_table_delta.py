@@ -0,0 +1,149 @@
+"""row level comparison of the content of a table in the solution and submission database."""
+
+import sqlite3
+
+from .sql_query_result import MAX_VALUE_LENGTH, SQLQueryResult
+
+# Number of unchanged rows that are shown before and after every differing row.
+CONTEXT_ROWS = 1
+
+# Header of the column that describes how a row differs.
+STATUS_COLUMN = "+/-"
+
+# Row status markers: only in the solution, only in the submission, and different values.
+MISSING, UNEXPECTED, CHANGED = "-", "+", "~"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+class SQLTableDelta:
+    """a class for showing only the rows of a table that differ between the solution and submission.
+
+    Rows are matched on the table's primary key, so only tables with a usable primary key can be
+    compared (see 'SQLDatabase.keyed_columns'). The differences are computed in SQLite, only the
+    differing rows (at most 'max_rows') and a few neighbouring rows for context are fetched.
+
+    The first column of both results describes the row: '-' for a row that is missing from the
+    submission, '+' for an unexpected row in the submission and '~' followed by the names of the
+    changed columns for a row of which some values differ. Context rows have the same status
+    (empty if they are unchanged), even if they are beyond the first 'max_rows' differing rows.
+    """
+
+    def __init__(self, expected: SQLQueryResult, generated: SQLQueryResult) -> None:
+        """Create SQLTableDelta.
+
+        Should not be used directly (other than testing). Use 'from_cursor' instead.
+
+        Args:
+            expected: the shown rows of the solution table
+            generated: the shown rows of the submission table
+        """
+        self.expected = expected
+        self.generated = generated
+
+        # number of rows per status, over the whole table
+        self.missing_count = 0
+        self.unexpected_count = 0
+        self.changed_count = 0
+
+    @classmethod
+    def from_cursor(  # noqa: PLR0913
+        cls: type["SQLTableDelta"],
+        cursor: sqlite3.Cursor,
+        table: str,
+        primary_key: list[str],
+        counts: tuple[int, int, int],
+        max_rows: int,
+        *,
+        max_value_length: int = MAX_VALUE_LENGTH,
+    ) -> "SQLTableDelta":
+        """Compare a table that has the same layout in the 'solution' and 'submission' databases.
+
+        Args:
+            cursor: a cursor for a database in which 'solution' and 'submission' are attached
+            table: name of the table (without single quotes, see 'SQLDatabase.diff')
+            primary_key: quoted columns of the table's primary key, see 'SQLDatabase.keyed_columns'
+            counts: (changed, deleted, inserted) number of rows, see 'SQLDatabase.count_differences'
+            max_rows: max number of differing rows to show
+            max_value_length: max length of a shown TEXT or BLOB value, see 'SQLQueryResult.from_cursor'
+
+        Returns:
+            the row level comparison of the table
+        """
+        cursor.execute("SELECT name FROM pragma_table_info(?, 'solution') ORDER BY cid", (table,))
+        columns = [name for (name,) in cursor.fetchall()]
+
+        def match(left: str, right: str) -> str:
+            return " AND ".join(f"{left}.{k} IS {right}.{k}" for k in primary_key)
+
+        def shown_match(alias: str) -> str:
+            return " AND ".join(f"shown.key{i} IS {alias}.{k}" for i, k in enumerate(primary_key))
+
+        def key_columns(alias: str) -> str:
+            return ", ".join(f"{alias}.{k} AS key{i}" for i, k in enumerate(primary_key))
+
+        changed_columns = " || ".join(
+            f"CASE WHEN s.{_quote(name)} IS NOT b.{_quote(name)} THEN {_literal(', ' + name.upper())} ELSE '' END"
+            for name in columns
+        )
+        equal = " AND ".join(f"s.{_quote(name)} IS b.{_quote(name)}" for name in columns)
+        solution, submission = f"solution.'{table}'", f"submission.'{table}'"
+
+        cursor.execute("DROP TABLE IF EXISTS temp.delta")
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE delta AS
+            SELECT {key_columns("s")}, '{MISSING}' AS status FROM {solution} s
+            WHERE NOT EXISTS (SELECT 1 FROM {submission} b WHERE {match("b", "s")})
+            UNION ALL
+            SELECT {key_columns("b")}, '{UNEXPECTED}' FROM {submission} b
+            WHERE NOT EXISTS (SELECT 1 FROM {solution} s WHERE {match("s", "b")})
+            UNION ALL
+            SELECT {key_columns("s")}, '{CHANGED} ' || substr({changed_columns}, 3)
+            FROM {solution} s JOIN {submission} b ON {match("s", "b")}
+            WHERE NOT ({equal})
+            """  # noqa: S608
+        )
+
+        # Number all keys of both tables in order, and keep the first 'max_rows' differing rows and their neighbours.
+        key_names = ", ".join(f"key{i}" for i in range(len(primary_key)))
+        delta_match = " AND ".join(f"numbered.key{i} IS d.key{i}" for i in range(len(primary_key)))
+        cursor.execute("DROP TABLE IF EXISTS temp.shown")
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE shown AS
+            WITH numbered AS (
+                SELECT {key_names}, row_number() OVER (ORDER BY {key_names}) AS position FROM (
+                    SELECT {key_columns("s")} FROM {solution} s UNION SELECT {key_columns("b")} FROM {submission} b
+                )
+            ), differing AS (
+                SELECT numbered.*, d.status FROM numbered JOIN temp.delta d ON {delta_match}
+                ORDER BY position LIMIT ?
+            ), shifts(shift) AS (
+                SELECT -? UNION ALL SELECT shift + 1 FROM shifts WHERE shift < ?
+            )
+            SELECT numbered.*, coalesce(d.status, '') AS status
+            FROM numbered LEFT JOIN temp.delta d ON {delta_match}
+            WHERE numbered.position IN (SELECT position + shift FROM differing, shifts)
+            """,  # noqa: S608
+            (max_rows, CONTEXT_ROWS, CONTEXT_ROWS),
+        )
+        cursor.execute("SELECT count(*) FROM temp.shown")
+        (shown_count,) = cursor.fetchone()
+
+        def shown_rows(side: str) -> SQLQueryResult:
+            cursor.execute(
+                f"SELECT shown.status AS {_quote(STATUS_COLUMN)}, s.* "  # noqa: S608
+                f"FROM temp.shown JOIN {side} s ON {shown_match('s')} ORDER BY shown.position"
+            )
+            return SQLQueryResult.from_cursor(shown_count, cursor, max_value_length)
+
+        delta = cls(shown_rows(solution), shown_rows(submission))
+        delta.changed_count, delta.missing_count, delta.unexpected_count = counts
+        return delta
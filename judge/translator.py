@@ -42,6 +42,13 @@ class Translator:
         CORRECT_ROWS_WRONG_ORDER = auto()
         COMPARING_TABLE_LAYOUT = auto()
         COMPARING_TABLE_CONTENT = auto()
+        COMPARING_OBJECT_DEFINITION = auto()
+        MISSING_AND_UNEXPECTED_ROWS = auto()
+        MISSING_ROWS_SAMPLE = auto()
+        UNEXPECTED_ROWS_SAMPLE = auto()
+        OUTPUT_LIMIT_OMITTED_MESSAGES = auto()
+        TABLE_DELTA_SUMMARY = auto()
+        SKIPPED_CONTEXTS = auto()
 
     def __init__(self, language: Language) -> None:
         """Create Translator.
@@ -160,6 +167,17 @@ class Translator:
             Text.CORRECT_ROWS_WRONG_ORDER: "The rows are correct but in the wrong order.",
             Text.COMPARING_TABLE_LAYOUT: "Comparing the table layout of `{table}`.",
             Text.COMPARING_TABLE_CONTENT: "Comparing the table content of `{table}`.",
+            Text.COMPARING_OBJECT_DEFINITION: "Comparing the definition of `{name}`.",
+            Text.MISSING_AND_UNEXPECTED_ROWS: "{missing} expected row(s) are missing from your output "
+            "and {unexpected} row(s) of your output were not expected.",
+            Text.MISSING_ROWS_SAMPLE: "Some of the missing rows:",
+            Text.UNEXPECTED_ROWS_SAMPLE: "Some of the unexpected rows:",
+            Text.OUTPUT_LIMIT_OMITTED_MESSAGES: "The feedback became too long, {omitted} message(s) were left out.",
+            Text.TABLE_DELTA_SUMMARY: "Only the differing rows (and their neighbouring rows) are shown: "
+            "{missing} row(s) are missing (`-`), {unexpected} row(s) are unexpected (`+`) and {changed} row(s) "
+            "have different values (`~`, followed by the changed columns).",
+            Text.SKIPPED_CONTEXTS: "This query and the following ones were not checked on {count} other database(s) "
+            "({databases}), because this query is already wrong on another database.",
         },
         Language.NL: {
             Text.ADD_A_SEMICOLON: "Voeg een puntkomma ';' toe aan het einde van elke SQL query.",
@@ -186,5 +204,16 @@ class Translator:
             Text.CORRECT_ROWS_WRONG_ORDER: "Het query resultaat bevat de juiste rijen, maar in de verkeerde volgorde.",
             Text.COMPARING_TABLE_LAYOUT: "Vergelijken van de tabel lay-out van `{table}`.",
             Text.COMPARING_TABLE_CONTENT: "Vergelijken van de tabel inhoud van `{table}`.",
+            Text.COMPARING_OBJECT_DEFINITION: "Vergelijken van de definitie van `{name}`.",
+            Text.MISSING_AND_UNEXPECTED_ROWS: "{missing} verwachte rij(en) ontbreken in uw output "
+            "en {unexpected} rij(en) van uw output werden niet verwacht.",
+            Text.MISSING_ROWS_SAMPLE: "Enkele van de ontbrekende rijen:",
+            Text.UNEXPECTED_ROWS_SAMPLE: "Enkele van de onverwachte rijen:",
+            Text.OUTPUT_LIMIT_OMITTED_MESSAGES: "De feedback werd te lang, {omitted} bericht(en) werden weggelaten.",
+            Text.TABLE_DELTA_SUMMARY: "Enkel de verschillende rijen (en hun buren) worden getoond: {missing} rij(en) "
+            "ontbreken (`-`), {unexpected} rij(en) werden niet verwacht (`+`) en {changed} rij(en) hebben andere "
+            "waarden (`~`, gevolgd door de gewijzigde kolommen).",
+            Text.SKIPPED_CONTEXTS: "Deze query en de volgende werden niet gecontroleerd op {count} andere "
+            "database(s) ({databases}), omdat deze query al fout is op een andere database.",
         },
     }
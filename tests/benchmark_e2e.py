@@ -0,0 +1,215 @@
+"""Benchmark the judge on the e2e exercises.
+
+Every exercise/submission pair of the e2e fixture repo (see `tests/test_e2e.py`), or of another
+exercise directory (eg. made by `tests/generate_exercises.py`), is judged several times
+in-process, exactly like the e2e test does. The wall time of every run is measured without
+any instrumentation, like the judge runs on Dodona. The per-phase split is read from the
+judge's own metrics (see the `metrics_file` option) of one extra instrumented run, so the
+instrumentation overhead never shows up in the wall times. Every case runs in its own
+(spawned) process, so its peak RSS is not inflated by the cases before it. Run it with
+`devel/benchmark.sh` or `python -m tests.benchmark_e2e`.
+
+The results can be stored as a baseline (`--save`). Later runs are compared against that
+baseline, and the benchmark fails if the median wall time of a case grew by more than the
+threshold.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import resource
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pathlib import Path
+
+from .e2e_cases import EXERCISES_PATH, ROOT_PATH, discover_cases, judge_config
+from .fake_in_out import fake_in_out
+
+BASELINE_PATH = ROOT_PATH / "tests" / "benchmark_baseline.json"
+
+# Number of phases (with the largest median time) that are shown per case.
+SHOWN_PHASES = 3
+
+# Smallest median (in ms) a regression is computed against, a baseline of 0 ms can't grow by a percentage.
+MIN_MEDIAN_MS = 0.001
+
+
+def run_judge(config: dict, workdir: Path, *, instrumented: bool = False) -> tuple[float, dict]:
+    """Judge a submission once.
+
+    Args:
+        config: the judge config, see `judge_config`
+        workdir: the judge workdir (also used as current directory)
+        instrumented: write the judge's metrics, this slows the judge down
+
+    Returns:
+        (wall time in ms, the judge's metrics of this run, empty if not instrumented)
+    """
+    config = {**config, "workdir": str(workdir)}
+    metrics_file = workdir / "metrics.jsonl"
+    if instrumented:
+        metrics_file.unlink(missing_ok=True)
+        config["metrics_file"] = metrics_file.name
+
+    start = time.perf_counter()
+    with fake_in_out(StringIO(json.dumps(config))):
+        runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+    wall_time = (time.perf_counter() - start) * 1000
+
+    return wall_time, json.loads(metrics_file.read_text(encoding="utf-8")) if instrumented else {}
+
+
+def percentile_95(values: list[float]) -> float:
+    """Compute the 95th percentile.
+
+    Args:
+        values: the measurements
+
+    Returns:
+        95th percentile, or the only value if there is just one
+    """
+    if len(values) < 2:  # noqa: PLR2004
+        return values[0]
+    return statistics.quantiles(values, n=20, method="inclusive")[-1]
+
+
+def benchmark_case(exercise_path: Path, submission_path: Path, repeat: int, warmup: int = 1) -> dict:
+    """Judge one exercise/submission pair 'repeat' times.
+
+    The databases are copied into a new workdir before every run, like Dodona does. The warmup
+    runs are not measured, they keep one-time costs (eg. importing pandas for the first case,
+    reading the database files from disk) out of the results. The time per phase is taken from
+    one more, instrumented run.
+
+    Args:
+        exercise_path: directory of the exercise
+        submission_path: submission file to judge
+        repeat: number of measured runs
+        warmup: number of runs before the measured runs
+
+    Returns:
+        the median and 95th percentile wall time, the peak RSS and the time per phase
+    """
+    wall_times: list[float] = []
+    metrics: dict = {}
+
+    for run in range(warmup + repeat + 1):
+        instrumented = run == warmup + repeat
+        with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+            config = judge_config(exercise_path, submission_path, Path(workdir))
+            wall_time, metrics = run_judge(config, Path(workdir), instrumented=instrumented)
+
+        if warmup <= run and not instrumented:
+            wall_times.append(wall_time)
+
+    return {
+        "median_ms": statistics.median(wall_times),
+        "p95_ms": percentile_95(wall_times),
+        # ru_maxrss is the peak of the whole process (in KiB on Linux), see 'benchmark_case_process'
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "phases_ms": metrics["phases_ms"],
+    }
+
+
+def benchmark_case_process(exercise_path: Path, submission_path: Path, repeat: int, warmup: int = 1) -> dict:
+    """Run 'benchmark_case' in a new process, so the peak RSS is that of this case only.
+
+    Args:
+        exercise_path: directory of the exercise
+        submission_path: submission file to judge
+        repeat: number of measured runs
+        warmup: number of runs before the measured runs
+
+    Returns:
+        the results of 'benchmark_case'
+    """
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(benchmark_case, exercise_path, submission_path, repeat, warmup).result()
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """Find the cases of which the median wall time regressed compared to the baseline.
+
+    Args:
+        results: benchmark results per case id
+        baseline: stored benchmark results per case id
+        threshold: max relative increase of the median wall time (eg. 0.2 for 20%)
+
+    Returns:
+        a description of every regression
+    """
+    regressions = []
+    for case_id, result in results.items():
+        if case_id not in baseline:
+            continue
+        before, after = max(baseline[case_id]["median_ms"], MIN_MEDIAN_MS), result["median_ms"]
+        if after > before * (1 + threshold):
+            regressions.append(f"{case_id}: median {before:.1f} ms -> {after:.1f} ms (+{after / before - 1:.0%})")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the benchmark.
+
+    Args:
+        argv: command line arguments, see `--help`
+
+    Returns:
+        exit code, 1 if a case regressed
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exercises", type=Path, default=EXERCISES_PATH, help="directory with the exercises")
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="number of runs per case (default: 10)")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured runs per case (default: 1)")
+    parser.add_argument("-k", "--filter", default="", help="only run the cases whose id contains this text")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed median increase (default: 0.2)")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    # the judge imports the 'judge' package relative to the repository root, not the current directory
+    if str(ROOT_PATH) not in sys.path:
+        sys.path.insert(0, str(ROOT_PATH))
+
+    cases = discover_cases(args.exercises)
+    if len(cases) == 0:
+        print(f"No exercise/submission pairs found in {args.exercises}")
+        return 2
+
+    results: dict[str, dict] = {}
+    for case in cases:
+        if args.filter not in case.id:
+            continue
+        exercise_path, submission_path = case.values
+        result = benchmark_case_process(exercise_path, submission_path, args.repeat, args.warmup)
+        results[case.id] = result
+
+        slowest = sorted(result["phases_ms"].items(), key=lambda phase: -phase[1])[:SHOWN_PHASES]
+        print(
+            f"{case.id:<50} median {result['median_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+            f"rss {result['peak_rss_mb']:6.1f} MB  " + ", ".join(f"{name} {ms:.1f}" for name, ms in slowest)
+        )
+
+    if args.save:
+        args.baseline.write_text(json.dumps(results, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline found at {args.baseline}, run with --save to create one")
+        return 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""Benchmark the query parser on a corpus of worst case submissions.
+
+`SQLQuery.from_raw_input` (which also flattens the symbols of every statement) and `is_ordered`
+run on every submission, and their cost depends on the shape of the input much more than on
+its size. The corpus has one generated submission per shape, modelled on (anonymized)
+submissions that are slow to parse: long IN lists, deeply nested subqueries, big multi-row
+INSERTs, files that are mostly comments, bracketed identifiers and long scripts. More
+submissions (eg. real ones) can be added with `--corpus DIR`, every `.sql` file is a shape.
+
+Every shape is parsed several times, and the statements per second (of the median run) and
+the worst case latency are reported. Like the e2e benchmark, the results can be stored as a
+baseline (`--save`) to which later runs are compared. Run it with `python -m tests.benchmark_parser`.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import string
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from judge.sql_query import SQLQuery
+
+from .benchmark_e2e import compare
+from .e2e_cases import ROOT_PATH
+
+BASELINE_PATH = ROOT_PATH / "tests" / "benchmark_parser_baseline.json"
+
+COLUMNS = ("id", "name", "city", "price", "amount", "created")
+
+
+def _identifier(rng: random.Random) -> str:
+    return rng.choice(COLUMNS) + str(rng.randrange(100))
+
+
+def _literal(rng: random.Random) -> str:
+    if rng.random() < 0.5:  # noqa: PLR2004
+        return str(rng.randrange(1_000_000))
+    return "'" + "".join(rng.choices(string.ascii_letters + " ", k=rng.randint(3, 30))) + "'"
+
+
+def in_list(rng: random.Random, size: int) -> str:
+    """Create a SELECT with a long IN list.
+
+    Args:
+        rng: seeded random generator
+        size: number of values
+
+    Returns:
+        the submission
+    """
+    values = ", ".join(_literal(rng) for _ in range(size))
+    return f"SELECT id, name FROM customer WHERE name IN ({values}) ORDER BY id;\n"  # noqa: S608
+
+
+def deep_subquery(rng: random.Random, size: int) -> str:
+    """Create a SELECT with nested subqueries.
+
+    Args:
+        rng: seeded random generator
+        size: nesting depth
+
+    Returns:
+        the submission
+    """
+    query = "SELECT id FROM t0"
+    for depth in range(1, size + 1):
+        query = f"SELECT id FROM t{depth} WHERE {_identifier(rng)} > {_literal(rng)} AND id IN ({query})"  # noqa: S608
+    return query + " ORDER BY id;\n"
+
+
+def multi_row_insert(rng: random.Random, size: int) -> str:
+    """Create an INSERT of many rows.
+
+    Args:
+        rng: seeded random generator
+        size: number of rows
+
+    Returns:
+        the submission
+    """
+    rows = ",\n".join("(" + ", ".join(_literal(rng) for _ in COLUMNS) + ")" for _ in range(size))
+    return f"INSERT INTO product ({', '.join(COLUMNS)}) VALUES\n{rows};\n"
+
+
+def comments(rng: random.Random, size: int) -> str:
+    """Create a short script in which most lines are comments.
+
+    Args:
+        rng: seeded random generator
+        size: number of comment lines
+
+    Returns:
+        the submission
+    """
+    lines = []
+    for number in range(size):
+        words = " ".join(_identifier(rng) for _ in range(8))
+        lines.append(f"/* {words}\n   {words} */" if number % 5 == 0 else f"-- {words}")
+        if number % 100 == 0:
+            lines.append(f"SELECT {_identifier(rng)} FROM t -- {words}\nWHERE id = {number};")  # noqa: S608
+    return "\n".join(lines) + "\n"
+
+
+def bracketed(rng: random.Random, size: int) -> str:
+    """Create a SELECT that uses bracketed identifiers (with spaces) everywhere.
+
+    Args:
+        rng: seeded random generator
+        size: number of selected columns
+
+    Returns:
+        the submission
+    """
+    columns = ", ".join(f"[{_identifier(rng)} {_identifier(rng)}] AS [c {number}]" for number in range(size))
+    return f"SELECT {columns} FROM [order lines] AS [l] ORDER BY [c 0];\n"  # noqa: S608
+
+
+def many_statements(rng: random.Random, size: int) -> str:
+    """Create a long script of short statements.
+
+    Args:
+        rng: seeded random generator
+        size: number of statements
+
+    Returns:
+        the submission
+    """
+    statements = [
+        f"UPDATE t SET {_identifier(rng)} = {_literal(rng)} WHERE id = {number};"  # noqa: S608
+        if number % 2 == 0
+        else f"SELECT {_identifier(rng)}, {_identifier(rng)} FROM t WHERE id < {number} ORDER BY 1;"  # noqa: S608
+        for number in range(size)
+    ]
+    return "\n".join(statements) + "\n"
+
+
+# The generated shapes, with their default size.
+SHAPES: dict[str, tuple[Callable[[random.Random, int], str], int]] = {
+    "in_list": (in_list, 2000),
+    "deep_subquery": (deep_subquery, 40),
+    "multi_row_insert": (multi_row_insert, 1000),
+    "comments": (comments, 2000),
+    "bracketed": (bracketed, 500),
+    "many_statements": (many_statements, 500),
+}
+
+
+def generate_corpus(seed: int = 0, scale: float = 1.0) -> dict[str, str]:
+    """Generate a submission of every shape.
+
+    Args:
+        seed: seed of the random generator
+        scale: factor for the default size of every shape
+
+    Returns:
+        submission per shape name
+    """
+    rng = random.Random(seed)  # noqa: S311
+    return {name: shape(rng, max(1, round(size * scale))) for name, (shape, size) in SHAPES.items()}
+
+
+def parse(submission: str) -> int:
+    """Parse a submission like the judge does.
+
+    Args:
+        submission: the raw submission
+
+    Returns:
+        number of statements
+    """
+    queries = SQLQuery.from_raw_input(submission)
+    for query in queries:
+        _ = query.is_ordered
+    return len(queries)
+
+
+def benchmark_shape(submission: str, repeat: int) -> dict:
+    """Parse a submission 'repeat' times.
+
+    Args:
+        submission: the raw submission
+        repeat: number of runs
+
+    Returns:
+        the number of statements, the median and worst latency and the statements per second
+    """
+    latencies = []
+    statements = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        statements = parse(submission)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    median = statistics.median(latencies)
+    return {
+        "bytes": len(submission.encode()),
+        "statements": statements,
+        "median_ms": median,
+        "max_ms": max(latencies),
+        "statements_per_s": statements / median * 1000 if median > 0 else 0,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the benchmark.
+
+    Args:
+        argv: command line arguments, see `--help`
+
+    Returns:
+        exit code, 1 if a shape regressed
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="number of runs per shape (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the corpus (default: 0)")
+    parser.add_argument("--scale", type=float, default=1.0, help="factor for the size of every shape (default: 1)")
+    parser.add_argument("--corpus", type=Path, help="directory with extra submissions (.sql files)")
+    parser.add_argument("--write", type=Path, help="also write the generated corpus to this directory")
+    parser.add_argument("-k", "--filter", default="", help="only run the shapes whose name contains this text")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed median increase (default: 0.2)")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    corpus = generate_corpus(args.seed, args.scale)
+    if args.write is not None:
+        args.write.mkdir(parents=True, exist_ok=True)
+        for name, submission in corpus.items():
+            (args.write / f"{name}.sql").write_text(submission, encoding="utf-8")
+    if args.corpus is not None:
+        corpus.update({path.stem: path.read_text(encoding="utf-8") for path in sorted(args.corpus.glob("*.sql"))})
+
+    results: dict[str, dict] = {}
+    for name, submission in corpus.items():
+        if args.filter not in name:
+            continue
+        result = benchmark_shape(submission, args.repeat)
+        results[name] = result
+        print(
+            f"{name:<30} {result['bytes'] / 1024:8.1f} KiB {result['statements']:6d} statements  "
+            f"median {result['median_ms']:8.1f} ms  max {result['max_ms']:8.1f} ms  "
+            f"{result['statements_per_s']:10.1f} statements/s"
+        )
+
+    if args.save:
+        args.baseline.write_text(json.dumps(results, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline found at {args.baseline}, run with --save to create one")
+        return 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Exercise/submission pairs for the e2e test and the benchmark."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+E2E_REPO_NAME = "test-sql-judge"
+EXERCISES_PATH = ROOT_PATH / "tests" / "e2e_repos" / E2E_REPO_NAME
+
+
+def discover_cases(exercises_path: Path = EXERCISES_PATH) -> list:
+    """Discover (exercise, submission) pairs from an exercise repo (by default the e2e fixture repo).
+
+    Args:
+        exercises_path: Directory that contains one directory per exercise.
+
+    Returns:
+        One `pytest.param` per exercise/submission combination, carrying the
+        exercise directory and submission file as values and a readable
+        `<exercise>-<submission>` id.
+    """
+    if not exercises_path.is_dir():
+        return []
+
+    cases = []
+
+    for exercise_path in sorted(exercises_path.iterdir()):
+        if exercise_path.name.startswith("_") or not exercise_path.is_dir():
+            continue
+
+        for submission_path in sorted((exercise_path / "solution").iterdir()):
+            if submission_path.suffix != ".sql":
+                continue
+
+            case_id = f"{exercise_path.name}-{submission_path.stem}"
+            cases.append(pytest.param(exercise_path, submission_path, id=case_id))
+
+    return cases
+
+
+def judge_config(exercise_path: Path, submission_path: Path, workdir: Path) -> dict:
+    """Create the config that Dodona would pass to the judge for one exercise/submission pair.
+
+    Args:
+        exercise_path: Directory of the exercise, e.g. `.../create_table`.
+        submission_path: Submission file to judge, e.g. `.../wrong_name.sql`.
+        workdir: Scratch directory that is used as the judge workdir.
+
+    Returns:
+        The exercise's evaluation settings, completed with the Dodona run settings.
+    """
+    config_path = exercise_path / "config.json"
+
+    with config_path.open("r", encoding="utf-8") as config_file:
+        config = json.load(config_file).get("evaluation", {})
+
+    config.update(
+        {
+            "memory_limit": "99999999",
+            "time_limit": "99999999",
+            "programming_language": "sql",
+            "natural_language": "nl",
+            "resources": str(exercise_path / "evaluation"),
+            "source": str(submission_path),
+            "judge": str(ROOT_PATH),
+            "workdir": str(workdir),
+        }
+    )
+    return config
@@ -0,0 +1,287 @@
+"""Generate large synthetic exercises to scale-test and benchmark the judge.
+
+The generated exercise directory has the same layout as the e2e fixture repo: one directory
+per exercise with a `config.json`, an `evaluation` directory (database and `solution.sql`)
+and a `solution` directory with a correct and a wrong submission. There is a SELECT, INSERT,
+UPDATE and CREATE exercise, which all share the same database.
+
+The database has `--tables` tables of `--rows` rows each. Every table has a key (see `--key`)
+followed by `--columns` columns, of which the types cycle through `--types`. All values are
+drawn from a random generator seeded with `--seed`, so the same arguments always give the
+same exercises. Run it with `python -m tests.generate_exercises OUTPUT_DIR`, and benchmark the
+result with `devel/benchmark.sh --exercises OUTPUT_DIR`.
+"""
+
+import argparse
+import json
+import random
+import shutil
+import sqlite3
+import string
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+COLUMN_TYPES = ("INTEGER", "REAL", "TEXT", "BLOB")
+
+# Key structures: 'integer' is a rowid alias, 'composite' two INTEGER columns, 'text' a TEXT column
+# and 'none' a plain INTEGER column that is not a primary key.
+KEY_TYPES = ("integer", "composite", "text", "none")
+
+# Number of rows that the INSERT exercise inserts.
+INSERTED_ROWS = 10
+
+
+class ExerciseGenerator:
+    """a class that generates a synthetic database and the exercises on top of it."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        seed: int = 0,
+        tables: int = 1,
+        rows: int = 1000,
+        columns: int = 4,
+        types: tuple[str, ...] = COLUMN_TYPES,
+        blob_size: int = 64,
+        key: str = "integer",
+    ) -> None:
+        """Create ExerciseGenerator.
+
+        Args:
+            seed: seed of the random generator
+            tables: number of tables
+            rows: number of rows per table
+            columns: number of (non key) columns per table
+            types: sqlite column types, assigned to the columns in turn
+            blob_size: number of bytes of every BLOB value
+            key: the key structure of every table, see KEY_TYPES
+        """
+        if key not in KEY_TYPES:
+            raise ValueError(f"Unknown key type '{key}', expected one of {', '.join(KEY_TYPES)}.")
+        if any(column_type not in COLUMN_TYPES for column_type in types):
+            raise ValueError(f"Unknown column type in {types}, expected {', '.join(COLUMN_TYPES)}.")
+
+        self.random = random.Random(seed)  # noqa: S311
+        self.tables = [f"t{i:03d}" for i in range(tables)]
+        self.rows = rows
+        self.columns = [(f"c{i}", types[i % len(types)]) for i in range(columns)]
+        self.blob_size = blob_size
+        self.key = key
+
+    @property
+    def key_columns(self) -> list[tuple[str, str]]:
+        """Names and types of the key columns.
+
+        Returns:
+            list of (name, type)
+        """
+        if self.key == "composite":
+            return [("k1", "INTEGER NOT NULL"), ("k2", "INTEGER NOT NULL")]
+        if self.key == "text":
+            return [("id", "TEXT NOT NULL")]
+        return [("id", "INTEGER")]
+
+    @property
+    def order_by(self) -> str:
+        """Order by clause that sorts a table on its key.
+
+        Returns:
+            sql clause
+        """
+        return "ORDER BY " + ", ".join(name for name, _ in self.key_columns)
+
+    def create_table_sql(self, table: str) -> str:
+        """Create the definition of a table.
+
+        Args:
+            table: name of the table
+
+        Returns:
+            CREATE TABLE statement
+        """
+        columns = [f"{name} {column_type}" for name, column_type in self.key_columns + self.columns]
+        if self.key != "none":
+            columns.append(f"PRIMARY KEY ({', '.join(name for name, _ in self.key_columns)})")
+        return f"CREATE TABLE {table} ({', '.join(columns)})"
+
+    def key_values(self, number: int) -> tuple:
+        """Create the key of the n-th row.
+
+        Args:
+            number: row number
+
+        Returns:
+            values of the key columns
+        """
+        if self.key == "composite":
+            return (number // 100, number % 100)
+        if self.key == "text":
+            return (f"key{number:08d}",)
+        return (number,)
+
+    def value(self, column_type: str) -> float | str | bytes:
+        """Draw a random value.
+
+        Args:
+            column_type: sqlite type of the column
+
+        Returns:
+            the value
+        """
+        if column_type == "INTEGER":
+            return self.random.randrange(1_000_000)
+        if column_type == "REAL":
+            return round(self.random.uniform(0, 1000), 3)
+        if column_type == "TEXT":
+            return "".join(self.random.choices(string.ascii_letters, k=self.random.randint(5, 20)))
+        return self.random.randbytes(self.blob_size)
+
+    def table_rows(self, first: int, count: int) -> Iterator[tuple]:
+        """Generate rows with random values.
+
+        Args:
+            first: number of the first row
+            count: number of rows
+
+        Yields:
+            key values followed by the column values
+        """
+        for number in range(first, first + count):
+            yield self.key_values(number) + tuple(self.value(column_type) for _, column_type in self.columns)
+
+    def create_database(self, path: Path) -> None:
+        """Create the database with all tables and rows.
+
+        Args:
+            path: database file, overwritten if it exists
+        """
+        path.unlink(missing_ok=True)
+        connection = sqlite3.connect(path)
+        try:
+            connection.execute("PRAGMA journal_mode = OFF")
+            connection.execute("PRAGMA synchronous = OFF")
+            placeholders = ", ".join("?" for _ in self.key_columns + self.columns)
+            for table in self.tables:
+                connection.execute(self.create_table_sql(table))
+                connection.executemany(
+                    f"INSERT INTO {table} VALUES ({placeholders})",  # noqa: S608
+                    self.table_rows(0, self.rows),
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+    def literal(self, value: float | str | bytes) -> str:
+        """Write a value as sql literal.
+
+        Args:
+            value: the value
+
+        Returns:
+            sql literal
+        """
+        if isinstance(value, bytes):
+            return f"X'{value.hex()}'"
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return repr(value)
+
+    def exercises(self) -> dict[str, tuple[str, str]]:
+        """Create the solution and a wrong submission of every exercise.
+
+        All exercises use the first table. The wrong submissions differ in a small part of a
+        large result, which is the worst case for showing the differences.
+
+        Returns:
+            (solution, wrong submission) per exercise name
+        """
+        table = self.tables[0]
+        rowid = "id" if self.key in {"integer", "none"} else "rowid"
+        first_column, first_type = self.columns[0] if len(self.columns) > 0 else ("id", "INTEGER")
+
+        inserted = list(self.table_rows(self.rows, INSERTED_ROWS))
+
+        def insert(rows: list[tuple]) -> str:
+            values = ",\n".join("(" + ", ".join(self.literal(value) for value in row) + ")" for row in rows)
+            return f"INSERT INTO {table} VALUES\n{values};\n"
+
+        updated = self.literal(self.value(first_type))
+        extra_table = "CREATE TABLE extra (id INTEGER PRIMARY KEY, name TEXT NOT NULL);\n"
+
+        # S608 doesn't apply: these queries are the exercises, they are built from generated names only.
+        return {
+            "select": (
+                f"SELECT * FROM {table} {self.order_by};\n",  # noqa: S608
+                f"SELECT * FROM {table} WHERE {rowid} % 100 <> 1 {self.order_by};\n",  # noqa: S608
+            ),
+            "insert": (insert(inserted), insert(inserted[:-1])),
+            "update": (
+                f"UPDATE {table} SET {first_column} = {updated} WHERE {rowid} % 10 = 0;\n",  # noqa: S608
+                f"UPDATE {table} SET {first_column} = {updated} WHERE {rowid} % 10 = 1;\n",  # noqa: S608
+            ),
+            "create": (extra_table, extra_table.replace(" NOT NULL", "")),
+        }
+
+    def write(self, output: Path) -> None:
+        """Write all exercises, replacing the ones that already exist.
+
+        Args:
+            output: directory in which the exercise directories are created
+        """
+        output.mkdir(parents=True, exist_ok=True)
+        database = output / "_database.sqlite"
+        self.create_database(database)
+
+        for name, (solution, wrong) in self.exercises().items():
+            exercise = output / name
+            shutil.rmtree(exercise, ignore_errors=True)
+            (exercise / "evaluation").mkdir(parents=True)
+            (exercise / "solution").mkdir()
+
+            (exercise / "config.json").write_text(json.dumps({"evaluation": {}}, indent=2) + "\n", encoding="utf-8")
+            shutil.copyfile(database, exercise / "evaluation" / "generated.sqlite")
+            (exercise / "evaluation" / "solution.sql").write_text(solution, encoding="utf-8")
+            (exercise / "solution" / "correct.sql").write_text(solution, encoding="utf-8")
+            (exercise / "solution" / "wrong.sql").write_text(wrong, encoding="utf-8")
+
+        database.unlink()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Generate the exercises.
+
+    Args:
+        argv: command line arguments, see `--help`
+
+    Returns:
+        exit code
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", type=Path, help="directory in which the exercises are created")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--tables", type=int, default=1, help="number of tables (default: 1)")
+    parser.add_argument("--rows", type=int, default=1000, help="number of rows per table (default: 1000)")
+    parser.add_argument("--columns", type=int, default=4, help="number of non key columns per table (default: 4)")
+    parser.add_argument(
+        "--types", default=",".join(COLUMN_TYPES), help=f"column types, in turn (default: {','.join(COLUMN_TYPES)})"
+    )
+    parser.add_argument("--blob-size", type=int, default=64, help="bytes per BLOB value (default: 64)")
+    parser.add_argument("--key", choices=KEY_TYPES, default="integer", help="key structure (default: integer)")
+    args = parser.parse_args(argv)
+
+    generator = ExerciseGenerator(
+        seed=args.seed,
+        tables=args.tables,
+        rows=args.rows,
+        columns=args.columns,
+        types=tuple(column_type.strip().upper() for column_type in args.types.split(",")),
+        blob_size=args.blob_size,
+        key=args.key,
+    )
+    generator.write(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Test the parser benchmark corpus."""
+
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.benchmark_parser import SHAPES, generate_corpus, main, parse
+
+
+class TestBenchmarkParser(unittest.TestCase):
+    """Parser benchmark TestCase."""
+
+    def test_corpus(self):
+        corpus = generate_corpus(seed=1, scale=0.05)
+        self.assertDictEqual(corpus, generate_corpus(seed=1, scale=0.05))
+        self.assertNotEqual(corpus, generate_corpus(seed=2, scale=0.05))
+        self.assertListEqual(list(corpus), list(SHAPES))
+
+        statements = {name: parse(submission) for name, submission in corpus.items()}
+        self.assertDictEqual(
+            statements,
+            {
+                "in_list": 1,
+                "deep_subquery": 1,
+                "multi_row_insert": 1,
+                "comments": 1,
+                "bracketed": 1,
+                "many_statements": 25,
+            },
+        )
+
+    def test_main(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        corpus, baseline = Path(workdir.name) / "corpus", Path(workdir.name) / "baseline.json"
+        arguments = ["-n", "1", "--scale", "0.01", "--baseline", str(baseline)]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(main([*arguments, "--write", str(corpus), "--save"]), 0)
+            (corpus / "extra.sql").write_text("SELECT 1;\nSELECT 2;\n", encoding="utf-8")
+            self.assertEqual(main([*arguments, "--corpus", str(corpus), "--threshold", "1000"]), 0)
+
+        self.assertListEqual(sorted(path.stem for path in corpus.glob("*.sql")), sorted([*SHAPES, "extra"]))
+        results = json.loads(baseline.read_text(encoding="utf-8"))
+        self.assertListEqual(sorted(results), sorted(SHAPES))
+        self.assertTrue(all(result["statements_per_s"] > 0 for result in results.values()))
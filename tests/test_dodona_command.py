@@ -1,10 +1,33 @@
 """Test DodonaCommand."""
 
+import io
+import json
 import unittest
 
-from judge.dodona_command import AnnotationSeverity, ErrorType, MessageFormat, MessagePermission
+from judge.dodona_command import (
+    AnnotationSeverity,
+    Context,
+    DodonaCommand,
+    DodonaOutput,
+    ErrorType,
+    Judgement,
+    MessageFormat,
+    MessagePermission,
+    OutputBudget,
+    OutputFormat,
+    Tab,
+)
 from judge.dodona_command import Message as CommandMessage
+from judge.dodona_command import Test as CommandTest
 from judge.dodona_command import TestCase as CommandTestCase
+from tests.fake_in_out import fake_in_out
+
+
+def write_commands() -> None:
+    with Judgement(), Context() as context:
+        context.accepted = True
+        with CommandMessage(format=MessageFormat.TEXT, description="test"):
+            pass
 
 
 class TestDodonaCommand(unittest.TestCase):
@@ -47,3 +70,85 @@ class TestDodonaCommand(unittest.TestCase):
                 }
             ).start_args.__dict__,
         )
+
+    def test_output(self):
+        self.addCleanup(setattr, DodonaCommand, "output", DodonaCommand.output)
+
+        DodonaCommand.output = DodonaOutput()
+        with fake_in_out(io.StringIO()) as (out, _):
+            write_commands()
+        pretty = out.getvalue()
+        self.assertTrue(pretty.startswith(json.dumps({"command": "start-judgement"}, indent=1) + "\n"))
+
+        DodonaCommand.output = DodonaOutput(OutputFormat.COMPACT)
+        with fake_in_out(io.StringIO()) as (out, _):
+            write_commands()
+        compact = out.getvalue()
+        self.assertEqual(len(compact.splitlines()), 5)
+
+        # both formats contain the same commands
+        decoder = json.JSONDecoder()
+
+        def decode(output: str) -> list[dict]:
+            commands, index = [], 0
+            while index < len(output):
+                command, index = decoder.raw_decode(output, index)
+                commands.append(command)
+                index += 1  # skip newline
+            return commands
+
+        self.assertListEqual(decode(pretty), decode(compact))
+
+    def test_output_flush_at(self):
+        self.addCleanup(setattr, DodonaCommand, "output", DodonaCommand.output)
+        DodonaCommand.output = DodonaOutput(flush_at=Context)
+
+        with fake_in_out(io.StringIO()) as (out, _), Judgement():
+            with Context():
+                self.assertEqual(out.getvalue(), "")
+            self.assertEqual(out.getvalue().count("close-context"), 1)
+            with Context():
+                pass
+        self.assertEqual(out.getvalue().count("close-judgement"), 1)
+
+    def test_output_budget(self):
+        self.addCleanup(setattr, DodonaCommand, "output", DodonaCommand.output)
+        DodonaCommand.output = DodonaOutput(OutputFormat.COMPACT)
+        DodonaCommand.output.budget = OutputBudget(4000, lambda omitted: f"{omitted} omitted")
+        csv = "\n".join(f"{i},{'x' * 10}" for i in range(50))
+
+        with fake_in_out(io.StringIO()) as (out, _), Judgement(), Tab("tab"):
+            for _ in range(10):
+                with CommandTest("test", csv) as test:
+                    test.generated = csv
+                    with CommandMessage("failure"):
+                        pass
+
+        output = out.getvalue()
+        self.assertLess(len(output), 4000)
+        commands = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(len([c for c in commands if c["command"] != "append-message"]), 2 + 10 * 2 + 2)
+
+        # the first test is complete, later tests are truncated, and finally emptied
+        self.assertEqual(commands[2]["expected"], csv)
+        self.assertTrue(any(c.get("expected", "").endswith("\n\u2026") for c in commands))
+        self.assertEqual(commands[-4]["generated"], "")
+
+        # the expected and generated text of a test are truncated alike
+        expected = [c["expected"] for c in commands if c["command"] == "start-test"]
+        self.assertEqual(expected, [c["generated"] for c in commands if c["command"] == "close-test"])
+
+        # identical messages are left out once the budget runs low, and reported before closing the tab
+        messages = [c["message"] for c in commands if c["command"] == "append-message"]
+        self.assertEqual(messages[0], "failure")
+        self.assertEqual(messages[-1]["description"], f"{10 - len(messages) + 1} omitted")
+        self.assertEqual([c["command"] for c in commands[-2:]], ["close-tab", "close-judgement"])
+
+    def test_output_budget_truncate(self):
+        command = {"command": "start-test", "expected": "a,b\n1,2\n3,4", "description": "test"}
+        self.assertDictEqual(
+            OutputBudget.truncate(command, 10),
+            {"command": "start-test", "expected": "a,b\n1,2\n\u2026", "description": "test"},
+        )
+        self.assertEqual(OutputBudget.truncate({"expected": "abcdef"}, 3)["expected"], "abc\n\u2026")
+        self.assertEqual(OutputBudget.truncate(command, 0)["expected"], "")
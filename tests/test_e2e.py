@@ -9,44 +9,14 @@ from pathlib import Path
 
 import pytest
 
+from .e2e_cases import E2E_REPO_NAME, EXERCISES_PATH, ROOT_PATH, discover_cases, judge_config
 from .fake_in_out import fake_in_out
 
-ROOT_PATH = Path(__file__).resolve().parent.parent
-E2E_REPO_NAME = "test-sql-judge"
-EXERCISES_PATH = ROOT_PATH / "tests" / "e2e_repos" / E2E_REPO_NAME
 STDOUT_PATH = ROOT_PATH / "tests" / "e2e_stdout" / E2E_REPO_NAME
 
 LEARN_OUTPUT = os.environ.get("LEARN_OUTPUT", "NO") == "YES"
 
-
-def _discover_cases() -> list:
-    """Discover (exercise, submission) pairs from the e2e fixture repo.
-
-    Returns:
-        One `pytest.param` per exercise/submission combination, carrying the
-        exercise directory and submission file as values and a readable
-        `<exercise>-<submission>` id.
-    """
-    if not EXERCISES_PATH.is_dir():
-        return []
-
-    cases = []
-
-    for exercise_path in sorted(EXERCISES_PATH.iterdir()):
-        if exercise_path.name.startswith("_") or not exercise_path.is_dir():
-            continue
-
-        for submission_path in sorted((exercise_path / "solution").iterdir()):
-            if submission_path.suffix != ".sql":
-                continue
-
-            case_id = f"{exercise_path.name}-{submission_path.stem}"
-            cases.append(pytest.param(exercise_path, submission_path, id=case_id))
-
-    return cases
-
-
-E2E_CASES = _discover_cases()
+E2E_CASES = discover_cases()
 
 if not E2E_CASES:
     raise RuntimeError(
@@ -103,23 +73,7 @@ def test_e2e(exercise_path: Path, submission_path: Path, tmp_path: Path, monkeyp
         tmp_path: Pytest-provided scratch directory, used as the judge workdir.
         monkeypatch: Used to change into `tmp_path` for the duration of the run.
     """
-    config_path = exercise_path / "config.json"
-
-    with config_path.open("r", encoding="utf-8") as config_file:
-        config = json.load(config_file).get("evaluation", {})
-
-    config.update(
-        {
-            "memory_limit": "99999999",
-            "time_limit": "99999999",
-            "programming_language": "sql",
-            "natural_language": "nl",
-            "resources": str(exercise_path / "evaluation"),
-            "source": str(submission_path),
-            "judge": str(ROOT_PATH),
-            "workdir": str(tmp_path),
-        }
-    )
+    config = judge_config(exercise_path, submission_path, tmp_path)
 
     monkeypatch.chdir(tmp_path)
     with fake_in_out(StringIO(json.dumps(config))) as (out, err):
@@ -0,0 +1,135 @@
+"""Test ExerciseBundle."""
+
+import contextlib
+import json
+import os
+import runpy
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from judge.dodona_config import DodonaConfig
+from judge.exercise_bundle import BUNDLE_FILE, ExerciseBundle, decode_result, encode_result
+from judge.sql_judge_prepare import main, prepare_bundle
+from judge.sql_query_result import SQLQueryResult
+from tests.e2e_cases import ROOT_PATH, judge_config
+from tests.fake_in_out import fake_in_out
+from tests.generate_exercises import ExerciseGenerator
+
+
+class TestExerciseBundle(unittest.TestCase):
+    """ExerciseBundle TestCase."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        ExerciseGenerator(rows=50).write(self.directory / "exercises")
+
+    def judge(self, exercise: Path, submission: Path) -> tuple[str, dict]:
+        with tempfile.TemporaryDirectory() as workdir:
+            config = judge_config(exercise, submission, Path(workdir))
+            config["metrics_file"] = "metrics.jsonl"
+            with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, err):
+                runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+            self.assertEqual(err.getvalue(), "")
+            return out.getvalue(), json.loads((Path(workdir) / "metrics.jsonl").read_text(encoding="utf-8"))
+
+    def load(self, exercise: Path) -> ExerciseBundle | None:
+        return ExerciseBundle.load(DodonaConfig(**judge_config(exercise, exercise / "solution.sql", self.directory)))
+
+    def test_judge(self):
+        for name in ("select", "update"):
+            exercise = self.directory / "exercises" / name
+            submissions = [exercise / "solution" / f"{submission}.sql" for submission in ("correct", "wrong")]
+            outputs = [self.judge(exercise, submission)[0] for submission in submissions]
+
+            with contextlib.redirect_stdout(StringIO()):
+                self.assertEqual(main([str(exercise)]), 0)
+
+            # moved with the exercise, as Dodona copies the evaluation directory
+            moved = self.directory / "moved" / name
+            shutil.copytree(exercise, moved)
+            for submission, output in zip(submissions, outputs, strict=True):
+                with self.subTest(exercise=name, submission=submission.stem):
+                    bundled, metrics = self.judge(moved, submission)
+                    self.assertEqual(metrics.get("exercise_bundle_loads"), 1)
+                    self.assertEqual(bundled, output)
+
+    def test_repeated_select(self):
+        # the same SELECT query returns another result after the database was changed
+        exercise = self.directory / "exercises" / "select"
+        evaluation = exercise / "evaluation"
+        table = (evaluation / "solution.sql").read_text(encoding="utf-8").split()[3]
+        solution = f"SELECT count(*) FROM {table};\nDELETE FROM {table};\nSELECT count(*) FROM {table};\n"  # noqa: S608
+        (evaluation / "solution.sql").write_text(solution, encoding="utf-8")
+        output, _ = self.judge(exercise, evaluation / "solution.sql")
+
+        with contextlib.redirect_stdout(StringIO()):
+            self.assertEqual(main([str(exercise)]), 0)
+        bundled, metrics = self.judge(exercise, evaluation / "solution.sql")
+        self.assertEqual(metrics.get("exercise_bundle_loads"), 1)
+        self.assertEqual(bundled, output)
+
+    def test_host_settings(self):
+        # the replay cache is configured by the judge host, not when the exercise is prepared
+        exercise = self.directory / "exercises" / "select"
+        with mock.patch.dict(os.environ, {"SQL_JUDGE_REPLAY_CACHE": str(self.directory / "cache")}):
+            bundle, _ = prepare_bundle(exercise)
+        assert bundle is not None
+        self.assertNotIn("replay_cache_dir", bundle.prepared)
+
+    def test_stale(self):
+        exercise = self.directory / "exercises" / "select"
+        evaluation = exercise / "evaluation"
+        bundle, _ = prepare_bundle(exercise)
+        assert bundle is not None
+        bundle.write(evaluation / BUNDLE_FILE)
+        self.assertIsNotNone(self.load(exercise))
+
+        (exercise / "config.json").write_text('{"evaluation": {"max_rows": 5}}', encoding="utf-8")
+        self.assertIsNone(self.load(exercise))
+        (exercise / "config.json").write_text('{"evaluation": {}}', encoding="utf-8")
+        self.assertIsNotNone(self.load(exercise))
+
+        shutil.copy(evaluation / "generated.sqlite", evaluation / "copy.sqlite")
+        self.assertIsNone(self.load(exercise))
+        (evaluation / "copy.sqlite").unlink()
+
+        solution = (evaluation / "solution.sql").read_text(encoding="utf-8")
+        (evaluation / "solution.sql").write_text(solution.replace(";", " DESC;"), encoding="utf-8")
+        self.assertIsNone(self.load(exercise))
+
+    def test_json(self):
+        exercise = self.directory / "exercises" / "select"
+        with contextlib.redirect_stdout(StringIO()):
+            self.assertEqual(main([str(exercise)]), 0)
+        # a bundle is plain data, loading it can't run any code
+        data = json.loads((exercise / "evaluation" / BUNDLE_FILE).read_text(encoding="utf-8"))
+        self.assertGreater(len(data["expected_outputs"]), 0)
+
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        cursor = connection.execute(
+            "SELECT 1 AS a, NULL AS b, x'00ff' AS c, 1.5 AS d UNION ALL SELECT NULL, 'x', 2, NULL UNION ALL "
+            "SELECT 3, 'y', NULL, 2"
+        )
+        result = SQLQueryResult.from_cursor(2, cursor)
+        decoded = decode_result(json.loads(json.dumps(encode_result(result))))
+        self.assertEqual(decoded.csv_out, result.csv_out)
+        self.assertEqual(decoded.types_out, result.types_out)
+        self.assertEqual((decoded.types, decoded.row_count), (result.types, 3))
+        self.assertListEqual(list(decoded.dataframe.dtypes), list(result.dataframe.dtypes))
+
+    def test_invalid_regex(self):
+        exercise = self.directory / "exercises" / "select"
+        config = {"evaluation": {"post_execution_mandatory_fullregex": ["select (.*"]}}
+        (exercise / "config.json").write_text(json.dumps(config), encoding="utf-8")
+
+        bundle, output = prepare_bundle(exercise)
+        self.assertIsNone(bundle)
+        self.assertIn("post_execution_mandatory_fullregex: 'select (.*' is not a valid regex", output)
@@ -0,0 +1,51 @@
+"""Test ExerciseGenerator."""
+
+import contextlib
+import json
+import runpy
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+from typing import Any
+
+from tests.e2e_cases import ROOT_PATH, discover_cases, judge_config
+from tests.fake_in_out import fake_in_out
+from tests.generate_exercises import KEY_TYPES, ExerciseGenerator
+
+
+class TestExerciseGenerator(unittest.TestCase):
+    """ExerciseGenerator TestCase."""
+
+    def generate(self, **kwargs: Any) -> Path:
+        output = tempfile.TemporaryDirectory()
+        self.addCleanup(output.cleanup)
+        ExerciseGenerator(**kwargs).write(Path(output.name))
+        return Path(output.name)
+
+    def test_reproducible(self):
+        first, second = self.generate(seed=1, rows=20), self.generate(seed=1, rows=20)
+        for path in sorted(first.rglob("*.*")):
+            self.assertEqual(path.read_bytes(), (second / path.relative_to(first)).read_bytes(), path)
+
+        other = self.generate(seed=2, rows=20)
+        self.assertNotEqual(
+            (first / "insert" / "solution" / "correct.sql").read_text(encoding="utf-8"),
+            (other / "insert" / "solution" / "correct.sql").read_text(encoding="utf-8"),
+        )
+
+    def test_judged(self):
+        for key in KEY_TYPES:
+            cases = discover_cases(self.generate(tables=2, rows=150, key=key))
+            self.assertEqual(len(cases), 8)
+
+            for case in cases:
+                exercise_path, submission_path = case.values
+                with self.subTest(key=key, case=case.id), tempfile.TemporaryDirectory() as workdir:
+                    config = judge_config(exercise_path, submission_path, Path(workdir))
+                    with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, err):
+                        runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+
+                    self.assertEqual(err.getvalue(), "")
+                    rejected = '"accepted": false' in out.getvalue()
+                    self.assertEqual(rejected, submission_path.stem == "wrong")
@@ -0,0 +1,196 @@
+"""Test Instrumentation."""
+
+import contextlib
+import io
+import json
+import sqlite3
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+
+from judge.dodona_command import DodonaCommand, DodonaOutput, OutputFormat
+from judge.instrumentation import CONTEXT_SPAN, PROGRESS_STEPS, Instrumentation, Span
+from tests.fake_in_out import fake_in_out
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Instrumentation TestCase."""
+
+    def test_disabled(self):
+        instrumentation = Instrumentation()
+        with instrumentation.span("phase") as span:
+            self.assertIsNone(span)
+        self.assertIs(instrumentation.span("phase"), instrumentation.span("other"))
+        self.assertListEqual(instrumentation.spans, [])
+
+    def test_nested_spans(self):
+        instrumentation = Instrumentation(enabled=True)
+        with instrumentation.span(CONTEXT_SPAN, database="a.sqlite") as context:
+            with instrumentation.span("query") as query, instrumentation.span("fetch") as fetch:
+                pass
+            with instrumentation.span("query"):
+                pass
+
+        self.assertListEqual([span.name for span in instrumentation.spans], ["fetch", "query", "query", CONTEXT_SPAN])
+        self.assertIs(fetch.parent, query)
+        self.assertIs(fetch.context(), context)
+        self.assertEqual(query.exclusive_duration, query.duration - fetch.duration)
+        self.assertEqual(
+            sum(span.exclusive_duration for span in instrumentation.spans),
+            context.duration,
+        )
+        self.assertListEqual(instrumentation.stack, [])
+
+    def test_timing_table(self):
+        def span(name: str, start: int, end: int, parent: Span | None = None) -> Span:
+            result = Span(instrumentation, name, {"database": "a.sqlite"} if name == CONTEXT_SPAN else {})
+            result.start, result.end, result.parent = start, end, parent
+            if parent is not None:
+                parent.children_time += result.duration
+            return result
+
+        instrumentation = Instrumentation(enabled=True)
+        context = span(CONTEXT_SPAN, 0, 10_000_000)
+        query = span("query", 0, 4_000_000, context)
+        fetch = span("fetch", 1_000_000, 2_000_000, query)
+
+        self.assertIsNone(Instrumentation.timing_table([query, fetch]))
+        self.assertMultiLineEqual(
+            Instrumentation.timing_table([fetch, query, context]) or "",
+            "| Context | fetch | query | other | total |\n|---|--:|--:|--:|--:|\n| a.sqlite | 1.0 | 3.0 | 6.0 | 10.0 |",
+        )
+
+    def test_report(self):
+        self.addCleanup(setattr, DodonaCommand, "output", DodonaCommand.output)
+        DodonaCommand.output = DodonaOutput(OutputFormat.COMPACT)
+
+        instrumentation = Instrumentation(enabled=True)
+        with fake_in_out(io.StringIO()) as (out, _):
+            with instrumentation.report():
+                pass
+            with (
+                contextlib.suppress(ValueError),
+                instrumentation.report(),
+                instrumentation.span(CONTEXT_SPAN, database="a.sqlite"),
+            ):
+                raise ValueError
+
+        commands = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([command["command"] for command in commands], ["append-message"])
+        self.assertEqual(commands[0]["message"]["permission"], "staff")
+        self.assertIn("| a.sqlite |", commands[0]["message"]["description"])
+
+    def test_sqlite_annotations(self):
+        instrumentation = Instrumentation(enabled=True)
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        instrumentation.watch(connection)
+
+        with instrumentation.span("query", statement="WITH ...") as span:
+            cursor = connection.execute(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 10000) SELECT count(*) FROM n"
+            )
+            instrumentation.annotate(rows=len(cursor.fetchall()))
+
+        self.assertEqual(span.args["statement"], "WITH ...")
+        self.assertEqual(span.args["rows"], 1)
+        self.assertGreater(span.args["sqlite_steps"], 0)
+        self.assertEqual(span.args["sqlite_steps"] % PROGRESS_STEPS, 0)
+
+    def test_record_trace(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        trace_file = Path(workdir.name) / "trace.json"
+
+        instrumentation = Instrumentation(enabled=True)
+        with instrumentation.record(trace_file), instrumentation.span("judgement"):
+            with instrumentation.span("tab", title="Query 1"):
+                pass
+            # no trace file is written until the run is finished
+            self.assertFalse(trace_file.exists())
+
+        trace = json.loads(trace_file.read_text(encoding="utf-8"))
+        events = trace["traceEvents"]
+        self.assertListEqual([event["name"] for event in events], ["judgement", "tab"])
+        self.assertEqual(events[0]["ts"], 0)
+        self.assertEqual(events[1]["args"], {"title": "Query 1"})
+        self.assertTrue(all(event["ph"] == "X" for event in events))
+        self.assertLessEqual(events[1]["ts"] + events[1]["dur"], events[0]["ts"] + events[0]["dur"])
+
+        # a new run starts without the spans of the previous run
+        with instrumentation.record():
+            self.assertListEqual(instrumentation.spans, [])
+
+    def test_record_metrics(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        metrics_file = Path(workdir.name) / "metrics.jsonl"
+
+        instrumentation = Instrumentation(enabled=True)
+        for _ in range(2):
+            with instrumentation.record(metrics_file=metrics_file, labels={"exercise": "select"}):
+                with instrumentation.span(CONTEXT_SPAN), instrumentation.span("query"):
+                    instrumentation.annotate(rows=3)
+                with instrumentation.span(CONTEXT_SPAN), instrumentation.span("compare"):
+                    instrumentation.annotate(expected_rows=2, generated_rows=None)
+                instrumentation.count("cache_hits")
+                instrumentation.count("cache_hits")
+
+        # every run appends one line
+        lines = metrics_file.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(lines), 2)
+        metrics = json.loads(lines[1])
+        self.assertEqual(metrics["exercise"], "select")
+        self.assertEqual(metrics["contexts"], 2)
+        self.assertEqual(metrics["rows_fetched"], 5)
+        self.assertEqual(metrics["cache_hits"], 2)
+        self.assertListEqual(sorted(metrics["phases_ms"]), ["compare", CONTEXT_SPAN, "query"])
+        self.assertAlmostEqual(metrics["duration_ms"], sum(metrics["phases_ms"].values()))
+
+    def test_memory_profile(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        metrics_file = Path(workdir.name) / "metrics.jsonl"
+
+        instrumentation = Instrumentation(enabled=True, memory=True)
+        with instrumentation.record(metrics_file=metrics_file):
+            self.assertTrue(tracemalloc.is_tracing())
+            with instrumentation.span(CONTEXT_SPAN, database="a.sqlite") as context:
+                with instrumentation.span("kept") as kept:
+                    data = [bytes(1024) for _ in range(1000)]
+                with instrumentation.span("freed") as freed:
+                    temporary = [bytes(1024) for _ in range(2000)]
+                    del temporary
+                with instrumentation.span("query") as query:
+                    connection = sqlite3.connect(":memory:")
+                    connection.execute("CREATE TABLE t (x BLOB)")
+                    connection.executemany("INSERT INTO t VALUES (?)", ((bytes(1024),) for _ in range(1000)))
+                    connection.close()
+            del data
+        self.assertFalse(tracemalloc.is_tracing())
+
+        # every span gets the peak of its own period, also when nested
+        self.assertGreaterEqual(kept.args["memory_peak_kib"], 1000)
+        self.assertGreaterEqual(freed.args["memory_peak_kib"], 2000)
+        self.assertGreaterEqual(context.args["memory_peak_kib"], 3000)
+        self.assertGreater(query.args["sqlite_memory_peak_kib"], 0)
+        # memory that is freed before the span ends is not an allocation site
+        self.assertIn("test_instrumentation.py", kept.args["memory_top"][0])
+        self.assertNotIn("test_instrumentation.py", " ".join(freed.args["memory_top"]))
+
+        table = Instrumentation.memory_table(instrumentation.spans)
+        self.assertIsNotNone(table)
+        self.assertListEqual(
+            [line.split(" | ")[1] for line in str(table).splitlines()[2:]], [CONTEXT_SPAN, "kept", "freed", "query"]
+        )
+
+        metrics = json.loads(metrics_file.read_text(encoding="utf-8"))
+        self.assertEqual(metrics["memory_peak_kib"]["freed"], freed.args["memory_peak_kib"])
+        self.assertIn("query", metrics["sqlite_memory_peak_kib"])
+
+    def test_disabled_counters(self):
+        instrumentation = Instrumentation()
+        instrumentation.count("cache_hits")
+        instrumentation.annotate(rows=1)
+        self.assertDictEqual(instrumentation.counters, {})
@@ -0,0 +1,114 @@
+"""Test ReplayCache."""
+
+import contextlib
+import json
+import os
+import runpy
+import sqlite3
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+from typing import Any
+
+from judge.replay_cache import ReplayCache
+from tests.e2e_cases import ROOT_PATH, judge_config
+from tests.fake_in_out import fake_in_out
+from tests.generate_exercises import ExerciseGenerator
+
+
+class TestReplayCache(unittest.TestCase):
+    """ReplayCache TestCase."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        ExerciseGenerator(rows=50).write(self.directory / "exercises")
+        self.exercise = self.directory / "exercises" / "select"
+        self.cache = self.directory / "cache"
+
+    def judge(self, submission: str, **settings: Any) -> tuple[str, dict]:
+        submission_path = self.directory / "submission.sql"
+        submission_path.write_text(submission, encoding="utf-8")
+        with tempfile.TemporaryDirectory() as workdir:
+            config = judge_config(self.exercise, submission_path, Path(workdir))
+            config.update(metrics_file="metrics.jsonl", **settings)
+            with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, err):
+                runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+            self.assertEqual(err.getvalue(), "")
+            return out.getvalue(), json.loads((Path(workdir) / "metrics.jsonl").read_text(encoding="utf-8"))
+
+    def test_replay(self):
+        solution = (self.exercise / "solution" / "correct.sql").read_text(encoding="utf-8")
+        wrong = (self.exercise / "solution" / "wrong.sql").read_text(encoding="utf-8")
+
+        for submission in (solution, wrong, "SELECT * FROM missing;", "SELECT 1; SELECT 2;"):
+            with self.subTest(submission=submission[:30]):
+                output, metrics = self.judge(submission, replay_cache_dir=str(self.cache))
+                self.assertEqual(metrics.get("replay_cache_misses"), 1)
+
+                replayed, metrics = self.judge(submission, replay_cache_dir=str(self.cache))
+                self.assertEqual(metrics.get("replay_cache_hits"), 1)
+                self.assertEqual(replayed, output)
+
+    def test_semicolon_annotation(self):
+        query = "SELECT * FROM t000 ORDER BY id"
+        self.judge(query, replay_cache_dir=str(self.cache))
+
+        # same queries, but the missing semicolon is on another row
+        submission = f"-- first line\n/* second\nline */\n{query}\n\n"
+        replayed, metrics = self.judge(submission, replay_cache_dir=str(self.cache))
+        self.assertEqual(metrics.get("replay_cache_hits"), 1)
+        self.assertEqual(replayed, self.judge(submission)[0])
+        self.assertIn('"row": 3', replayed)
+
+    def test_changed_exercise(self):
+        solution = (self.exercise / "solution" / "correct.sql").read_text(encoding="utf-8")
+        self.judge(solution, replay_cache_dir=str(self.cache))
+
+        connection = sqlite3.connect(self.exercise / "evaluation" / "generated.sqlite")
+        with connection:
+            connection.execute("DELETE FROM t000 WHERE id = 1")
+        connection.close()
+
+        _, metrics = self.judge(solution, replay_cache_dir=str(self.cache))
+        self.assertEqual(metrics.get("replay_cache_misses"), 1)
+
+        # timing feedback differs on every run, so it's never cached
+        _, metrics = self.judge(solution, replay_cache_dir=str(self.cache), timing_feedback=True)
+        self.assertNotIn("replay_cache_misses", metrics)
+
+    def test_partial_profile(self):
+        # the result has more rows than are profiled, the replayed feedback is that of a new judgement
+        submission = "SELECT a.id FROM t000 a, t000 b, t000 c;"
+        output, _ = self.judge(submission, replay_cache_dir=str(self.cache))
+        replayed, metrics = self.judge(submission, replay_cache_dir=str(self.cache))
+        self.assertEqual(metrics.get("replay_cache_hits"), 1)
+        self.assertEqual(replayed, output)
+        self.assertEqual(replayed, self.judge(submission)[0])
+        self.assertIn("125000", replayed)
+
+    def test_non_deterministic(self):
+        for _ in range(2):
+            _, metrics = self.judge("SELECT abs(random()) % 2 AS id FROM t000;", replay_cache_dir=str(self.cache))
+            self.assertNotIn("replay_cache_misses", metrics)
+            self.assertNotIn("replay_cache_hits", metrics)
+        self.assertFalse(self.cache.exists() and any(self.cache.iterdir()))
+
+    def test_relative_directory(self):
+        # the workdir is different for every submission, a relative directory is reported to the staff
+        output, metrics = self.judge("SELECT 1;", replay_cache_dir="cache")
+        self.assertIn("Invalid 'replay_cache_dir'", output)
+        self.assertIn("internal error", output)
+        self.assertNotIn("replay_cache_misses", metrics)
+
+    def test_evict(self):
+        self.cache.mkdir()
+        for number in range(5):
+            path = self.cache / f"{number}.json"
+            path.write_text("x" * 100, encoding="utf-8")
+            os.utime(path, ns=(number * 10**9, number * 10**9))
+
+        ReplayCache(self.cache, 250).evict()
+        self.assertListEqual(sorted(path.name for path in self.cache.iterdir()), ["3.json", "4.json"])
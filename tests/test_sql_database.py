@@ -0,0 +1,150 @@
+"""Test SQLDatabase."""
+
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from judge.sql_database import SQLDatabase
+
+
+class TestSQLDatabase(unittest.TestCase):
+    """SQLDatabase TestCase."""
+
+    def database(self, script: str) -> SQLDatabase:
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+
+        sourcefile = Path(workdir.name) / "source.sqlite"
+        with sqlite3.connect(sourcefile) as connection:
+            connection.executescript(script)
+        connection.close()
+
+        database = SQLDatabase(str(sourcefile), workdir.name, "test")
+        return self.enterContext(database)
+
+    def run_sql(self, database: SQLDatabase, solution: str, submission: str) -> None:
+        database.solution_cursor().executescript(solution)
+        database.submission_cursor().executescript(submission)
+        database.close()
+
+    def test_diff_content(self):
+        database = self.database(
+            """
+            CREATE TABLE keyed(id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE keyless(id INTEGER, name TEXT);
+            CREATE TABLE nullable_key(id TEXT PRIMARY KEY, name TEXT);
+            INSERT INTO keyed VALUES (1, 'a'), (2, 'b');
+            INSERT INTO keyless VALUES (1, 'a'), (2, 'b');
+            INSERT INTO nullable_key VALUES (NULL, 'a'), (NULL, 'b');
+            """
+        )
+        self.assertEqual(database.diff(), ([], [], [], ["keyed", "keyless", "nullable_key"]))
+
+        # the rows are deleted and inserted again in a different order, the content stays the same
+        self.run_sql(
+            database,
+            "UPDATE keyed SET name = 'c' WHERE id = 2",
+            """
+            DELETE FROM keyless;
+            INSERT INTO keyless VALUES (2, 'b'), (1, 'a');
+            UPDATE keyed SET name = 'c' WHERE id = 1;
+            DELETE FROM nullable_key WHERE name = 'a';
+            INSERT INTO nullable_key VALUES (NULL, 'a');
+            """,
+        )
+        self.assertEqual(database.diff(), ([], [], ["keyed"], ["keyless", "nullable_key"]))
+
+    def test_count_differences(self):
+        database = self.database(
+            """
+            CREATE TABLE keyed(id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE keyless(id INTEGER, name TEXT);
+            INSERT INTO keyed VALUES (1, 'a'), (2, 'b'), (3, 'c');
+            INSERT INTO keyless VALUES (1, 'a'), (2, 'b'), (3, 'c');
+            """
+        )
+        changes = """
+            UPDATE {table} SET name = 'x' WHERE id = 1;
+            DELETE FROM {table} WHERE id = 2;
+            INSERT INTO {table} VALUES (4, 'd'), (5, 'e');
+        """
+        self.run_sql(database, "", changes.format(table="keyed") + changes.format(table="keyless"))
+
+        cursor = database.joined_cursor()
+        tables = [(table, *SQLDatabase.keyed_columns(cursor, table)) for table in ("keyed", "keyless")]
+        counts = SQLDatabase.count_differences(cursor, tables)
+        # without a key, the changed row is counted as a deleted and an inserted row
+        self.assertEqual(counts, {"keyed": (1, 1, 2), "keyless": (0, 2, 3)})
+        self.assertEqual(SQLDatabase.count_differences(database.joined_cursor(), []), {})
+
+    def test_keyed_columns(self):
+        database = self.database(
+            """
+            CREATE TABLE keyed(name TEXT, id INTEGER PRIMARY KEY);
+            CREATE TABLE composite(a TEXT NOT NULL, b TEXT NOT NULL, PRIMARY KEY (b, a));
+            CREATE TABLE nullable_key(id TEXT PRIMARY KEY);
+            CREATE TABLE keyless(id INTEGER);
+            """
+        )
+        cursor = database.joined_cursor()
+        self.assertEqual(SQLDatabase.keyed_columns(cursor, "keyed"), (['"name"', '"id"'], ['"id"']))
+        self.assertEqual(SQLDatabase.keyed_columns(cursor, "composite"), (['"a"', '"b"'], ['"b"', '"a"']))
+        self.assertEqual(SQLDatabase.keyed_columns(cursor, "nullable_key"), (['"id"'], []))
+        self.assertEqual(SQLDatabase.keyed_columns(cursor, "keyless"), (['"id"'], []))
+
+    def test_get_tables(self):
+        database = self.database(
+            """
+            CREATE TABLE small(id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE large(id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE keyless(id INTEGER, name TEXT);
+            CREATE INDEX small_name ON small(name);
+            INSERT INTO small VALUES (1, 'a');
+            INSERT INTO large VALUES (1, 'a'), (2, 'b'), (3, 'c'), (4, 'd');
+            INSERT INTO keyless SELECT * FROM large;
+            """
+        )
+        self.run_sql(database, "", "UPDATE large SET name = 'x' WHERE id = 4")
+        config = SimpleNamespace(max_rows=2, max_value_length=1000)
+
+        tables = database.get_tables(config, ["small", "small_name"], ["small", "large", "keyless"], delta_min_rows=2)
+        self.assertEqual(list(tables.layouts), ["small"])
+        self.assertEqual(list(tables.definitions), ["small_name"])
+        # a table without a usable primary key is retrieved in full, whatever its size
+        self.assertEqual(list(tables.contents), ["small", "keyless"])
+        self.assertEqual(list(tables.deltas), ["large"])
+
+        self.assertEqual(tables.layouts["small"][0].csv_out, tables.layouts["small"][1].csv_out)
+        self.assertEqual(tables.contents["small"][0].csv_out, "ID,NAME\n1,a")
+        self.assertEqual(tables.deltas["large"].changed_count, 1)
+
+        # without 'delta_min_rows', the content is only bounded by 'max_rows'
+        tables = database.get_tables(config, contents=["large"])
+        self.assertEqual(tables.contents["large"][1].csv_out, "ID,NAME\n1,a\n2,b")
+        self.assertEqual(tables.contents["large"][1].row_count, 4)
+
+    def test_get_tables_after_diff(self):
+        database = self.database(
+            """
+            CREATE TABLE large(id INTEGER PRIMARY KEY, name TEXT);
+            INSERT INTO large VALUES (1, 'a'), (2, 'b'), (3, 'c'), (4, 'd');
+            """
+        )
+        self.run_sql(database, "", "UPDATE large SET name = 'x' WHERE id = 4")
+        config = SimpleNamespace(max_rows=2, max_value_length=1000)
+
+        self.assertEqual(database.diff(), ([], [], ["large"], []))
+        self.assertEqual(database.differences, {"large": (['"id"'], (1, 0, 0))})
+
+        # the delta reuses the primary key and counts of 'diff' instead of computing them again
+        with (
+            mock.patch.object(SQLDatabase, "keyed_columns", side_effect=AssertionError),
+            mock.patch.object(SQLDatabase, "count_differences", wraps=SQLDatabase.count_differences) as count,
+        ):
+            tables = database.get_tables(config, contents=["large"], delta_min_rows=2)
+        count.assert_called_once_with(mock.ANY, [])
+        self.assertEqual(list(tables.deltas), ["large"])
+        self.assertEqual(tables.deltas["large"].changed_count, 1)
@@ -0,0 +1,127 @@
+"""Test batch regrading."""
+
+import contextlib
+import json
+import runpy
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+
+from judge.sql_judge_batch import SUMMARY_FILE, find_submissions, judgement_status, main
+from tests.e2e_cases import ROOT_PATH, judge_config
+from tests.fake_in_out import fake_in_out
+from tests.generate_exercises import ExerciseGenerator
+
+
+class TestSQLJudgeBatch(unittest.TestCase):
+    """Batch regrading TestCase."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        ExerciseGenerator(rows=150).write(self.directory / "exercises")
+
+    def judge(self, exercise: Path, submission: Path) -> str:
+        with tempfile.TemporaryDirectory() as workdir:
+            config = judge_config(exercise, submission, Path(workdir))
+            config["natural_language"] = "en"
+            with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, _):
+                runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+        return out.getvalue()
+
+    def test_regrade(self):
+        for name in ("select", "update"):
+            exercise = self.directory / "exercises" / name
+            for workers in (1, 2):
+                output = self.directory / f"{name}-{workers}"
+                with self.subTest(exercise=name, workers=workers), contextlib.redirect_stdout(StringIO()):
+                    self.assertEqual(
+                        main([str(exercise), str(exercise / "solution"), "-o", str(output), "-j", str(workers)]), 0
+                    )
+
+                    summary = json.loads((output / SUMMARY_FILE).read_text(encoding="utf-8"))
+                    self.assertEqual((summary["submissions"], summary["accepted"], summary["failed"]), (2, 1, 1))
+                    self.assertListEqual(
+                        [(result["submission"], result["status"]) for result in summary["results"]],
+                        [("correct.sql", "correct"), ("wrong.sql", "wrong")],
+                    )
+
+                    # the output is the same as when the submission is judged on its own
+                    for submission in ("correct", "wrong"):
+                        self.assertEqual(
+                            (output / f"{submission}.json").read_text(encoding="utf-8"),
+                            self.judge(exercise, exercise / "solution" / f"{submission}.sql"),
+                        )
+
+    def test_result_cache(self):
+        exercise = self.directory / "exercises" / "select"
+        output = self.directory / "cached"
+        with contextlib.redirect_stdout(StringIO()):
+            self.assertEqual(
+                main(
+                    [
+                        str(exercise),
+                        str(exercise / "solution"),
+                        "-o",
+                        str(output),
+                        "-j",
+                        "1",
+                        "--result-cache-size",
+                        "10000000",
+                    ]
+                ),
+                0,
+            )
+
+        # the submissions reuse the (reordered) results of the solution, without changing them
+        for submission in ("correct", "wrong"):
+            self.assertEqual(
+                (output / f"{submission}.json").read_text(encoding="utf-8"),
+                self.judge(exercise, exercise / "solution" / f"{submission}.sql"),
+            )
+
+    def test_repeated_select(self):
+        # the same SELECT query returns another result after the database was changed
+        exercise = self.directory / "exercises" / "select"
+        table = (exercise / "evaluation" / "solution.sql").read_text(encoding="utf-8").split()[3]
+        solution = f"SELECT count(*) FROM {table};\nDELETE FROM {table};\nSELECT count(*) FROM {table};\n"  # noqa: S608
+        for path in (exercise / "evaluation" / "solution.sql", exercise / "solution" / "correct.sql"):
+            path.write_text(solution, encoding="utf-8")
+
+        output = self.directory / "repeated"
+        with contextlib.redirect_stdout(StringIO()):
+            main([str(exercise), str(exercise / "solution"), "-o", str(output), "-j", "1"])
+        summary = json.loads((output / SUMMARY_FILE).read_text(encoding="utf-8"))
+        self.assertEqual(
+            summary["results"][0], {**summary["results"][0], "submission": "correct.sql", "status": "correct"}
+        )
+
+    def test_manifest(self):
+        manifest = self.directory / "manifest.txt"
+        manifest.write_text("# regrade\nexercises/select/solution/wrong.sql\n\n", encoding="utf-8")
+        self.assertListEqual(
+            find_submissions(manifest),
+            [(self.directory / "exercises/select/solution/wrong.sql", Path("exercises/select/solution/wrong.sql"))],
+        )
+
+    def test_broken_exercise(self):
+        exercise = self.directory / "exercises" / "select"
+        (exercise / "evaluation" / "solution.sql").write_text("SELECT * FROM missing;", encoding="utf-8")
+        with contextlib.redirect_stdout(StringIO()), contextlib.redirect_stderr(StringIO()) as err:
+            self.assertEqual(main([str(exercise), str(exercise / "solution"), "-o", str(self.directory / "out")]), 1)
+        self.assertIn("Solution is not working", err.getvalue())
+
+    def test_judgement_status(self):
+        self.assertEqual(judgement_status('{"command": "start-judgement"}\n{"command": "close-judgement"}'), "correct")
+        self.assertEqual(
+            judgement_status('{"command":"close-testcase","accepted":false}{"command":"close-judgement"}'), "wrong"
+        )
+        self.assertEqual(
+            judgement_status(
+                '{"command": "escalate-status", "status": {"enum": "compilation error", "human": ""}}\n'
+                '{"command": "close-judgement", "accepted": false, "status": {"enum": "wrong", "human": ""}}'
+            ),
+            "compilation error",
+        )
@@ -0,0 +1,141 @@
+"""Test the settings of judging a submission (output, 'fail_fast' and 'skip_equivalent_selects')."""
+
+import contextlib
+import json
+import runpy
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+
+from tests.e2e_cases import ROOT_PATH, judge_config
+from tests.fake_in_out import fake_in_out
+from tests.generate_exercises import ExerciseGenerator
+
+
+def commands(output: str) -> list[dict]:
+    decoder = json.JSONDecoder()
+    result, position = [], 0
+    while position < len(output):
+        if output[position].isspace():
+            position += 1
+            continue
+        command, position = decoder.raw_decode(output, position)
+        result.append(command)
+    return result
+
+
+class TestFailFast(unittest.TestCase):
+    """fail_fast TestCase."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        ExerciseGenerator(rows=20).write(self.directory / "exercises")
+
+        # two SELECT queries on two databases
+        self.exercise = self.directory / "exercises" / "select"
+        evaluation = self.exercise / "evaluation"
+        shutil.copyfile(evaluation / "generated.sqlite", evaluation / "copy.sqlite")
+        solution = (evaluation / "solution.sql").read_text(encoding="utf-8")
+        wrong = (self.exercise / "solution" / "wrong.sql").read_text(encoding="utf-8")
+        (evaluation / "solution.sql").write_text(solution * 2, encoding="utf-8")
+        self.correct = self.directory / "correct.sql"
+        self.correct.write_text(solution * 2, encoding="utf-8")
+        self.wrong = self.directory / "wrong.sql"
+        self.wrong.write_text(wrong + solution, encoding="utf-8")
+
+    def judge(self, submission: Path, **settings: object) -> list[dict]:
+        with tempfile.TemporaryDirectory() as workdir:
+            config = judge_config(self.exercise, submission, Path(workdir))
+            config.update(natural_language="en", **settings)
+            with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, _):
+                runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+        return commands(out.getvalue())
+
+    @staticmethod
+    def contexts_per_tab(output: list[dict]) -> list[int]:
+        counts = []
+        for command in output:
+            if command["command"] == "start-tab":
+                counts.append(0)
+            elif command["command"] == "start-context":
+                counts[-1] += 1
+        return counts
+
+    @staticmethod
+    def messages(output: list[dict]) -> list[str]:
+        return [command["message"]["description"] for command in output if command["command"] == "append-message"]
+
+    def test_fail_fast(self):
+        output = self.judge(self.wrong, fail_fast=True)
+
+        # the first database rejects the first query, the other database is skipped for both queries
+        self.assertListEqual(self.contexts_per_tab(output), [1, 1])
+        # the skipped database is only mentioned once, in the tab of the query that was wrong
+        skipped, tab = [], -1
+        for command in output:
+            if command["command"] == "start-tab":
+                tab += 1
+            elif command["command"] == "append-message" and "not checked" in command["message"]["description"]:
+                skipped.append((tab, command["message"]["description"]))
+        self.assertEqual(len(skipped), 1)
+        self.assertEqual(skipped[0][0], 0)
+        self.assertIn("1 other database(s) (generated.sqlite)", skipped[0][1])
+
+    def test_disabled(self):
+        output = self.judge(self.wrong)
+        self.assertListEqual(self.contexts_per_tab(output), [2, 2])
+        self.assertFalse(any("not checked" in message for message in self.messages(output)))
+
+    def test_correct(self):
+        # nothing is skipped if the submission is correct
+        self.assertEqual(self.judge(self.correct, fail_fast=True), self.judge(self.correct))
+
+
+class TestSkipEquivalentSelects(unittest.TestCase):
+    """skip_equivalent_selects TestCase."""
+
+    def test_judge(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ExerciseGenerator(rows=20).write(Path(directory) / "exercises")
+            exercise = Path(directory) / "exercises" / "select"
+            solution = (exercise / "evaluation" / "solution.sql").read_text(encoding="utf-8")
+            submission = Path(directory) / "submission.sql"
+            submission.write_text(solution.lower().replace(" ", "\n  ").replace("select\n  *", "select *"), "utf-8")
+
+            outputs = []
+            for settings in ({}, {"skip_equivalent_selects": True}):
+                with tempfile.TemporaryDirectory() as workdir:
+                    config = judge_config(exercise, submission, Path(workdir))
+                    config.update(metrics_file="metrics.jsonl", **settings)
+                    with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, _):
+                        runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+                    metrics = json.loads((Path(workdir) / "metrics.jsonl").read_text(encoding="utf-8"))
+                outputs.append(out.getvalue())
+
+        # the submission query is not run, but the feedback is the same
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(metrics.get("equivalent_selects_skipped"), 1)
+
+
+class TestOutputSettings(unittest.TestCase):
+    """Output settings TestCase."""
+
+    def test_invalid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ExerciseGenerator(rows=20).write(Path(directory) / "exercises")
+            exercise = Path(directory) / "exercises" / "select"
+            for settings in ({"output_flush_at": "query"}, {"output_format": "xml"}):
+                with self.subTest(settings=settings), tempfile.TemporaryDirectory() as workdir:
+                    config = judge_config(exercise, exercise / "solution" / "correct.sql", Path(workdir))
+                    config.update(settings)
+                    with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, _):
+                        runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+
+                    # written with the default settings, and reported to the staff
+                    output = commands(out.getvalue())
+                    self.assertEqual(output[-1]["status"]["enum"], "internal error")
+                    self.assertTrue(any("Invalid output settings" in json.dumps(command) for command in output))
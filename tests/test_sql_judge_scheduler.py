@@ -0,0 +1,129 @@
+"""Test JudgeScheduler."""
+
+import asyncio
+import contextlib
+import json
+import runpy
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+
+from judge.dodona_command import ErrorType
+from judge.sql_judge_batch import judgement_status
+from judge.sql_judge_scheduler import JudgeScheduler, main
+from tests.e2e_cases import ROOT_PATH, judge_config
+from tests.fake_in_out import fake_in_out
+from tests.generate_exercises import ExerciseGenerator
+
+SLOW_QUERY = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000000) SELECT count(*) FROM c;"
+)
+
+
+class TestJudgeScheduler(unittest.TestCase):
+    """JudgeScheduler TestCase."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        ExerciseGenerator(rows=50).write(self.directory / "exercises")
+        self.slow = self.directory / "slow.sql"
+        self.slow.write_text(SLOW_QUERY, encoding="utf-8")
+
+    def judge(self, exercise: Path, submission: Path) -> str:
+        with tempfile.TemporaryDirectory() as workdir:
+            config = judge_config(exercise, submission, Path(workdir))
+            config["natural_language"] = "en"
+            with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, _):
+                runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+        return out.getvalue()
+
+    def test_judge(self):
+        exercises = [self.directory / "exercises" / name for name in ("select", "update")]
+        submissions = ["correct", "wrong", "correct"]
+
+        async def judge_all() -> list[list[str]]:
+            async def judge_exercise(scheduler: JudgeScheduler, exercise: Path) -> list[str]:
+                paths = [(exercise / "solution" / f"{name}.sql", Path(f"{name}.sql")) for name in submissions]
+                output = self.directory / "output" / exercise.name
+                return [job.submission.stem async for job, _ in scheduler.judge(exercise, paths, output)]
+
+            async with JudgeScheduler(workers=2) as scheduler:
+                return await asyncio.gather(*(judge_exercise(scheduler, exercise) for exercise in exercises))
+
+        # the results are returned in order, and the output is the same as when the submission is judged on its own
+        self.assertListEqual(asyncio.run(judge_all()), [submissions, submissions])
+        for exercise in exercises:
+            for name in ("correct", "wrong"):
+                self.assertEqual(
+                    (self.directory / "output" / exercise.name / f"{name}.json").read_text(encoding="utf-8"),
+                    self.judge(exercise, exercise / "solution" / f"{name}.sql"),
+                )
+
+    def test_output_names(self):
+        # submissions (and exercises) with the same name in different directories
+        submissions = self.directory / "submissions"
+        for name in ("correct", "wrong"):
+            (submissions / name).mkdir(parents=True)
+            (submissions / name / "query.sql").write_bytes(
+                (self.directory / "exercises" / "select" / "solution" / f"{name}.sql").read_bytes()
+            )
+        shutil.copytree(self.directory / "exercises" / "select", self.directory / "copy" / "select")
+        exercises = [self.directory / "exercises" / "select", self.directory / "copy" / "select"]
+
+        output = self.directory / "output"
+        arguments = [str(path) for exercise in exercises for path in (exercise, submissions)]
+        with contextlib.redirect_stdout(StringIO()):
+            self.assertEqual(main([*arguments, "-o", str(output), "-j", "2"]), 0)
+
+        for exercise in ("exercises/select", "copy/select"):
+            for name in ("correct", "wrong"):
+                self.assertEqual(
+                    judgement_status((output / exercise / name / "query.json").read_text(encoding="utf-8")), name
+                )
+
+    def test_fairness(self):
+        async def order() -> list[str]:
+            scheduler = JudgeScheduler(workers=1)
+            for name, count in (("select", 3), ("update", 2)):
+                for _ in range(count):
+                    scheduler.submit(self.directory / "exercises" / name, self.slow, self.directory / "out.json")
+            return [(await scheduler.next_job()).exercise.name for _ in range(5)]
+
+        self.assertListEqual(asyncio.run(order()), ["select", "update", "select", "update", "select"])
+
+    def test_time_limit(self):
+        exercise = self.directory / "exercises" / "select"
+        correct = exercise / "solution" / "correct.sql"
+
+        async def judge_all() -> list[str]:
+            async with JudgeScheduler(workers=1, time_limit=1) as scheduler:
+                jobs = [
+                    scheduler.submit(exercise, submission, self.directory / f"{number}.json")
+                    for number, submission in enumerate((self.slow, correct))
+                ]
+                return [(await job.result)["status"] for job in jobs]
+
+        self.assertListEqual(asyncio.run(judge_all()), [ErrorType.TIME_LIMIT_EXCEEDED, ErrorType.CORRECT])
+        output = (self.directory / "0.json").read_text(encoding="utf-8")
+        self.assertEqual(judgement_status(output), ErrorType.TIME_LIMIT_EXCEEDED)
+
+    def test_cancel(self):
+        exercise = self.directory / "exercises" / "select"
+        correct = exercise / "solution" / "correct.sql"
+
+        async def judge_all() -> dict:
+            async with JudgeScheduler(workers=1) as scheduler:
+                slow = scheduler.submit(exercise, self.slow, self.directory / "slow.json")
+                queued = scheduler.submit(exercise, self.slow, self.directory / "queued.json")
+                job = scheduler.submit(exercise, correct, self.directory / "correct.json")
+                await asyncio.sleep(1)
+                slow.cancel()  # running
+                queued.cancel()
+                return await asyncio.wait_for(job.result, 30)
+
+        self.assertEqual(asyncio.run(judge_all())["status"], ErrorType.CORRECT)
+        self.assertFalse((self.directory / "queued.json").exists())
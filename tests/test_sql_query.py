@@ -419,3 +419,29 @@ class TestSQLQuery(unittest.TestCase):
             ),
             None,
         )
+
+    def test_equivalence_key(self):
+        def key(text: str) -> tuple[str, ...]:
+            return SQLQuery.from_raw_input(text)[0].equivalence_key
+
+        solution = "SELECT a + 1, b FROM t WHERE x = 'A' ORDER BY a;"
+        for text in (
+            "select a + 1, b\n  from t\n  where x = 'A'\n  order by a",
+            "SELECT  a + 1, b  FROM t WHERE x='A' ORDER BY a ;",
+        ):
+            with self.subTest(query=text):
+                self.assertEqual(key(text), key(solution))
+
+        for text in (
+            "SELECT a+1, b FROM t WHERE x = 'A' ORDER BY a;",  # the result column is named 'a+1'
+            "SELECT A + 1, b FROM t WHERE x = 'A' ORDER BY a;",
+            "SELECT a + 1, b FROM t WHERE x = 'a' ORDER BY a;",
+            "SELECT a + 1, b FROM T WHERE x = 'A' ORDER BY a;",
+            "SELECT a + 1, b FROM t WHERE x = 'A' ORDER BY a DESC;",
+        ):
+            with self.subTest(query=text):
+                self.assertNotEqual(key(text), key(solution))
+
+        # queries with more than one SELECT are compared by their text
+        self.assertNotEqual(key("SELECT a FROM (SELECT a FROM t);"), key("select a from (select a from t);"))
+        self.assertEqual(key("SELECT a FROM (SELECT a FROM t);"), key("SELECT a FROM (SELECT a FROM t)"))
@@ -1,5 +1,6 @@
 """Test SQLQueryResult."""
 
+import sqlite3
 import textwrap
 import unittest
 
@@ -123,3 +124,72 @@ class TestSQLQueryResult(unittest.TestCase):
                 Test [INTEGER]
                 Name [INTEGER]"""),
         )
+
+    def test_from_cursor_type_profile(self):
+        connection = sqlite3.connect(":memory:")
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT NULL AS a, 1 AS b, 'x' AS c UNION ALL "
+            "SELECT 1.5, 2, 3 UNION ALL "
+            "SELECT 2.5, 3, NULL UNION ALL "
+            "SELECT NULL, x'00', NULL"
+        )
+
+        # only the first two rows are kept, but all rows are profiled
+        query_result = SQLQueryResult.from_cursor(2, cursor)
+        connection.close()
+
+        self.assertEqual(len(query_result.dataframe.index), 2)
+        self.assertEqual(query_result.row_count, 4)
+        self.assertSequenceEqual(query_result.types, [float, int, str])
+        self.assertMultiLineEqual(
+            query_result.types_out,
+            textwrap.dedent("""\
+                A [REAL]
+                B [INTEGER/BLOB]
+                C [INTEGER/TEXT]"""),
+        )
+
+        query_result.index_columns(["C"])
+        self.assertMultiLineEqual(
+            query_result.types_out,
+            textwrap.dedent("""\
+                C [INTEGER/TEXT]
+                A [REAL]
+                B [INTEGER/BLOB]"""),
+        )
+
+    def test_from_cursor_compact_values(self):
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+
+        cursor.execute("SELECT zeroblob(2300000) AS a, 'abcdef' AS b UNION ALL SELECT x'00ff', 'abc'")
+        query_result = SQLQueryResult.from_cursor(2, cursor, 4)
+
+        self.assertMultiLineEqual(
+            query_result.csv_out,
+            "A,B\n"
+            '"BLOB(2.3 MB, sha1=f338df1eb75f33505d0ce9cc85f2a40c6c4423f9)",'
+            '"abcd… [TEXT(6 characters), sha1=1f8ac10f23c5b5bc1167bda84b833e5c057a77d2]"\n'
+            "b'\\x00\\xff',abc",
+        )
+        # types are determined before the values are compacted
+        self.assertMultiLineEqual(query_result.types_out, "A [BLOB]\nB [TEXT]")
+
+    def test_from_cursor_profile_limit(self):
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+
+        # the column is INTEGER in the first 100 rows and TEXT in the others
+        cursor.execute(
+            "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 5000) "
+            "SELECT CASE WHEN x <= 100 THEN x ELSE 'x' END AS x FROM n"
+        )
+        partial = SQLQueryResult.from_cursor(10, cursor, max_profile_rows=100)
+
+        # all rows are counted, but only the first 'max_profile_rows' are profiled
+        self.assertEqual(partial.row_count, 5000)
+        self.assertEqual(len(partial.dataframe.index), 10)
+        self.assertEqual(partial.types_out, "X [INTEGER]")
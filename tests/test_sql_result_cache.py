@@ -0,0 +1,148 @@
+"""Test SQLResultCache."""
+
+import contextlib
+import json
+import runpy
+import sqlite3
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+
+from judge.sql_query import SQLQuery
+from judge.sql_query_result import SQLQueryResult
+from judge.sql_result_cache import SQLResultCache, is_deterministic, result_bytes
+from tests.e2e_cases import ROOT_PATH, judge_config
+from tests.fake_in_out import fake_in_out
+from tests.generate_exercises import ExerciseGenerator
+
+
+def query(text: str) -> SQLQuery:
+    return SQLQuery.from_raw_input(text)[0]
+
+
+def result(values: list[int]) -> SQLQueryResult:
+    return SQLQueryResult(pd.DataFrame({"a": values, "b": [str(v) for v in values]}), ["A", "B"], [int, str])
+
+
+class TestSQLResultCache(unittest.TestCase):
+    """SQLResultCache TestCase."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.db_file = str(self.directory / "db.sqlite")
+        connection = sqlite3.connect(self.db_file)
+        with connection:
+            connection.execute("CREATE TABLE t (a INTEGER)")
+        connection.close()
+        self.config = SimpleNamespace(pragma_startup_queries="", max_rows=100, max_value_length=1000)
+
+    def test_is_deterministic(self):
+        for text in (
+            "SELECT * FROM t;",
+            "SELECT date('2024-01-01'), strftime('%Y', d) FROM t;",
+            "SELECT strftime(lower('%Y'), max(a, 1)) FROM t;",
+            "SELECT now FROM t;",
+        ):
+            with self.subTest(query=text):
+                self.assertTrue(is_deterministic(query(text)))
+        for text in (
+            "SELECT random();",
+            "SELECT * FROM t ORDER BY RANDOM();",
+            "SELECT datetime('now');",
+            "SELECT strftime('%s', 'NOW');",
+            "SELECT date();",
+            "SELECT strftime('%Y');",
+            "SELECT strftime(lower('%Y, %m')) FROM t;",
+            "SELECT CURRENT_TIMESTAMP;",
+            "INSERT INTO t VALUES (last_insert_rowid());",
+        ):
+            with self.subTest(query=text):
+                self.assertFalse(is_deterministic(query(text)))
+
+    def test_key(self):
+        cache = SQLResultCache(1000)
+        select = query("SELECT * FROM t;")
+        insert = query("INSERT INTO t VALUES (1);")
+        key = cache.key(self.config, self.db_file, [], select)
+        self.assertIsNotNone(key)
+
+        # SELECT queries don't change the database state
+        self.assertEqual(cache.key(self.config, self.db_file, [query("SELECT 1;")], select), key)
+        self.assertNotEqual(cache.key(self.config, self.db_file, [insert], select), key)
+        self.assertNotEqual(cache.key(self.config, self.db_file, [], query("SELECT  * FROM t;")), key)
+        self.assertNotEqual(
+            cache.key(SimpleNamespace(**{**vars(self.config), "max_rows": 5}), self.db_file, [], select), key
+        )
+
+        self.assertIsNone(cache.key(self.config, self.db_file, [], insert))
+        self.assertIsNone(cache.key(self.config, self.db_file, [query("INSERT INTO t VALUES (random());")], select))
+        self.assertIsNone(SQLResultCache(0).key(self.config, self.db_file, [], select))
+
+    def test_copy(self):
+        cache = SQLResultCache(10_000)
+        original = result([2, 1])
+        cache.put("key", original)
+        original.sort_rows(["A"])
+
+        cached = cache.get("key")
+        assert cached is not None
+        cached.index_columns(["B", "A"])
+        self.assertEqual(cached.csv_out, "B,A\n2,2\n1,1")
+        self.assertEqual(cache.get("key").csv_out, "A,B\n2,2\n1,1")  # type: ignore[union-attr]
+
+    def test_partial_profile(self):
+        connection = sqlite3.connect(self.db_file)
+        self.addCleanup(connection.close)
+        text = (
+            "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 5000) "
+            "SELECT CASE WHEN x <= 100 THEN x ELSE 'x' END AS x FROM n"
+        )
+
+        # a result of which only the first rows are profiled, is the same every time the query runs
+        cache = SQLResultCache(1_000_000)
+        cache.put("key", SQLQueryResult.from_cursor(10, connection.execute(text), max_profile_rows=100))
+        cached = cache.get("key")
+        fresh = SQLQueryResult.from_cursor(10, connection.execute(text), max_profile_rows=100)
+        assert cached is not None
+        self.assertEqual(
+            (cached.row_count, cached.types_out, cached.csv_out), (fresh.row_count, fresh.types_out, fresh.csv_out)
+        )
+
+    def test_evict(self):
+        size = result_bytes(result([1]))
+        cache = SQLResultCache(2 * size)
+        cache.put("1", result([1]))
+        cache.put("2", result([2]))
+        cache.get("1")  # most recently used
+        cache.put("3", result([3]))
+        self.assertListEqual(list(cache.results), ["1", "3"])
+        self.assertEqual(cache.total_bytes, 2 * size)
+
+        cache.put("4", result(list(range(100))))  # larger than the cache
+        self.assertListEqual(list(cache.results), ["1", "3"])
+
+    def test_judge(self):
+        ExerciseGenerator(rows=50).write(self.directory / "exercises")
+        exercise = self.directory / "exercises" / "select"
+        submission = exercise / "solution" / "correct.sql"
+
+        outputs = []
+        for settings in ({}, {"result_cache_size": 10_000_000}):
+            with tempfile.TemporaryDirectory() as workdir:
+                config = judge_config(exercise, submission, Path(workdir))
+                config.update(metrics_file="metrics.jsonl", **settings)
+                with contextlib.chdir(workdir), fake_in_out(StringIO(json.dumps(config))) as (out, _):
+                    runpy.run_path(str(ROOT_PATH / "sql_judge.py"))
+                metrics = json.loads((Path(workdir) / "metrics.jsonl").read_text(encoding="utf-8"))
+            outputs.append(out.getvalue())
+
+        # the submission query is identical to the solution query, so its result is the solution's result
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(metrics.get("result_cache_hits"), metrics.get("result_cache_misses"))
+        self.assertGreater(metrics.get("result_cache_hits", 0), 0)
@@ -0,0 +1,85 @@
+"""Test SQLResultComparator."""
+
+import sqlite3
+import unittest
+
+import pandas as pd
+
+from judge.sql_query_result import SQLQueryResult
+from judge.sql_result_comparator import SQLResultComparator
+
+
+class TestSQLResultComparator(unittest.TestCase):
+    """SQLResultComparator TestCase."""
+
+    def test_exact(self):
+        comparator = SQLResultComparator()
+        self.assertTrue(comparator.is_exact)
+
+        expected = SQLQueryResult(pd.DataFrame([[0.3, "a"]]), ["X", "Y"], [float, str])
+        generated = SQLQueryResult(pd.DataFrame([[0.1 + 0.2, "a"]]), ["X", "Y"], [float, str])
+
+        self.assertFalse(expected.equals(generated, comparator))
+        self.assertFalse(expected.equals(generated))
+        self.assertTrue(expected.equals(expected, comparator))
+
+    def test_float_tolerance(self):
+        expected = SQLQueryResult(pd.DataFrame([[0.3, 1], [None, 2]]), ["X", "Y"], [float, int])
+        generated = SQLQueryResult(pd.DataFrame([[0.1 + 0.2, 1], [None, 2]]), ["X", "Y"], [float, int])
+
+        self.assertTrue(expected.equals(generated, SQLResultComparator(absolute_tolerance=1e-9)))
+        self.assertTrue(expected.equals(generated, SQLResultComparator(relative_tolerance=1e-9)))
+
+        different = SQLQueryResult(pd.DataFrame([[0.31, 1], [None, 2]]), ["X", "Y"], [float, int])
+        self.assertFalse(expected.equals(different, SQLResultComparator(absolute_tolerance=1e-9)))
+
+        null = SQLQueryResult(pd.DataFrame([[0.3, 1], [0.0, 2]]), ["X", "Y"], [float, int])
+        self.assertFalse(expected.equals(null, SQLResultComparator(absolute_tolerance=1e-9)))
+
+        # the displayed output is not changed by the comparison
+        self.assertEqual(generated.csv_out, "X,Y\n0.30000000000000004,1\n,2")
+
+    def test_text_normalization(self):
+        expected = SQLQueryResult(pd.DataFrame([["Tom  Smith", 1], [None, 2]]), ["X", "Y"], [str, int])
+        generated = SQLQueryResult(pd.DataFrame([[" tom smith ", 1], [None, 2]]), ["X", "Y"], [str, int])
+
+        self.assertFalse(expected.equals(generated, SQLResultComparator(case_insensitive=True)))
+        self.assertFalse(expected.equals(generated, SQLResultComparator(normalize_whitespace=True)))
+        self.assertTrue(
+            expected.equals(generated, SQLResultComparator(case_insensitive=True, normalize_whitespace=True))
+        )
+
+        # columns without text values are left untouched
+        blobs = SQLQueryResult(pd.DataFrame([[b"A"], [None]]), ["X"], [bytes])
+        self.assertTrue(blobs.equals(blobs, SQLResultComparator(case_insensitive=True)))
+
+    def test_long_text(self):
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        comparator = SQLResultComparator(case_insensitive=True, normalize_whitespace=True)
+
+        def result(text: str, max_value_length: int) -> SQLQueryResult:
+            cursor.execute("SELECT ? AS x", (text,))
+            return SQLQueryResult.from_cursor(100, cursor, max_value_length)
+
+        self.assertTrue(result("Tom  Smith", 0).equals(result(" tom smith ", 0), comparator))
+        # a compacted value is compared by its digest, the TEXT options don't apply to it
+        self.assertFalse(result("Tom  Smith", 4).equals(result(" tom smith ", 4), comparator))
+        self.assertTrue(result("Tom  Smith", 4).equals(result("Tom  Smith", 4), comparator))
+
+    def test_blob_digest(self):
+        comparator = SQLResultComparator(compare_blob_digest=True)
+        expected = SQLQueryResult(pd.DataFrame([[b"\x00\xff"], [None]]), ["X"], [bytes])
+
+        self.assertTrue(
+            expected.equals(SQLQueryResult(pd.DataFrame([[b"\x00\xff"], [None]]), ["X"], [bytes]), comparator)
+        )
+        self.assertFalse(expected.equals(SQLQueryResult(pd.DataFrame([[b"\x00"], [None]]), ["X"], [bytes]), comparator))
+
+    def test_shape_mismatch(self):
+        comparator = SQLResultComparator(absolute_tolerance=1)
+        expected = SQLQueryResult(pd.DataFrame([[1.0], [2.0]]), ["X"], [float])
+
+        self.assertFalse(expected.equals(SQLQueryResult(pd.DataFrame([[1.0]]), ["X"], [float]), comparator))
+        self.assertFalse(expected.equals(SQLQueryResult(pd.DataFrame([[1.0], [2.0]]), ["Z"], [float]), comparator))
@@ -0,0 +1,101 @@
+"""Test SQLResultDiff."""
+
+import sqlite3
+import textwrap
+import unittest
+
+from judge.sql_result_comparator import SQLResultComparator
+from judge.sql_result_diff import SQLResultDiff, unmangle_column_names
+
+
+class TestSQLResultDiff(unittest.TestCase):
+    """SQLResultDiff TestCase."""
+
+    def diff(
+        self,
+        expected: str,
+        generated: str,
+        *,
+        allow_different_column_order: bool = True,
+        comparator: SQLResultComparator | None = None,
+    ) -> SQLResultDiff:
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        cursor.execute("ATTACH ':memory:' AS expected")
+        cursor.execute("ATTACH ':memory:' AS generated")
+        cursor.execute(f"CREATE TABLE expected.result AS {expected}")
+        cursor.execute(f"CREATE TABLE generated.result AS {generated}")
+        return SQLResultDiff.from_cursor(cursor, 2, allow_different_column_order, comparator)
+
+    def test_equal(self):
+        diff = self.diff(
+            "SELECT 1 AS a, 'x' AS b UNION ALL SELECT 2, NULL UNION ALL SELECT 3, 'z'",
+            "SELECT 1 AS a, 'x' AS b UNION ALL SELECT 2, NULL UNION ALL SELECT 3, 'z'",
+        )
+        self.assertTrue(diff.equals(ignore_order=False))
+        self.assertTrue(diff.equals(ignore_order=True))
+        self.assertEqual((diff.expected_row_count, diff.generated_row_count), (3, 3))
+        self.assertEqual(len(diff.expected.dataframe.index), 2)  # only 'max_rows' rows are fetched
+        self.assertEqual(diff.expected.row_count, 3)
+        self.assertMultiLineEqual(diff.expected.types_out, "A [INTEGER]\nB [TEXT]")
+
+    def test_wrong_order(self):
+        diff = self.diff(
+            "SELECT 1 AS a UNION ALL SELECT 2 UNION ALL SELECT 2",
+            "SELECT 2 AS a UNION ALL SELECT 1 UNION ALL SELECT 2",
+        )
+        self.assertFalse(diff.equals(ignore_order=False))
+        self.assertTrue(diff.equals(ignore_order=True))
+        self.assertEqual((diff.missing_count, diff.unexpected_count), (0, 0))
+
+    def test_missing_and_unexpected(self):
+        # duplicate rows are counted: one of the two '2' rows is missing
+        diff = self.diff(
+            "SELECT 1 AS a UNION ALL SELECT 2 UNION ALL SELECT 2",
+            "SELECT 1 AS a UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 1.0",
+        )
+        self.assertFalse(diff.equals(ignore_order=True))
+        self.assertEqual((diff.expected_row_count, diff.generated_row_count), (3, 4))
+        self.assertEqual((diff.missing_count, diff.unexpected_count), (1, 2))
+        assert diff.missing_sample is not None
+        assert diff.unexpected_sample is not None
+        self.assertMultiLineEqual(diff.missing_sample.csv_out, "A\n2")
+        self.assertMultiLineEqual(
+            diff.unexpected_sample.csv_out,
+            textwrap.dedent("""\
+                A
+                1.0
+                3.0"""),
+        )
+
+    def test_column_order(self):
+        expected = "SELECT 1 AS a, 2 AS b, 3 AS a"
+        generated = "SELECT 2 AS b, 1 AS a, 3 AS a"
+
+        self.assertTrue(self.diff(expected, generated).equals(ignore_order=False))
+        self.assertFalse(self.diff(expected, generated, allow_different_column_order=False).equals(ignore_order=True))
+
+        diff = self.diff(expected, "SELECT 1 AS a, 2 AS b")
+        self.assertFalse(diff.equals(ignore_order=True))
+        self.assertIsNone(diff.missing_count)
+
+    def test_column_names(self):
+        # the rows are equal, but the header is not
+        diff = self.diff("SELECT 1 AS total UNION ALL SELECT 2", "SELECT 1 AS wrong_name UNION ALL SELECT 2")
+        self.assertTrue(diff.rows_equal)
+        self.assertFalse(diff.equals(ignore_order=False))
+        self.assertFalse(diff.equals(ignore_order=True))
+
+    def test_comparator(self):
+        expected = "SELECT 0.3 AS a, 'Tom' AS b"
+        generated = "SELECT 0.1 + 0.2 AS a, ' tom ' AS b"
+
+        self.assertFalse(self.diff(expected, generated).equals(ignore_order=False))
+
+        comparator = SQLResultComparator(absolute_tolerance=1e-9, case_insensitive=True, normalize_whitespace=True)
+        self.assertTrue(self.diff(expected, generated, comparator=comparator).equals(ignore_order=False))
+
+    def test_unmangle_column_names(self):
+        description = (("a",), ("a:1",), ("b",), ("a:2",), ("c:1",))
+        self.assertSequenceEqual(unmangle_column_names(description), ["A", "A", "B", "A", "C:1"])
@@ -0,0 +1,65 @@
+"""Test SQLSchema."""
+
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from judge.sql_schema import SQLSchema, compare_schemas, normalize_sql
+
+
+class TestSQLSchema(unittest.TestCase):
+    """SQLSchema TestCase."""
+
+    def schemas(self, solution: str, submission: str) -> tuple[SQLSchema, SQLSchema]:
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        for schema, script in (("solution", solution), ("submission", submission)):
+            path = Path(workdir.name) / f"{schema}.sqlite"
+            with sqlite3.connect(path) as source:
+                source.executescript(script)
+            source.close()
+            cursor.execute(f"ATTACH ? AS {schema}", (str(path),))
+        return SQLSchema.from_cursor(cursor, "solution"), SQLSchema.from_cursor(cursor, "submission")
+
+    def different(self, solution: str, submission: str, setup: str = "") -> list[str]:
+        schemas = self.schemas(setup + solution, setup + submission)
+        return [obj.name for obj, different in compare_schemas(*schemas) if different]
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('CREATE  INDEX "Ti" ON t (a)  -- comment\n'),
+            normalize_sql("create index ti on [T](A)"),
+        )
+        self.assertNotEqual(normalize_sql("CREATE VIEW v AS SELECT 'A'"), normalize_sql("CREATE VIEW v AS SELECT 'a'"))
+        self.assertEqual(normalize_sql(None), "")
+
+    def test_tables(self):
+        self.assertEqual(self.different("CREATE TABLE t(a INT, b TEXT);", "CREATE TABLE t(b TEXT, a INT);"), [])
+        self.assertEqual(self.different("CREATE TABLE t(a INT);", "CREATE TABLE t(a TEXT);"), ["t"])
+        # a table that is missing from the submission is listed twice
+        self.assertEqual(self.different("CREATE TABLE t(a INT);", ""), ["t", "t"])
+
+    def test_other_objects(self):
+        table = "CREATE TABLE t(a INT, b INT);"
+        self.assertEqual(self.different("CREATE INDEX ti ON t(a);", "create index TI on t (a);", table), [])
+        self.assertEqual(self.different("CREATE INDEX ti ON t(a);", "CREATE INDEX ti ON t(b);", table), ["ti"])
+        self.assertEqual(
+            self.different("CREATE VIEW v AS SELECT a FROM t;", "CREATE VIEW v AS SELECT b AS a FROM t;", table), ["v"]
+        )
+        self.assertEqual(
+            self.different(
+                "CREATE TRIGGER tr AFTER INSERT ON t BEGIN DELETE FROM t WHERE a IS NULL; END;",
+                "CREATE TRIGGER tr AFTER INSERT ON t BEGIN DELETE FROM t WHERE b IS NULL; END;",
+                table,
+            ),
+            ["tr"],
+        )
+
+    def test_cache(self):
+        solution, submission = self.schemas("CREATE TABLE t(a INT);", "CREATE TABLE t(a INT);")
+        self.assertIs(solution, submission)
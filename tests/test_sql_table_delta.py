@@ -0,0 +1,92 @@
+"""Test SQLTableDelta."""
+
+import sqlite3
+import textwrap
+import unittest
+
+from judge.sql_database import SQLDatabase
+from judge.sql_table_delta import SQLTableDelta
+
+
+class TestSQLTableDelta(unittest.TestCase):
+    """SQLTableDelta TestCase."""
+
+    def delta(self, create: str, rows: list[tuple], changes: list[str], max_rows: int = 100) -> SQLTableDelta:
+        connection = sqlite3.connect(":memory:")
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        for schema in ("solution", "submission"):
+            cursor.execute(f"ATTACH ':memory:' AS {schema}")
+            cursor.execute(create.format(schema=schema))
+            placeholders = ", ".join("?" * len(rows[0]))
+            cursor.executemany(f"INSERT INTO {schema}.t VALUES ({placeholders})", rows)  # noqa: S608
+        for change in changes:
+            cursor.execute(change)
+        columns, primary_key = SQLDatabase.keyed_columns(cursor, "t")
+        counts = SQLDatabase.count_differences(cursor, [("t", columns, primary_key)])
+        return SQLTableDelta.from_cursor(cursor, "t", primary_key, counts["t"], max_rows)
+
+    def test_primary_key(self):
+        delta = self.delta(
+            "CREATE TABLE {schema}.t(name TEXT, id INTEGER PRIMARY KEY, score REAL)",
+            [(f"n{i}", i, i / 2) for i in range(1, 21)],
+            [
+                "UPDATE submission.t SET score = 0 WHERE id = 5",
+                "DELETE FROM submission.t WHERE id = 15",
+                "INSERT INTO submission.t VALUES ('new', 30, 1)",
+            ],
+        )
+        self.assertEqual((delta.missing_count, delta.unexpected_count, delta.changed_count), (1, 1, 1))
+        self.assertMultiLineEqual(
+            delta.expected.csv_out,
+            textwrap.dedent("""\
+                +/-,NAME,ID,SCORE
+                ,n4,4,2.0
+                ~ SCORE,n5,5,2.5
+                ,n6,6,3.0
+                ,n14,14,7.0
+                -,n15,15,7.5
+                ,n16,16,8.0
+                ,n20,20,10.0"""),
+        )
+        self.assertMultiLineEqual(
+            delta.generated.csv_out,
+            textwrap.dedent("""\
+                +/-,NAME,ID,SCORE
+                ,n4,4,2.0
+                ~ SCORE,n5,5,0.0
+                ,n6,6,3.0
+                ,n14,14,7.0
+                ,n16,16,8.0
+                ,n20,20,10.0
+                +,new,30,1.0"""),
+        )
+
+    def test_max_rows(self):
+        delta = self.delta(
+            "CREATE TABLE {schema}.t(id INTEGER PRIMARY KEY, name TEXT, score REAL)",
+            [(i, f"n{i}", i / 2) for i in range(1, 21)],
+            ["DELETE FROM submission.t WHERE score > 9", "UPDATE submission.t SET name = 'x' WHERE id = 1"],
+            max_rows=2,
+        )
+        # all differing rows are counted, but only the first 'max_rows' are shown, other differing
+        # rows can still be shown as context, with their status
+        self.assertEqual((delta.missing_count, delta.unexpected_count, delta.changed_count), (2, 0, 1))
+        self.assertMultiLineEqual(
+            delta.expected.csv_out,
+            textwrap.dedent("""\
+                +/-,ID,NAME,SCORE
+                ~ NAME,1,n1,0.5
+                ,2,n2,1.0
+                ,18,n18,9.0
+                -,19,n19,9.5
+                -,20,n20,10.0"""),
+        )
+        self.assertMultiLineEqual(
+            delta.generated.csv_out,
+            textwrap.dedent("""\
+                +/-,ID,NAME,SCORE
+                ~ NAME,1,x,0.5
+                ,2,n2,1.0
+                ,18,n18,9.0"""),
+        )